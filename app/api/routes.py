@@ -11,17 +11,20 @@ from fastapi import (
     BackgroundTasks,
     Request,
 )
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 import time
 import uuid
 from pydantic import BaseModel
 import hashlib
 import glob
 import asyncio
+import json
 
 from app.core.config import settings
+from app.core.metrics import JOBS_IN_FLIGHT
 # from app.core.logger import logger
 from app.models.document import (
+    DocumentItem,
     DocumentResponse,
     ExportResponse,
     PriceListResponse,
@@ -39,8 +42,10 @@ from app.services.ocr_service import ocr_service
 from app.services.chat_service import chat_service
 from app.services.export_service import export_service
 from app.services.xlsx_service import xlsx_service
-from app.services.price_list_service import price_list_service
+from app.services.price_list_service import price_list_service, normalization_cache
 from app.services.rules_service import rules_service
+from app.services.llms.response_cache import llm_response_cache
+from app.services.job_queue import job_queue, COMPLETED, FAILED, RUNNING
 from chromaWork import ChromaWork
 from loguru import logger   
 router = APIRouter()
@@ -56,27 +61,26 @@ class ChatMessageRequest(BaseModel):
 os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
 
 
-@router.post("/documents/upload", response_model=DocumentResponse)
-async def upload_document(
-    request: Request,
-    file: UploadFile = File(...),
-    file_type: str = Form(None),
-    background_tasks: BackgroundTasks = None,
-    progress_bar_id: str = Form(None),
-):
-    """Загрузка и обработка документа или изображения"""
+def _save_uploaded_file(file: UploadFile, file_type: str, client_host: str, unique: bool = False):
+    """
+    Проверка расширения и сохранение загруженного файла
 
-    start_time = time.time()
-    client_host = request.client.host
-    # progress_bar_id = str(uuid.uuid4())
-    logger.info(f"Загрузка документа {file.filename} {progress_bar_id}")
-    print(f"Загрузка документа {file.filename} {progress_bar_id}")
+    Args:
+        file: Загруженный файл
+        file_type: Тип файла из формы ("image" или None)
+        client_host: Адрес клиента для логов
+        unique: Сохранить под уникальным именем (с префиксом uuid), чтобы файл
+            задачи очереди не перезаписала одноименная загрузка
+
+    Returns:
+        tuple: (путь к сохраненному файлу, это изображение, это xlsx)
+    """
     # Проверка расширения файла
     file_ext = file.filename.split(".")[-1].lower()
 
     # Для документов поддерживаем только pdf и xlsx
     allowed_doc_extensions = ["pdf", "xlsx"]
-    allowed_img_extensions = ["jpg", "jpeg", "png", "gif", "bmp", "webp"]
+    allowed_img_extensions = ["jpg", "jpeg", "png", "gif", "bmp", "webp", "tiff", "tif"]
 
     # Определяем тип файла на основе расширения и переданного параметра
     is_image = file_type == "image" or file_ext in allowed_img_extensions
@@ -100,33 +104,159 @@ async def upload_document(
             detail=f"Неподдерживаемый формат документа. Разрешены: {', '.join(allowed_doc_extensions).upper()}",
         )
 
-    try:
-        # Сохраняем файл
-        file_path = os.path.join(settings.UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+    # Сохраняем файл
+    file_name = f"{uuid.uuid4().hex}_{os.path.basename(file.filename)}" if unique else file.filename
+    file_path = os.path.join(settings.UPLOAD_DIR, file_name)
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
 
-        logger.info(
-            f"Файл {file.filename} загружен от {client_host}, размер: {os.path.getsize(file_path)} байт, тип: {'изображение' if is_image else 'документ'}"
+    logger.info(
+        f"Файл {file.filename} загружен от {client_host}, размер: {os.path.getsize(file_path)} байт, тип: {'изображение' if is_image else 'документ'}"
+    )
+    return file_path, is_image, is_xlsx
+
+
+async def _process_uploaded_file(
+    file_path: str,
+    filename: str,
+    is_image: bool,
+    is_xlsx: bool,
+    progress_bar_id: str = None,
+    on_items=None,
+    owns_file: bool = False,
+) -> DocumentResponse:
+    """
+    Обработка сохраненного файла сервисом, соответствующим его типу
+
+    owns_file — файл принадлежит задаче: остаток PDF, обработанного частично,
+    удаляет ocr_service (после продолжения или по settings.OCR_PAGE_JOB_TTL).
+    """
+    if is_image:
+        # Обработка изображения
+        logger.info(f"Обработка изображения {filename} запущена")
+        with JOBS_IN_FLIGHT.in_progress(service="ocr"):
+            return await ocr_service.process_image(file_path, filename, progress_bar_id, on_items)
+    if is_xlsx:
+        # Обработка XLSX файла
+        logger.info(f"Обработка XLSX файла {filename} {progress_bar_id}")
+        with JOBS_IN_FLIGHT.in_progress(service="xlsx"):
+            return await xlsx_service.process_xlsx_file(
+                file_path, filename, progress_bar_id, on_items
+            )
+    # Обработка PDF документа
+    with JOBS_IN_FLIGHT.in_progress(service="ocr"):
+        return await ocr_service.process_document(
+            file_path, filename, progress_bar_id=progress_bar_id, on_items=on_items, owns_file=owns_file
         )
 
+
+async def run_upload_job(payload: dict) -> dict:
+    """Обработчик задачи очереди: обработка сохраненного файла, результат — DocumentResponse в JSON"""
+    result = await _process_uploaded_file(
+        payload["file_path"],
+        payload["filename"],
+        payload["is_image"],
+        payload["is_xlsx"],
+        payload.get("progress_bar_id"),
+        owns_file=True,
+    )
+    return result.model_dump(mode="json")
+
+
+def remove_upload_job_file(payload: dict, result: dict = None) -> None:
+    """
+    Удаление загруженного файла задачи очереди после ее выполнения или последней попытки
+
+    Файл документа, обработанного частично (status "partial"), остается: он
+    нужен для продолжения через /documents/{id}/continue, а удаляет его
+    ocr_service после продолжения или по settings.OCR_PAGE_JOB_TTL.
+    """
+    if result and result.get("status") == "partial":
+        return
+    try:
+        os.remove(payload["file_path"])
+    except FileNotFoundError:
+        pass
+
+
+def _job_document(job: dict) -> DocumentResponse:
+    """
+    Документ по задаче очереди
+
+    Для выполненной задачи — сохраненный результат; для остальных — пустой
+    документ с ID задачи и статусом queued, processing или failed.
+    """
+    if job["status"] == COMPLETED and job["result"]:
+        return DocumentResponse(**job["result"])
+    return DocumentResponse(
+        id=job["id"],
+        original_filename=job["payload"]["filename"],
+        items=[],
+        status="processing" if job["status"] == RUNNING else job["status"],
+        error=job["error"] if job["status"] == FAILED else None,
+        stats={"attempts": job["attempts"]},
+    )
+
+
+def _find_result(document_id: str):
+    """Результат обработки по ID документа или ID задачи очереди"""
+    # Проверяем сначала в ocr_service
+    result = ocr_service.get_result(document_id)
+
+    # Если не найдено в ocr_service, проверяем в xlsx_service
+    if not result and document_id.startswith("xlsx_"):
+        result = xlsx_service.get_result(document_id)
+
+    # Фоновые загрузки: результат хранится в очереди задач и переживает перезапуск
+    if not result and document_id.startswith("job_"):
+        job = job_queue.get(document_id)
+        if job:
+            result = _job_document(job)
+
+    return result
+
+
+@router.post("/documents/upload", response_model=DocumentResponse)
+async def upload_document(
+    request: Request,
+    file: UploadFile = File(...),
+    file_type: str = Form(None),
+    background_tasks: BackgroundTasks = None,
+    progress_bar_id: str = Form(None),
+    background: bool = Form(True),
+):
+    """
+    Загрузка и обработка документа или изображения
+
+    По умолчанию (background=true) файл ставится в очередь задач и сразу
+    возвращается документ со статусом queued; его ID — ID задачи, результат
+    доступен через GET /documents/{id}. С background=false файл
+    обрабатывается в рамках запроса и возвращается результат.
+    """
+
+    start_time = time.time()
+    client_host = request.client.host
+    # progress_bar_id = str(uuid.uuid4())
+    logger.info(f"Загрузка документа {file.filename} {progress_bar_id}")
+    print(f"Загрузка документа {file.filename} {progress_bar_id}")
+    file_path, is_image, is_xlsx = _save_uploaded_file(file, file_type, client_host, unique=background)
+
+    if background:
+        # Исходное имя файла хранится в задаче как filename
+        job_id = job_queue.enqueue({
+            "file_path": file_path,
+            "filename": file.filename,
+            "is_image": is_image,
+            "is_xlsx": is_xlsx,
+            "progress_bar_id": progress_bar_id,
+        })
+        return _job_document(job_queue.get(job_id))
+
+    try:
         # Обрабатываем документ или изображение
-        if is_image:
-            # Обработка изображения
-            result = await ocr_service.process_image(file_path, file.filename, progress_bar_id)
-            logger.info(f"Обработка изображения {file.filename} запущена")
-        elif is_xlsx:
-            # Обработка XLSX файла
-            logger.info(f"Обработка XLSX файла {file.filename} {progress_bar_id}")
-            result = await xlsx_service.process_xlsx_file(
-                file_path, file.filename, progress_bar_id
-            )
-            logger.info(f"Обработка XLSX файла {file.filename} запущена")
-        else:
-            # Обработка PDF документа
-            result = await ocr_service.process_document(
-                file_path, file.filename, progress_bar_id
-            )
+        result = await _process_uploaded_file(
+            file_path, file.filename, is_image, is_xlsx, progress_bar_id
+        )
 
         
         return result
@@ -138,16 +268,88 @@ async def upload_document(
         )
 
 
+# Задачи потоковой обработки: держим ссылки, чтобы задача не была собрана
+# сборщиком мусора, если клиент отключился раньше времени
+_stream_tasks = set()
+
+
+@router.post("/documents/upload/stream")
+async def upload_document_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    file_type: str = Form(None),
+    progress_bar_id: str = Form(None),
+):
+    """
+    Загрузка и обработка документа с потоковой выдачей результатов (NDJSON)
+
+    Каждая строка ответа — JSON-объект:
+    {"event": "items", "kind": "...", "items": [...]} — очередная порция
+    готовых товаров; kind — "extracted" (товары, извлеченные из PDF, в том же
+    виде, что и в итоговом документе) или "normalized" (товары изображений и
+    XLSX, уже сопоставленные с прайс-листом);
+    {"event": "result", "document": {...}} — итоговый DocumentResponse
+    (он же сохраняется и доступен через GET /documents/{id});
+    {"event": "error", "detail": "..."} — ошибка обработки.
+    """
+    client_host = request.client.host
+    logger.info(f"Потоковая загрузка документа {file.filename} {progress_bar_id}")
+    file_path, is_image, is_xlsx = _save_uploaded_file(file, file_type, client_host)
+
+    queue: asyncio.Queue = asyncio.Queue()
+    # PDF отдает товары сразу после извлечения, изображения и XLSX — после нормализации
+    items_kind = "normalized" if is_image or is_xlsx else "extracted"
+
+    async def on_items(items: List[dict]):
+        await queue.put({
+            "event": "items",
+            "kind": items_kind,
+            "items": [
+                DocumentItem(
+                    text=item if isinstance(item, str) else json.dumps(item, ensure_ascii=False)
+                ).model_dump()
+                for item in items
+            ],
+        })
+
+    async def process():
+        try:
+            result = await _process_uploaded_file(
+                file_path, file.filename, is_image, is_xlsx, progress_bar_id, on_items
+            )
+            await queue.put({"event": "result", "document": result.model_dump(mode="json")})
+        except Exception as e:
+            logger.error(f"Ошибка при потоковой обработке файла {file.filename}: {str(e)}")
+            await queue.put({"event": "error", "detail": f"Ошибка при обработке файла: {str(e)}"})
+
+    async def event_stream():
+        start_time = time.time()
+        task = asyncio.create_task(process())
+        _stream_tasks.add(task)
+        task.add_done_callback(_stream_tasks.discard)
+        first_items_logged = False
+        try:
+            while True:
+                event = await queue.get()
+                if event["event"] == "items" and not first_items_logged:
+                    first_items_logged = True
+                    logger.info(f"Первые товары {file.filename} отданы через {time.time() - start_time:.2f} сек.")
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+                if event["event"] in ("result", "error"):
+                    break
+        finally:
+            # Клиент отключился — обработка продолжается, результат будет сохранен
+            if not task.done():
+                logger.info(f"Клиент отключился от потока {file.filename}, обработка продолжается")
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+
 @router.get("/documents/{document_id}", response_model=DocumentResponse)
 async def get_document(document_id: str):
-    """Получение результатов обработки документа по ID"""
+    """Получение результатов обработки документа по ID (или по ID фоновой задачи)"""
 
-    # Проверяем сначала в ocr_service
-    result = ocr_service.get_result(document_id)
-
-    # Если не найдено в ocr_service, проверяем в xlsx_service
-    if not result and document_id.startswith("xlsx_"):
-        result = xlsx_service.get_result(document_id)
+    result = _find_result(document_id)
 
     if not result:
         logger.warning(
@@ -160,16 +362,34 @@ async def get_document(document_id: str):
     return result
 
 
+@router.post("/documents/{document_id}/continue", response_model=DocumentResponse)
+async def continue_document(document_id: str, progress_bar_id: str = Form(None)):
+    """Обработка следующей порции страниц документа со статусом partial"""
+    try:
+        with JOBS_IN_FLIGHT.in_progress(service="ocr"):
+            result = await ocr_service.continue_document(document_id, progress_bar_id)
+    except Exception as e:
+        logger.error(f"Ошибка при продолжении обработки документа {document_id}: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Ошибка при обработке файла: {str(e)}"
+        )
+
+    if not result:
+        logger.warning(
+            f"Попытка продолжить документ без необработанных страниц, ID {document_id}"
+        )
+        raise HTTPException(
+            status_code=404, detail=f"Для документа {document_id} нет необработанных страниц"
+        )
+
+    return result
+
+
 @router.post("/documents/{document_id}/export", response_model=ExportResponse)
 async def export_document(document_id: str):
     """Экспорт результатов обработки в XLSX"""
 
-    # Получаем результат обработки сначала из ocr_service
-    result = ocr_service.get_result(document_id)
-
-    # Если не найдено в ocr_service, проверяем в xlsx_service
-    if not result and document_id.startswith("xlsx_"):
-        result = xlsx_service.get_result(document_id)
+    result = _find_result(document_id)
 
     if not result:
         logger.warning(
@@ -229,9 +449,10 @@ async def process_chat_message(message: ChatMessageRequest):
         start_time = time.time()
         chat_service.update_progress_bar(message_id, "Обработка текстового сообщения", 0, 100)
         # Обрабатываем сообщение
-        result = await chat_service.process_chat_message(
-            message.text, message_id
-        )
+        with JOBS_IN_FLIGHT.in_progress(service="chat"):
+            result = await chat_service.process_chat_message(
+                message.text, message_id
+            )
 
         
         processing_time = time.time() - start_time
@@ -407,6 +628,24 @@ async def get_price_list_upload_status(upload_id: str):
         )
 
 
+@router.get("/normalization-cache/stats")
+async def get_normalization_cache_stats():
+    """Статистика кэша нормализованных наименований"""
+    return normalization_cache.stats()
+
+
+@router.get("/jobs/stats")
+async def get_job_queue_stats():
+    """Количество задач фоновой очереди по статусам"""
+    return job_queue.counts()
+
+
+@router.get("/llm-cache/stats")
+async def get_llm_cache_stats():
+    """Статистика кэша ответов LLM"""
+    return {"enabled": settings.LLM_RESPONSE_CACHE_ENABLED, **llm_response_cache.stats()}
+
+
 # Маршруты для работы с правилами
 @router.get("/rules/types", response_model=List[RuleTypeResponse])
 async def get_rule_types():
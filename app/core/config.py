@@ -28,6 +28,141 @@ class Settings(BaseSettings):
     
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+    # Сколько пачек товаров одновременно отправляется в LLM
+    LLM_BATCH_CONCURRENCY: int = int(os.getenv("LLM_BATCH_CONCURRENCY", 4))
+
+    # Общий лимит одновременных запросов к LLM на процесс: действует поверх
+    # LLM_BATCH_CONCURRENCY и OCR_PAGE_CONCURRENCY для всех документов и листов
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+
+    # Сколько листов книги XLSX обрабатывается одновременно
+    XLSX_SHEET_CONCURRENCY: int = int(os.getenv("XLSX_SHEET_CONCURRENCY", 4))
+
+    # Сколько страниц документа одновременно отправляется в LLM при извлечении товаров
+    OCR_PAGE_CONCURRENCY: int = int(os.getenv("OCR_PAGE_CONCURRENCY", 4))
+
+    # Постраничная обработка PDF: OCR идет окнами по OCR_PAGE_WINDOW страниц,
+    # за одну задачу обрабатывается не больше OCR_PAGE_BUDGET страниц,
+    # остаток — через POST /documents/{id}/continue
+    OCR_PAGE_WINDOW: int = int(os.getenv("OCR_PAGE_WINDOW", 10))
+    OCR_PAGE_BUDGET: int = int(os.getenv("OCR_PAGE_BUDGET", 40))
+    # Необработанный остаток документа ждет продолжения не дольше OCR_PAGE_JOB_TTL
+    # секунд с последнего обращения, затем его состояние и файл загрузки удаляются
+    OCR_PAGE_JOB_TTL: int = int(os.getenv("OCR_PAGE_JOB_TTL", 86400))
+
+    # Текстовый слой PDF: страницы, где есть хотя бы PDF_TEXT_MIN_CHARS букв и цифр,
+    # читаются локально через PyMuPDF без Mistral OCR
+    PDF_TEXT_LAYER_ENABLED: bool = os.getenv(
+        "PDF_TEXT_LAYER_ENABLED", "true"
+    ).lower() in ("1", "true", "yes")
+    PDF_TEXT_MIN_CHARS: int = int(os.getenv("PDF_TEXT_MIN_CHARS", 40))
+
+    # Страницы для извлечения товаров сжимаются и упаковываются в запросы
+    # по бюджету токенов модели (страница целиком или часть большой таблицы)
+    OCR_PAGE_PACKING_ENABLED: bool = os.getenv(
+        "OCR_PAGE_PACKING_ENABLED", "true"
+    ).lower() in ("1", "true", "yes")
+
+    # Отбор страниц перед извлечением товаров: пропускаются пустые (меньше
+    # PAGE_FILTER_MIN_CHARS букв и цифр), повторы и страницы без признаков товаров
+    PAGE_FILTER_ENABLED: bool = os.getenv(
+        "PAGE_FILTER_ENABLED", "true"
+    ).lower() in ("1", "true", "yes")
+    PAGE_FILTER_MIN_CHARS: int = int(os.getenv("PAGE_FILTER_MIN_CHARS", 20))
+    PAGE_FILTER_SIMHASH_DISTANCE: int = int(os.getenv("PAGE_FILTER_SIMHASH_DISTANCE", 3))
+
+    # Распознавание столбцов заявки XLSX по заголовку: строки с наименованием и
+    # числовым количеством берутся напрямую, без LLM. Заголовок ищется среди
+    # первых XLSX_HEADER_SCAN_ROWS непустых строк листа
+    XLSX_COLUMN_MAPPING_ENABLED: bool = os.getenv(
+        "XLSX_COLUMN_MAPPING_ENABLED", "true"
+    ).lower() in ("1", "true", "yes")
+    XLSX_HEADER_SCAN_ROWS: int = int(os.getenv("XLSX_HEADER_SCAN_ROWS", 10))
+
+    # Подготовка изображений перед распознаванием: поворот по EXIF, уменьшение
+    # до IMAGE_MAX_SIDE по большей стороне, оттенки серого, JPEG с качеством IMAGE_JPEG_QUALITY
+    IMAGE_PREPROCESSING_ENABLED: bool = os.getenv(
+        "IMAGE_PREPROCESSING_ENABLED", "true"
+    ).lower() in ("1", "true", "yes")
+    IMAGE_MAX_SIDE: int = int(os.getenv("IMAGE_MAX_SIDE", 2048))
+    IMAGE_GRAYSCALE: bool = os.getenv("IMAGE_GRAYSCALE", "true").lower() in ("1", "true", "yes")
+    IMAGE_JPEG_QUALITY: int = int(os.getenv("IMAGE_JPEG_QUALITY", 85))
+    # Страницы больше IMAGE_TILING_THRESHOLD пикселей по большей стороне (0 — не резать)
+    # распознаются перекрывающимися горизонтальными полосами высотой IMAGE_TILE_SIZE с перекрытием IMAGE_TILE_OVERLAP
+    IMAGE_TILING_THRESHOLD: int = int(os.getenv("IMAGE_TILING_THRESHOLD", 5000))
+    IMAGE_TILE_SIZE: int = int(os.getenv("IMAGE_TILE_SIZE", 2048))
+    IMAGE_TILE_OVERLAP: int = int(os.getenv("IMAGE_TILE_OVERLAP", 256))
+
+    # Кэш распознанных страниц и загруженных в Mistral файлов
+    OCR_PAGE_CACHE_MAX_ENTRIES: int = int(os.getenv("OCR_PAGE_CACHE_MAX_ENTRIES", 20000))
+    MISTRAL_SIGNED_URL_EXPIRY_HOURS: int = int(os.getenv("MISTRAL_SIGNED_URL_EXPIRY_HOURS", 24))
+    MISTRAL_FILE_TTL: int = int(
+        os.getenv("MISTRAL_FILE_TTL", 7 * 24 * 3600)
+    )  # сколько считать file_id действительным, 7 дней по умолчанию
+
+    # Пулы для синхронной работы: процессы для CPU-нагрузки (pandas, openpyxl,
+    # постобработка newcode; 0 — по числу ядер), потоки для блокирующего ввода-вывода
+    CPU_EXECUTOR_ENABLED: bool = os.getenv(
+        "CPU_EXECUTOR_ENABLED", "true"
+    ).lower() in ("1", "true", "yes")
+    CPU_EXECUTOR_WORKERS: int = int(os.getenv("CPU_EXECUTOR_WORKERS", 0))
+    IO_EXECUTOR_WORKERS: int = int(os.getenv("IO_EXECUTOR_WORKERS", 8))
+
+    # Очередь фоновых задач (загрузка с background=true): JOB_WORKERS воркеров,
+    # до JOB_MAX_ATTEMPTS попыток с задержкой от JOB_RETRY_BASE_DELAY до JOB_RETRY_MAX_DELAY секунд
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", 2))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+    JOB_RETRY_BASE_DELAY: float = float(os.getenv("JOB_RETRY_BASE_DELAY", 30.0))
+    JOB_RETRY_MAX_DELAY: float = float(os.getenv("JOB_RETRY_MAX_DELAY", 600.0))
+    JOB_POLL_INTERVAL: float = float(os.getenv("JOB_POLL_INTERVAL", 2.0))
+    JOB_RETENTION_DAYS: int = int(os.getenv("JOB_RETENTION_DAYS", 7))
+    # Аренда выполняемой задачи; задача, аренду которой не продлили
+    # JOB_LEASE_SECONDS секунд (процесс остановлен или упал), возвращается в очередь
+    JOB_LEASE_SECONDS: float = float(os.getenv("JOB_LEASE_SECONDS", 120.0))
+
+    # Повторы запросов к LLM при ошибках транспорта: экспоненциальная
+    # задержка от LLM_RETRY_BASE_DELAY, не больше LLM_RETRY_MAX_DELAY секунд.
+    # Единственный уровень повторов (call_with_retry; SDK и limit_concurrency
+    # не повторяют): запрос отправляется не больше LLM_MAX_RETRIES + 1 = 4 раз,
+    # место под LLM_MAX_CONCURRENCY на время паузы освобождается
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", 3))
+    LLM_RETRY_BASE_DELAY: float = float(os.getenv("LLM_RETRY_BASE_DELAY", 1.0))
+    LLM_RETRY_MAX_DELAY: float = float(os.getenv("LLM_RETRY_MAX_DELAY", 10.0))
+
+    # Бюджеты токенов на один запрос к LLM по моделям:
+    # input — переменная часть запроса (строки пачки), output — ответ модели
+    LLM_TOKEN_BUDGETS: dict = {
+        "gpt-4o-mini": {"input": 8000, "output": 16000},
+        "gpt-4.1-nano": {"input": 8000, "output": 32000},
+        "gpt-4.1-nano-2025-04-14": {"input": 8000, "output": 32000},
+        "mistral-small-latest": {"input": 8000, "output": 8000},
+        "mistral-large-latest": {"input": 8000, "output": 8000},
+    }
+    LLM_DEFAULT_TOKEN_BUDGET: dict = {"input": 6000, "output": 2000}
+    # Верхняя граница строк в одной пачке, даже если бюджет позволяет больше
+    LLM_MAX_BATCH_ITEMS: int = int(os.getenv("LLM_MAX_BATCH_ITEMS", 60))
+
+    # Настройки дисковых кэшей
+    CACHE_DIR: str = os.getenv("CACHE_DIR", "cache")
+    NORMALIZATION_CACHE_MAX_ENTRIES: int = int(
+        os.getenv("NORMALIZATION_CACHE_MAX_ENTRIES", 50000)
+    )
+    # Кэш ответов LLM (включается явно). В детерминированном режиме
+    # температура запросов принудительно 0, чтобы ответы были воспроизводимы
+    LLM_RESPONSE_CACHE_ENABLED: bool = os.getenv(
+        "LLM_RESPONSE_CACHE_ENABLED", "false"
+    ).lower() in ("1", "true", "yes")
+    LLM_RESPONSE_CACHE_DETERMINISTIC: bool = os.getenv(
+        "LLM_RESPONSE_CACHE_DETERMINISTIC", "true"
+    ).lower() in ("1", "true", "yes")
+    LLM_RESPONSE_CACHE_TTL: int = int(
+        os.getenv("LLM_RESPONSE_CACHE_TTL", 7 * 24 * 3600)
+    )  # 7 дней по умолчанию
+    LLM_RESPONSE_CACHE_MAX_ENTRIES: int = int(
+        os.getenv("LLM_RESPONSE_CACHE_MAX_ENTRIES", 20000)
+    )
+
     # Настройки загрузки файлов
     UPLOAD_DIR: str = (
         "/Users/igorgerasimov/cursorWorkspace/punlick-python/uploads"
@@ -44,6 +179,7 @@ class Settings(BaseSettings):
         "bmp",
         "webp",
         "tiff",
+        "tif",
         "svg",
     }  # Расширенный список форматов изображений
 
@@ -66,6 +202,7 @@ class Settings(BaseSettings):
 os.makedirs(Settings().UPLOAD_DIR, exist_ok=True)
 os.makedirs(Settings().EXPORT_DIR, exist_ok=True)
 os.makedirs(Settings().CHROMA_DB_DIR, exist_ok=True)
+os.makedirs(Settings().CACHE_DIR, exist_ok=True)
 
 # Экземпляр настроек
 settings = Settings()
@@ -0,0 +1,143 @@
+"""Пулы для синхронной работы, которую нельзя выполнять в цикле событий"""
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from loguru import logger
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+EXECUTOR_TASK_DURATION = metrics.histogram(
+    "executor_task_duration_seconds", "Время задачи в пуле с учетом ожидания в очереди", ("pool", "status")
+)
+
+
+class ExecutorPools:
+    """
+    Пул процессов для CPU-нагрузки (pandas, openpyxl, постобработка newcode)
+    и пул потоков для блокирующего ввода-вывода
+
+    Пулы создаются при первом использовании. Процессы запускаются методом
+    spawn: дочерний процесс не наследует потоки и соединения родителя, поэтому
+    функции для run_cpu должны быть функциями уровня модуля с легкими
+    импортами, а аргументы и результат — сериализуемыми pickle.
+    """
+
+    def __init__(self):
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        # Задачи, отправленные в пул и еще не завершенные
+        self._in_flight: Dict[str, int] = {"process": 0, "thread": 0}
+
+    @property
+    def process_workers(self) -> int:
+        return max(1, settings.CPU_EXECUTOR_WORKERS or (os.cpu_count() or 1))
+
+    @property
+    def thread_workers(self) -> int:
+        return max(1, settings.IO_EXECUTOR_WORKERS)
+
+    def _get_pool(self, kind: str) -> Executor:
+        with self._lock:
+            if kind == "process":
+                if self._process_pool is None:
+                    self._process_pool = ProcessPoolExecutor(
+                        max_workers=self.process_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                return self._process_pool
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(
+                    max_workers=self.thread_workers, thread_name_prefix="io"
+                )
+            return self._thread_pool
+
+    def _reset_process_pool(self, pool: Executor) -> None:
+        """Сброс сломанного пула процессов (упал дочерний процесс); следующий вызов создаст новый"""
+        with self._lock:
+            if self._process_pool is pool:
+                self._process_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, kind: str, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        pool = self._get_pool(kind)
+        call = functools.partial(func, *args, **kwargs)
+        start = time.perf_counter()
+        status = "error"
+        self._in_flight[kind] += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(pool, call)
+            status = "ok"
+            return result
+        except BrokenProcessPool:
+            logger.error("Пул процессов сломан (дочерний процесс завершился аварийно), пул будет пересоздан")
+            self._reset_process_pool(pool)
+            raise
+        finally:
+            self._in_flight[kind] -= 1
+            EXECUTOR_TASK_DURATION.observe(time.perf_counter() - start, pool=kind, status=status)
+
+    async def run_cpu(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Выполнение CPU-нагруженной функции в пуле процессов
+
+        Args:
+            func: Функция уровня модуля (сериализуемая pickle)
+            args, kwargs: Сериализуемые аргументы
+
+        Returns:
+            Any: Результат функции
+        """
+        if not settings.CPU_EXECUTOR_ENABLED:
+            return await self.run_io(func, *args, **kwargs)
+        return await self._run("process", func, *args, **kwargs)
+
+    async def run_io(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Выполнение блокирующей функции в пуле потоков
+
+        Args:
+            func: Функция
+            args, kwargs: Аргументы
+
+        Returns:
+            Any: Результат функции
+        """
+        return await self._run("thread", func, *args, **kwargs)
+
+    def queue_depth(self) -> Dict[tuple, float]:
+        """Задачи, ожидающие свободного исполнителя, по пулам (для gauge)"""
+        workers = {"process": self.process_workers, "thread": self.thread_workers}
+        return {(kind,): max(0, count - workers[kind]) for kind, count in self._in_flight.items()}
+
+    def in_flight(self) -> Dict[tuple, float]:
+        """Задачи в работе и в очереди по пулам (для gauge)"""
+        return {(kind,): count for kind, count in self._in_flight.items()}
+
+    def shutdown(self) -> None:
+        """Остановка пулов"""
+        with self._lock:
+            pools = [self._process_pool, self._thread_pool]
+            self._process_pool = self._thread_pool = None
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Экземпляр пулов
+executors = ExecutorPools()
+
+metrics.gauge_callback(
+    "executor_queue_depth", "Задачи, ожидающие свободного исполнителя пула", ("pool",), executors.queue_depth
+)
+metrics.gauge_callback(
+    "executor_tasks_in_flight", "Задачи пула в работе и в очереди", ("pool",), executors.in_flight
+)
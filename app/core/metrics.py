@@ -0,0 +1,281 @@
+"""Метрики приложения в текстовом формате Prometheus"""
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Границы корзин гистограмм задержек в секундах: от быстрых локальных
+# операций до многоминутных запросов OCR
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    """Экранирование значения метки по правилам текстового формата Prometheus"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    """Строка меток вида {a="1",b="2"}"""
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Общая часть метрик: имя, описание и имена меток"""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, value: float = 1, **labels: str) -> None:
+        """Увеличивает счетчик для набора меток"""
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Гистограмма с накопительными корзинами, суммой и количеством наблюдений"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Добавляет наблюдение"""
+        key = self._label_values(labels)
+        with self._lock:
+            # counts по корзинам, затем sum и count
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str):
+        """
+        Контекстный менеджер, измеряющий длительность блока (в том числе с await внутри)
+
+        Если у гистограммы есть метка status и она не передана, она
+        заполняется автоматически: ok или error (блок завершился исключением).
+        """
+        start = time.perf_counter()
+        fill_status = "status" in self.labelnames and "status" not in labels
+        status = "error"
+        try:
+            yield
+            status = "ok"
+        finally:
+            if fill_status:
+                labels["status"] = status
+            self.observe(time.perf_counter() - start, **labels)
+
+    def timed(self, func: Callable) -> Callable:
+        """Декоратор асинхронной функции, измеряющий ее длительность через time()"""
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with self.time():
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        lines = self._header()
+        for key, state in sorted(values.items()):
+            for bound, count in zip(self.buckets, state):
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Значение, которое увеличивается и уменьшается кодом (например, задачи в работе)"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, value: float = 1, **labels: str) -> None:
+        """Увеличивает значение для набора меток"""
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def dec(self, value: float = 1, **labels: str) -> None:
+        """Уменьшает значение для набора меток"""
+        self.inc(-value, **labels)
+
+    @contextmanager
+    def in_progress(self, **labels: str):
+        """Контекстный менеджер: +1 на время блока, -1 при выходе, в том числе по исключению"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class CallbackGauge(_Metric):
+    """Мгновенное значение, вычисляемое функцией в момент запроса /metrics"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str], callback: Callable[[], Dict[LabelValues, float]]):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self.callback().items())
+        ]
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        """Создает (или возвращает уже зарегистрированный) счетчик"""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Optional[Iterable[float]] = None) -> Histogram:
+        """Создает (или возвращает уже зарегистрированную) гистограмму"""
+        return self._register(Histogram(name, documentation, labelnames, buckets or DEFAULT_BUCKETS))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        """Создает (или возвращает уже зарегистрированный) gauge с inc/dec"""
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def gauge_callback(self, name: str, documentation: str, labelnames: Iterable[str], callback: Callable[[], Dict[LabelValues, float]]) -> CallbackGauge:
+        """Регистрирует gauge, значение которого вычисляет callback"""
+        return self._register(CallbackGauge(name, documentation, labelnames, callback))
+
+    def render(self) -> str:
+        """
+        Все метрики в текстовом формате Prometheus
+
+        Returns:
+            str: Текст для ответа /metrics
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Экземпляр реестра
+metrics = MetricsRegistry()
+
+# Метрики конвейера обработки
+LLM_REQUESTS = metrics.counter(
+    "llm_requests_total", "Запросы к LLM", ("provider", "model", "method", "status")
+)
+LLM_REQUEST_DURATION = metrics.histogram(
+    "llm_request_duration_seconds", "Длительность запросов к LLM", ("provider", "model", "method")
+)
+LLM_QUEUE_WAIT = metrics.histogram(
+    "llm_queue_wait_seconds", "Ожидание места под общим лимитом запросов к LLM"
+)
+LLM_TOKENS = metrics.counter(
+    "llm_tokens_total", "Токены LLM (total — все, cached — из кэша префиксов)", ("provider", "model", "method", "kind")
+)
+OCR_REQUEST_DURATION = metrics.histogram(
+    "ocr_request_duration_seconds", "Длительность запросов Mistral OCR", ("status",)
+)
+OCR_PAGES = metrics.counter("ocr_pages_total", "Страницы, распознанные Mistral OCR")
+JOBS_IN_FLIGHT = metrics.gauge(
+    "jobs_in_flight", "Задачи обработки документов и сообщений в работе", ("service",)
+)
+CHROMA_OPERATION_DURATION = metrics.histogram(
+    "chroma_operation_duration_seconds", "Длительность операций ChromaDB", ("operation",)
+)
+POSTPROCESS_DURATION = metrics.histogram(
+    "postprocess_duration_seconds", "Длительность newcode.process_row_from_list"
+)
+POSTPROCESS_RECORDS = metrics.counter(
+    "postprocess_records_total", "Записи, переданные в newcode.process_row_from_list", ("status",)
+)
+EXPORT_DURATION = metrics.histogram(
+    "export_duration_seconds", "Длительность экспорта в XLSX", ("status",)
+)
@@ -3,11 +3,14 @@ from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 from dotenv import load_dotenv
 
-from app.api.routes import router as api_router
+from app.api.routes import router as api_router, remove_upload_job_file, run_upload_job
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.executors import executors
+from app.services.job_queue import job_queue
 from loguru import logger
 
 # Настройка логирования
@@ -54,6 +57,19 @@ templates = Jinja2Templates(directory="app/templates")
 app.include_router(api_router, prefix="/api")
 
 
+@app.on_event("startup")
+async def start_job_workers():
+    """Запуск воркеров очереди фоновых задач"""
+    job_queue.start(run_upload_job, remove_upload_job_file)
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    """Остановка воркеров; прерванные задачи вернутся в очередь при следующем запуске"""
+    await job_queue.stop()
+    executors.shutdown()
+
+
 @app.get("/")
 async def index(request: Request):
     """Главная страница приложения"""
@@ -76,6 +92,20 @@ async def logging_middleware(request: Request, call_next):
     return response
 
 
+metrics.gauge_callback(
+    "job_queue_jobs",
+    "Задачи фоновой очереди по статусам",
+    ("status",),
+    lambda: {(status,): count for status, count in job_queue.counts().items()},
+)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/uploads/{filename}")
 async def serve_file(filename: str):
     """Прямая отдача файлов"""
@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import List, Optional, Dict
+from typing import Any, List, Optional, Dict
 from pydantic import BaseModel
 
 
@@ -17,6 +17,7 @@ class DocumentItem(BaseModel):
     """Модель для элемента документа (страницы)"""
 
     text: str
+    sheet: Optional[str] = None  # Лист книги XLSX, с которого взят товар
 
 
 class DocumentUpload(BaseModel):
@@ -35,6 +36,7 @@ class DocumentResponse(BaseModel):
     items: List[DocumentItem]
     status: str = "completed"
     error: Optional[str] = None
+    stats: Optional[Dict[str, Any]] = None  # Статистика обработки (локальный разбор, кэши, токены)
 
 
 class ExportRequest(BaseModel):
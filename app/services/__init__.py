@@ -1,17 +1,36 @@
 """
 Пакет сервисов приложения
 Содержит сервисы для работы с различными компонентами приложения
+
+Сервисы импортируются при первом обращении к атрибуту пакета: процессы пула
+(executors.run_cpu) импортируют только модуль вызываемой функции
+(например, excel_readers), без клиентов LLM и rules_service.
 """
+import importlib
+
+# Атрибут пакета: (модуль, имя в модуле)
+_EXPORTS = {
+    # Модуль для работы с LLM сервисами
+    "LLMWork": ("app.services.llms.llm_work", "LLMWork"),
+    "OpenAIWork": ("app.services.llms.openai_work", "OpenAIWork"),
+    "MistralWork": ("app.services.llms.mistral_work", "MistralWork"),
+    "LLMFactory": ("app.services.llms.llm_factory", "LLMFactory"),
+    # Сервисы для обработки бизнес-логики
+    "rules_service": ("app.services.rules_service", "rules_service"),
+}
 
-# Модуль для работы с LLM сервисами
-from app.services.llms.llm_work import LLMWork
-from app.services.llms.openai_work import OpenAIWork
-from app.services.llms.mistral_work import MistralWork
-from app.services.llms.llm_factory import LLMFactory
+__all__ = list(_EXPORTS) + ["get_llm", "get_default_llm"]
 
-# Предоставляем удобный доступ к фабрике
-get_llm = LLMFactory.get_instance
-get_default_llm = LLMFactory.get_default_instance
 
-# Сервисы для обработки бизнес-логики
-from app.services.rules_service import rules_service
+def __getattr__(name: str):
+    # Предоставляем удобный доступ к фабрике
+    if name in ("get_llm", "get_default_llm"):
+        factory = __getattr__("LLMFactory")
+        value = factory.get_instance if name == "get_llm" else factory.get_default_instance
+    elif name in _EXPORTS:
+        module, attribute = _EXPORTS[name]
+        value = getattr(importlib.import_module(module), attribute)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
@@ -0,0 +1,92 @@
+"""Разбиение строк на пачки для LLM с учетом бюджета токенов"""
+import math
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+# Средняя длина токена в символах для русского текста спецификаций.
+# Берем с запасом (занижаем), чтобы оценка токенов была скорее завышенной.
+CHARS_PER_TOKEN = 2.5
+
+# Доля бюджета ответа, которую разрешено занять: оставляем запас на погрешность оценки
+OUTPUT_BUDGET_RESERVE = 0.8
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Грубая оценка количества токенов в тексте без токенизатора
+
+    Args:
+        text: Текст
+
+    Returns:
+        int: Оценка количества токенов (не меньше 1)
+    """
+    return max(1, math.ceil(len(str(text)) / CHARS_PER_TOKEN))
+
+
+def get_token_budget(model: Optional[str] = None) -> Dict[str, int]:
+    """
+    Бюджет токенов на один запрос для модели
+
+    Args:
+        model: Имя модели; если для нее нет настройки, берется бюджет по умолчанию
+
+    Returns:
+        Dict: {"input": токенов на переменную часть запроса, "output": токенов на ответ}
+    """
+    budget = dict(settings.LLM_DEFAULT_TOKEN_BUDGET)
+    if model and model in settings.LLM_TOKEN_BUDGETS:
+        budget.update(settings.LLM_TOKEN_BUDGETS[model])
+    return budget
+
+
+def pack_batches(
+    items: Iterable[T],
+    input_tokens: Callable[[T], int],
+    output_tokens: Callable[[T], int],
+    budget: Dict[str, int],
+    max_items: Optional[int] = None,
+) -> Iterator[List[T]]:
+    """
+    Жадно собирает элементы в пачки, не превышая бюджет входа и ответа
+
+    Порядок элементов сохраняется. Элемент, который сам по себе не влезает
+    в бюджет, уходит отдельной пачкой. Работает с любым итерируемым
+    источником, в том числе с генератором строк.
+
+    Args:
+        items: Элементы в исходном порядке
+        input_tokens: Оценка токенов элемента во входе
+        output_tokens: Оценка токенов ответа на элемент
+        budget: Бюджет из get_token_budget
+        max_items: Максимум элементов в пачке (по умолчанию settings.LLM_MAX_BATCH_ITEMS)
+
+    Yields:
+        List: Очередная пачка элементов
+    """
+    max_input = budget["input"]
+    max_output = int(budget["output"] * OUTPUT_BUDGET_RESERVE)
+    max_items = max_items or settings.LLM_MAX_BATCH_ITEMS
+
+    batch: List[T] = []
+    batch_input = 0
+    batch_output = 0
+    for item in items:
+        item_input = input_tokens(item)
+        item_output = output_tokens(item)
+        if batch and (
+            batch_input + item_input > max_input
+            or batch_output + item_output > max_output
+            or len(batch) >= max_items
+        ):
+            yield batch
+            batch, batch_input, batch_output = [], 0, 0
+        batch.append(item)
+        batch_input += item_input
+        batch_output += item_output
+
+    if batch:
+        yield batch
@@ -1,5 +1,4 @@
 import json
-import re
 from typing import Optional
 from loguru import logger
 from mistralai import Mistral
@@ -8,6 +7,9 @@ from app.core.config import settings
 from app.models.document import DocumentResponse, DocumentItem
 from app.services.price_list_service import PriceListService
 from app.services.llms.llm_factory import LLMFactory
+from app.services.llms.retry import LLMRequestError, call_with_retry
+from app.services.llms.schemas import EXTRACTED_ITEMS_SCHEMA, response_items
+from app.services.table_serializer import TABLE_FORMAT_NOTE, compact_text
 
 openai_llm = LLMFactory.get_instance("openai")
 llm = openai_llm
@@ -41,37 +43,6 @@ class ChatService:
     def get_progress_bar(self, progress_bar_id: str) -> dict:
         return self.progress_bars.get(progress_bar_id, None)
     
-    def prepare_text_anserw_to_dict(self, text: str) -> list:
-        """
-        Извлекает список товаров из текста, содержащего JSON-блок
-
-        Args:
-            text: Исходный текст с JSON-блоком
-
-        Returns:
-            list: Список словарей с товарами или None при ошибке
-        """
-        try:
-            # Ищем JSON-блок между ```json и ```
-            json_match = re.search(r"```json\s*(.*?)\s*```", text, re.DOTALL)
-
-            if not json_match:
-                text=text.replace("'",'"')
-                data=json.loads(text)
-                return data
-
-            json_str = json_match.group(1)
-            data = json.loads(json_str)
-
-            if not isinstance(data, list):
-                raise TypeError("JSON не содержит список")
-
-            return data
-
-        except (json.JSONDecodeError, TypeError, ValueError) as e:
-            logger.warning(f"Ошибка извлечения списка: {str(e)}")
-            return None
-
     async def process_chat_message(
         self, message_text: str, message_id: str, 
     ) -> DocumentResponse:
@@ -81,6 +52,11 @@ class ChatService:
         self.update_progress_bar(message_id, "Распознование позиций из текстового сообщения", 0, 100)
         try:
             logger.debug(f"Обработка текстового сообщения: {message_text}")
+            # Таблицы, вставленные в сообщение, записываются компактно: без
+            # выравнивания пробелами и пустых столбцов, с номерами строк
+            compact_message, tables = compact_text(message_text)
+            if tables:
+                logger.debug(f"Таблиц в сообщении: {tables}, символов {len(message_text)} -> {len(compact_message)}")
 
             messages = [
                 {
@@ -90,7 +66,8 @@ class ChatService:
                             "type": "text",
                             "text": """найди все товары и верни их в виде списка в формате json "Наименование","Количество","Ед.изм." """,
                         },
-                        {"type": "text", "text": message_text},
+                        *([{"type": "text", "text": TABLE_FORMAT_NOTE}] if tables else []),
+                        {"type": "text", "text": compact_message},
                     ],
                 }
             ]
@@ -102,10 +79,16 @@ class ChatService:
             
             # Получаем содержимое ответа
             # text = chat_response.choices[0].message.content
-            response = await llm.chat_completion(messages=messages)
-            text = response['text']
-            logger.debug(f"Полученный ответ от API: {text}")
-            text = self.prepare_text_anserw_to_dict(text)
+            try:
+                response = await call_with_retry(
+                    lambda: llm.chat_completion(messages=messages, response_schema=EXTRACTED_ITEMS_SCHEMA),
+                    "Извлечение товаров из сообщения",
+                )
+            except LLMRequestError as e:
+                logger.error(str(e))
+                response = {"text": "", "error": str(e)}
+            logger.debug(f"Полученный ответ от API: {response['text']}")
+            text = response_items(response) or []
             self.update_progress_bar(message_id, "Переименование позиций", 20, 100)
             price_list_service = PriceListService()
             products = await price_list_service.find_matching_items(text, self.progress_bars, message_id)
@@ -121,6 +104,7 @@ class ChatService:
                     )
                     for item in products
                 ],
+                stats=self.progress_bars.get(message_id, {}).get("stats"),
             )
 
             # Сохранение результата
@@ -0,0 +1,221 @@
+"""Персистентный кэш ключ-значение на SQLite с LRU-вытеснением"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+from app.core.executors import executors
+
+
+def file_digest(path: str) -> str:
+    """
+    sha256 содержимого файла (читается по 1 МБ)
+
+    Args:
+        path: Путь к файлу
+
+    Returns:
+        str: Хэш содержимого
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DiskLRUCache:
+    """
+    Кэш ключ-значение, хранящийся в файле SQLite
+
+    Значения сериализуются в JSON. При превышении max_entries удаляются
+    записи, к которым дольше всего не обращались; если задан ttl, записи
+    старше ttl секунд считаются промахом и удаляются при чтении. Счетчики
+    попаданий и промахов считаются с момента создания экземпляра.
+
+    Число записей ведется в памяти, а не считается запросом на каждую запись;
+    вытеснение удаляет сразу EVICTION_SLACK записей сверх лимита, чтобы
+    следующие вставки не вытесняли по одной. Методы блокирующие: из
+    асинхронного кода используются aget/aset, выполняющие их в пуле потоков.
+    """
+
+    # Доля max_entries, освобождаемая при вытеснении сверх лимита
+    EVICTION_SLACK = 0.05
+
+    def __init__(self, path: str, max_entries: int = 100000, name: str = "cache", ttl: Optional[float] = None):
+        """
+        Открывает (или создает) файл кэша
+
+        Args:
+            path: Путь к файлу SQLite
+            max_entries: Максимальное количество записей в кэше
+            name: Имя кэша для логов
+            ttl: Время жизни записи в секундах (None — без ограничения)
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.name = name
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.logger = logger.bind(context=f"disk_cache_{name}")
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, accessed_at REAL NOT NULL, "
+                "created_at REAL NOT NULL DEFAULT 0)"
+            )
+            # Файлы, созданные до появления ttl, дополняем колонкой created_at
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(entries)")]
+            if "created_at" not in columns:
+                self._conn.execute(
+                    "ALTER TABLE entries ADD COLUMN created_at REAL NOT NULL DEFAULT 0"
+                )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)"
+            )
+            self._count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """
+        Формирует ключ кэша как sha256 от переданных частей
+
+        Args:
+            parts: Части ключа (приводятся к строке)
+
+        Returns:
+            str: Хэш-ключ
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(str(part).encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Получение значения из кэша с обновлением времени доступа
+
+        Args:
+            key: Ключ кэша
+
+        Returns:
+            Any: Значение или None, если записи нет
+        """
+        try:
+            with self._lock, self._conn:
+                row = self._conn.execute(
+                    "SELECT value, created_at FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                now = time.time()
+                if self.ttl is not None and row[1] + self.ttl < now:
+                    self._count -= self._conn.execute("DELETE FROM entries WHERE key = ?", (key,)).rowcount
+                    self.misses += 1
+                    return None
+                self._conn.execute(
+                    "UPDATE entries SET accessed_at = ? WHERE key = ?",
+                    (now, key),
+                )
+            self.hits += 1
+            return json.loads(row[0])
+        except Exception as e:
+            self.logger.warning(f"Ошибка чтения из кэша {self.name}: {str(e)}")
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Сохранение значения в кэш
+
+        Args:
+            key: Ключ кэша
+            value: JSON-сериализуемое значение
+        """
+        try:
+            payload = json.dumps(value, ensure_ascii=False)
+            with self._lock, self._conn:
+                now = time.time()
+                updated = self._conn.execute(
+                    "UPDATE entries SET value = ?, accessed_at = ?, created_at = ? WHERE key = ?",
+                    (payload, now, now, key),
+                ).rowcount
+                if not updated:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO entries (key, value, accessed_at, created_at) VALUES (?, ?, ?, ?)",
+                        (key, payload, now, now),
+                    )
+                    self._count += 1
+                    if self._count > self.max_entries:
+                        self._evict()
+        except Exception as e:
+            self.logger.warning(f"Ошибка записи в кэш {self.name}: {str(e)}")
+
+    def delete(self, key: str) -> None:
+        """Удаление записи из кэша"""
+        with self._lock, self._conn:
+            self._count -= self._conn.execute("DELETE FROM entries WHERE key = ?", (key,)).rowcount
+
+    def clear(self) -> None:
+        """Полная очистка кэша"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries")
+            self._count = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _evict(self) -> None:
+        """Удаляет самые давно использованные записи сверх max_entries с запасом EVICTION_SLACK"""
+        # Счетчик сверяется с файлом: в него могли писать другие процессы
+        self._count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        overflow = self._count - self.max_entries
+        if overflow > 0:
+            overflow += int(self.max_entries * self.EVICTION_SLACK)
+            self._count -= self._conn.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,),
+            ).rowcount
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """get в пуле потоков, не блокируя цикл событий"""
+        return await executors.run_io(self.get, key)
+
+    async def aset(self, key: str, value: Any) -> None:
+        """set в пуле потоков, не блокируя цикл событий"""
+        await executors.run_io(self.set, key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Статистика использования кэша
+
+        Returns:
+            Dict: Попадания, промахи, доля попаданий и количество записей
+        """
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+        }
@@ -0,0 +1,237 @@
+"""Чтение Excel-файлов: листы и построчный поток листа XLSX, разбор прайс-листа pandas"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import openpyxl
+import pandas as pd
+from loguru import logger
+
+
+class XlsxRowStream:
+    """
+    Построчное чтение листа XLSX через openpyxl в режиме read_only
+
+    Лист не загружается в память целиком: строки читаются по мере обхода
+    rows(), поэтому память ограничена размером обрабатываемой пачки.
+    Использовать как контекстный менеджер, чтобы закрыть файл.
+    """
+
+    def __init__(self, file_path: str, sheet_name: Optional[str] = None):
+        """
+        Args:
+            file_path: Путь к XLSX файлу
+            sheet_name: Имя листа (по умолчанию — активный лист)
+        """
+        self._workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        self._sheet = self._workbook[sheet_name] if sheet_name else self._workbook.active
+        # Размер листа из его заголовка; в файлах некоторых генераторов отсутствует
+        self.max_row: Optional[int] = self._sheet.max_row
+
+    def rows(self) -> Iterator[Tuple[int, List[str]]]:
+        """
+        Непустые строки листа
+
+        Yields:
+            Tuple: (номер строки в листе с 1, значения ячеек строками без хвостовых пустых)
+        """
+        for number, values in enumerate(self._sheet.iter_rows(values_only=True), start=1):
+            cells = [format_cell(value) for value in values]
+            while cells and not cells[-1]:
+                cells.pop()
+            if cells:
+                yield number, cells
+
+    def close(self) -> None:
+        self._workbook.close()
+
+    def __enter__(self) -> "XlsxRowStream":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def list_sheet_names(file_path: str) -> List[str]:
+    """
+    Имена видимых листов книги XLSX в порядке следования
+
+    Скрытые листы (справочники, служебные данные) не возвращаются; если
+    видимых нет, возвращается активный лист.
+
+    Args:
+        file_path: Путь к XLSX файлу
+
+    Returns:
+        List[str]: Имена листов
+    """
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        names = [sheet.title for sheet in workbook.worksheets if sheet.sheet_state == "visible"]
+        return names or [workbook.active.title]
+    finally:
+        workbook.close()
+
+
+def format_cell(value: Any) -> str:
+    """Значение ячейки строкой: пусто для None, целые числа без ".0", без переносов строк"""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return " ".join(str(value).split())
+
+
+def read_excel_price_list(file_path: str) -> Dict[str, Any]:
+    """
+    Чтение прайс-листа из Excel файла, пропуская первые 5 строк заголовка
+    Специально для формата прайс-листа с воздуховодами и объединенными ячейками
+
+    Args:
+        file_path: Путь к Excel файлу
+
+    Returns:
+        Dict: Структурированные данные прайс-листа
+    """
+    try:
+        # Попытка определить дату из имени файла или содержимого
+        price_list_date = pd.Timestamp.now().strftime("%Y-%m-%d")
+        try:
+            # Чтение первых строк для поиска даты
+            header_df = pd.read_excel(file_path, header=None, nrows=5)
+            # Ищем строку с датой (обычно в первой строке первый столбец содержит "Прайс-лист на")
+            for i in range(5):
+                for j in range(3):  # Проверяем первые 3 столбца
+                    cell_value = str(header_df.iloc[i, j]).strip() if not pd.isna(header_df.iloc[i, j]) else ""
+                    if "прайс-лист на" in cell_value.lower():
+                        # Извлекаем дату из строки
+                        date_parts = cell_value.split("на")[-1].strip().split()
+                        if len(date_parts) >= 3:
+                            # Конвертируем месяц в числовой формат
+                            month_map = {
+                                "января": "01", "февраля": "02", "марта": "03", "апреля": "04",
+                                "мая": "05", "июня": "06", "июля": "07", "августа": "08",
+                                "сентября": "09", "октября": "10", "ноября": "11", "декабря": "12"
+                            }
+                            day = date_parts[0]
+                            month = month_map.get(date_parts[1].lower(), "01")
+                            year = date_parts[2].replace("г.", "").strip()
+                            price_list_date = f"{year}-{month}-{day}"
+                            break
+        except Exception as e:
+            logger.warning(f"Не удалось извлечь дату из заголовка прайс-листа: {str(e)}")
+
+        # Чтение Excel файла, пропуская первые 5 строк для заголовков
+        df = pd.read_excel(file_path, header=5)
+
+        # Переименуем столбцы для лучшего понимания
+        # Предполагаем, что первая колонка содержит наименование
+        # а последние две колонки - цену и валюту
+        column_names = {}
+        for i, col in enumerate(df.columns):
+            if i == 0:
+                column_names[col] = 'Наименование'
+            elif i == len(df.columns) - 2:
+                column_names[col] = 'Цена'
+            elif i == len(df.columns) - 1:
+                column_names[col] = 'Валюта'
+            else:
+                # Ищем колонку с описанием (обычно колонка с наибольшим количеством текста)
+                non_null_values = df[col].dropna()
+                if len(non_null_values) > 0 and isinstance(non_null_values.iloc[0], str) and len(non_null_values.iloc[0]) > 10:
+                    column_names[col] = 'Описание'
+
+        df.rename(columns=column_names, inplace=True)
+
+        # Определяем валюту
+        currency = "RUB"  # По умолчанию рубли
+        if 'Валюта' in df.columns:
+            currencies = df['Валюта'].dropna().unique()
+            if len(currencies) > 0:
+                currency = str(currencies[0])
+
+        # Обработка иерархической структуры
+        df['Категория'] = None
+        df['Подкатегория'] = None
+        current_category = None
+        current_subcategory = None
+
+        for i, row in df.iterrows():
+            name = row.get('Наименование', '')
+            price = row.get('Цена', None)
+
+            # Проверяем наличие значений
+            if pd.isna(name):
+                continue
+
+            name = str(name).strip()
+
+            # Если строка без цены и не содержит артикул (не начинается с 'VTL-'), 
+            # то это категория или подкатегория
+            if (pd.isna(price) or price == 0) and not name.startswith('VTL-'):
+                if current_category is None or "воздуховоды" in name.lower():
+                    current_category = name
+                    current_subcategory = None
+                else:
+                    current_subcategory = name
+
+            df.at[i, 'Категория'] = current_category
+            df.at[i, 'Подкатегория'] = current_subcategory
+
+        # Отфильтруем только строки с товарами (имеющие цену)
+        products_df = df.dropna(subset=['Цена']).copy()
+        products_df = products_df[products_df['Цена'] > 0].copy()
+
+        # Формируем структуру прайс-листа
+        price_list_data = {
+            "price_list_date": price_list_date,
+            "currency": currency,
+            "categories": {}
+        }
+
+        # Группировка по категориям и подкатегориям
+        for _, row in products_df.iterrows():
+            category = row.get('Категория')
+            subcategory = row.get('Подкатегория')
+
+            if pd.isna(category) or category is None:
+                category = "Неизвестная категория"
+
+            if pd.isna(subcategory) or subcategory is None:
+                subcategory = "Неизвестная подкатегория"
+
+            if category not in price_list_data["categories"]:
+                price_list_data["categories"][category] = {}
+
+            if subcategory not in price_list_data["categories"][category]:
+                price_list_data["categories"][category][subcategory] = []
+
+            # Получаем артикул из наименования
+            article = row.get('Наименование', '')
+            name = article  # По умолчанию
+
+            # Выделяем описание
+            description = str(row.get('Описание', '')) if not pd.isna(row.get('Описание', '')) else ""
+
+            # Если нет описания, но есть длинное наименование, попробуем выделить описание из наименования
+            if not description and len(str(article)) > 20:
+                # Предполагаем, что артикул в формате "VTL-XXXXXXXX" и идет в начале
+                parts = str(article).split(" ", 1)
+                if len(parts) > 1 and parts[0].startswith("VTL-"):
+                    article = parts[0]
+                    description = parts[1]
+                    name = parts[0]  # VTL-код как наименование
+
+            # Добавляем товар
+            price_list_data["categories"][category][subcategory].append({
+                "article": article,
+                "name": name,
+                "description": description,
+                "price": float(row.get('Цена')),
+                "unit": "шт",  # По умолчанию используем "шт"
+            })
+
+        logger.info(f"Excel прайс-лист успешно прочитан, найдено {len(products_df)} товаров с ценами")
+        return price_list_data
+
+    except Exception as e:
+        logger.error(f"Ошибка при чтении Excel файла: {str(e)}")
+        raise Exception(f"Ошибка при чтении Excel файла: {str(e)}")
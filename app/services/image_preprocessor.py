@@ -0,0 +1,212 @@
+"""Подготовка загруженных изображений перед отправкой в модель распознавания"""
+import math
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+from loguru import logger
+from PIL import Image, ImageOps, ImageSequence, UnidentifiedImageError
+
+from app.core.config import settings
+
+# Форматы, страницы которых обрабатываются как отдельные изображения;
+# у остальных (GIF, анимированный WebP) берется только первый кадр
+MULTIPAGE_FORMATS = {"TIFF", "MPO"}
+
+_PUNCTUATION = re.compile(r"[\s.,;:]+")
+
+
+@dataclass
+class ImageTile:
+    """
+    Подготовленное изображение страницы или ее горизонтальная полоса (box — координаты на странице)
+
+    Полоса шире settings.IMAGE_TILE_SIZE разрезана на перекрывающиеся части
+    слева направо (paths); части одной полосы распознаются одним запросом,
+    чтобы строки широких таблиц не разрывались между запросами.
+    """
+
+    paths: List[str]
+    box: Tuple[int, int, int, int]
+
+
+def _spans(length: int) -> List[Tuple[int, int]]:
+    """Отрезки длины settings.IMAGE_TILE_SIZE с перекрытием settings.IMAGE_TILE_OVERLAP; последний прижат к краю"""
+    size = settings.IMAGE_TILE_SIZE
+    if length <= size:
+        return [(0, length)]
+    step = max(1, size - settings.IMAGE_TILE_OVERLAP)
+    starts = list(range(0, length - size, step)) + [length - size]
+    return [(start, start + size) for start in starts]
+
+
+def _tile_boxes(width: int, height: int) -> List[List[Tuple[int, int, int, int]]]:
+    """
+    Сетка фрагментов не больше settings.IMAGE_TILE_SIZE по каждой стороне
+
+    Returns:
+        List: Горизонтальные полосы сверху вниз, у каждой — части слева направо
+    """
+    return [
+        [(left, top, right, bottom) for left, right in _spans(width)]
+        for top, bottom in _spans(height)
+    ]
+
+
+def _prepare_frame(frame: Image.Image) -> Image.Image:
+    """
+    Поворот по EXIF и перевод в оттенки серого (settings.IMAGE_GRAYSCALE)
+
+    Прозрачный фон заменяется белым, чтобы текст не пропал при переводе в JPEG.
+    """
+    image = ImageOps.exif_transpose(frame)
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    return image.convert("L" if settings.IMAGE_GRAYSCALE else "RGB")
+
+
+def _save(image: Image.Image, path: str, dpi: Optional[Tuple[float, float]] = None, downscale: bool = True) -> str:
+    """
+    Сохранение в JPEG с плотностью dpi исходного изображения
+
+    С downscale изображение уменьшается до settings.IMAGE_MAX_SIDE по большей
+    стороне, плотность уменьшается в том же отношении. Фрагменты нарезки
+    сохраняются без уменьшения: они и так не больше settings.IMAGE_TILE_SIZE.
+    """
+    max_side = settings.IMAGE_MAX_SIDE
+    if downscale and max_side and max(image.size) > max_side:
+        scale = max_side / max(image.size)
+        image = image.copy()
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        dpi = tuple(value * scale for value in dpi) if dpi else None
+    params = {"dpi": dpi} if dpi else {}
+    image.save(path, "JPEG", quality=settings.IMAGE_JPEG_QUALITY, optimize=True, **params)
+    return path
+
+
+def preprocess_image(file_path: str, output_dir: str) -> List[List[ImageTile]]:
+    """
+    Подготовка изображения к распознаванию
+
+    Каждая страница (для многостраничного TIFF) поворачивается по EXIF,
+    уменьшается до settings.IMAGE_MAX_SIDE по большей стороне, переводится
+    в оттенки серого (settings.IMAGE_GRAYSCALE) и сохраняется в JPEG с
+    качеством settings.IMAGE_JPEG_QUALITY. Страница, большая сторона которой
+    больше settings.IMAGE_TILING_THRESHOLD, вместо уменьшения режется сеткой
+    перекрывающихся фрагментов settings.IMAGE_TILE_SIZE в исходном разрешении
+    (и с исходной плотностью dpi): горизонтальные полосы, широкие полосы — на
+    части слева направо.
+
+    Args:
+        file_path: Путь к загруженному изображению
+        output_dir: Каталог для подготовленных файлов
+
+    Returns:
+        List: Страницы по порядку, у каждой — список фрагментов (у страницы
+        без нарезки один фрагмент); если подготовка выключена или Pillow не
+        может открыть файл (например, SVG) — одна страница с исходным файлом
+
+    Raises:
+        ValueError: Число пикселей изображения превышает предел Pillow
+        (Image.MAX_IMAGE_PIXELS) — защита от «бомб распаковки»
+    """
+    if not settings.IMAGE_PREPROCESSING_ENABLED:
+        return [[ImageTile([file_path], (0, 0, 0, 0))]]
+
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+    pages = []
+    try:
+        with Image.open(file_path) as source:
+            frames = ImageSequence.Iterator(source) if source.format in MULTIPAGE_FORMATS else [source]
+            for number, frame in enumerate(frames, start=1):
+                dpi = frame.info.get("dpi")
+                image = _prepare_frame(frame)
+                threshold = settings.IMAGE_TILING_THRESHOLD
+                if threshold and max(image.size) > threshold:
+                    strips = []
+                    for strip, parts in enumerate(_tile_boxes(*image.size), start=1):
+                        paths = [
+                            _save(image.crop(box), os.path.join(output_dir, f"{base_name}_{number}_{strip}_{part}.jpg"), dpi, downscale=False)
+                            for part, box in enumerate(parts, start=1)
+                        ]
+                        strips.append(ImageTile(paths, (parts[0][0], parts[0][1], parts[-1][2], parts[0][3])))
+                    pages.append(strips)
+                else:
+                    path = _save(image, os.path.join(output_dir, f"{base_name}_{number}.jpg"), dpi)
+                    pages.append([ImageTile([path], (0, 0) + image.size)])
+    except Image.DecompressionBombError as e:
+        logger.warning(f"Изображение {file_path} отклонено: {str(e)}")
+        raise ValueError(
+            f"Изображение слишком большое для обработки (больше {Image.MAX_IMAGE_PIXELS} пикселей)"
+        ) from e
+    except (UnidentifiedImageError, OSError) as e:
+        logger.warning(f"Не удалось подготовить изображение {file_path}, отправляется исходный файл: {str(e)}")
+        return [[ImageTile([file_path], (0, 0, 0, 0))]]
+
+    tiles = [tile for page in pages for tile in page]
+    logger.debug(
+        f"Изображение {file_path} ({os.path.getsize(file_path)} байт) подготовлено: "
+        f"страниц {len(pages)}, полос {len(tiles)}, фрагментов {sum(len(tile.paths) for tile in tiles)}, "
+        f"размер {sum(os.path.getsize(path) for tile in tiles for path in tile.paths)} байт"
+    )
+    return pages
+
+
+def _item_key(item: Any) -> Tuple[str, str, str]:
+    """Наименование, количество и единица товара без регистра, пробелов и знаков препинания"""
+    if not isinstance(item, dict):
+        return (_PUNCTUATION.sub(" ", str(item)).strip().lower(), "", "")
+    return tuple(
+        _PUNCTUATION.sub(" ", str(item.get(field) or "")).strip().lower()
+        for field in ("Наименование", "Количество", "Ед.изм.")
+    )
+
+
+def _band_limit(previous: ImageTile, tile: ImageTile, count: int) -> int:
+    """
+    Сколько последних товаров предыдущей полосы может лежать в зоне перекрытия
+
+    Положение товара на фрагменте неизвестно, поэтому оценка — доля высоты
+    перекрытия в высоте фрагмента от числа его товаров, с запасом в одну строку.
+    """
+    height = previous.box[3] - previous.box[1]
+    overlap = previous.box[3] - tile.box[1]
+    if height <= 0 or overlap <= 0:
+        return 0
+    return min(count, math.ceil(count * overlap / height) + 1)
+
+
+def merge_tile_items(tiles: List[ImageTile], tile_items: List[List[Any]]) -> List[Any]:
+    """
+    Объединение товаров полос одной страницы без повторов из зон перекрытия
+
+    Повторами считаются только строки зоны перекрытия соседних полос: самый
+    длинный конец списка товаров предыдущей полосы (не длиннее оценки
+    _band_limit), совпадающий с началом списка следующей полосы по
+    наименованию, количеству и единице (без регистра и знаков препинания).
+    Одинаковые строки в других местах страницы сохраняются: это разные строки
+    документа.
+
+    Args:
+        tiles: Полосы страницы сверху вниз
+        tile_items: Товары каждой полосы
+
+    Returns:
+        List: Товары страницы в порядке полос
+    """
+    merged: List[Any] = []
+    for index, (tile, items) in enumerate(zip(tiles, tile_items)):
+        skip = 0
+        if index:
+            previous = [_item_key(item) for item in tile_items[index - 1]]
+            current = [_item_key(item) for item in items]
+            limit = min(_band_limit(tiles[index - 1], tile, len(previous)), len(current))
+            skip = next(
+                (size for size in range(limit, 0, -1) if previous[-size:] == current[:size]),
+                0,
+            )
+        merged.extend(items[skip:])
+    return merged
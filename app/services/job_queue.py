@@ -0,0 +1,307 @@
+"""Персистентная очередь фоновых задач обработки загруженных файлов на SQLite"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from app.core.config import settings
+
+# Статусы задачи
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+JobFinalizer = Callable[[Dict[str, Any], Optional[Dict[str, Any]]], None]
+
+
+class JobQueue:
+    """
+    Очередь задач, хранящаяся в файле SQLite
+
+    Задача — JSON-описание работы (payload) со статусом, числом попыток и
+    результатом. Воркер, выполняющий задачу, продлевает ее аренду (lease)
+    на settings.JOB_LEASE_SECONDS; задача с истекшей арендой (процесс
+    остановлен или упал) возвращается в очередь, а если попытки исчерпаны —
+    переводится в failed. Задачи с действующей арендой, которые выполняют
+    другие процессы с тем же файлом очереди, не трогаются. Упавшая задача повторяется
+    с экспоненциальной задержкой, пока не исчерпаны settings.JOB_MAX_ATTEMPTS
+    попыток. Задачи обрабатывают settings.JOB_WORKERS асинхронных воркеров;
+    после выполнения или последней неудачной попытки вызывается finalizer
+    (например, удаление загруженного файла).
+    """
+
+    def __init__(self, path: str):
+        """
+        Открывает (или создает) файл очереди
+
+        Args:
+            path: Путь к файлу SQLite
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._workers: List[asyncio.Task] = []
+        self._finalizer: Optional[JobFinalizer] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._recovered_at = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, next_run_at REAL NOT NULL, "
+                "result TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                "lease_until REAL NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "lease_until" not in columns:
+                # Файл очереди, созданный до появления аренды
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN lease_until REAL NOT NULL DEFAULT 0")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status_next_run_at ON jobs (status, next_run_at)"
+            )
+
+    def enqueue(self, payload: Dict[str, Any]) -> str:
+        """
+        Постановка задачи в очередь
+
+        Args:
+            payload: JSON-сериализуемое описание задачи
+
+        Returns:
+            str: ID задачи
+        """
+        job_id = f"job_{uuid.uuid4().hex}"
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, payload, next_run_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(payload, ensure_ascii=False), now, now, now),
+            )
+        logger.info(f"Задача {job_id} поставлена в очередь")
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Задача по ID
+
+        Args:
+            job_id: ID задачи
+
+        Returns:
+            Dict: id, status, payload, attempts, result, error, created_at, updated_at
+            или None, если задачи нет
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, payload, attempts, result, error, created_at, updated_at "
+                "FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "status": row[1],
+            "payload": json.loads(row[2]),
+            "attempts": row[3],
+            "result": json.loads(row[4]) if row[4] else None,
+            "error": row[5],
+            "created_at": row[6],
+            "updated_at": row[7],
+        }
+
+    def counts(self) -> Dict[str, int]:
+        """Количество задач по статусам"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: 0 for status in (QUEUED, RUNNING, COMPLETED, FAILED)} | dict(rows)
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Берет в работу самую старую задачу, время запуска которой наступило
+
+        Задача захватывается условным UPDATE по статусу queued: если ее
+        успел взять воркер другого процесса, UPDATE не изменит строк и
+        берется следующая задача.
+        """
+        while True:
+            now = time.time()
+            with self._lock, self._conn:
+                row = self._conn.execute(
+                    "SELECT id, payload, attempts FROM jobs WHERE status = ? AND next_run_at <= ? "
+                    "ORDER BY created_at LIMIT 1",
+                    (QUEUED, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                claimed = self._conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_until = ?, updated_at = ? "
+                    "WHERE id = ? AND status = ?",
+                    (RUNNING, now + settings.JOB_LEASE_SECONDS, now, row[0], QUEUED),
+                ).rowcount
+            if claimed:
+                return {"id": row[0], "payload": json.loads(row[1]), "attempts": row[2] + 1}
+
+    def _renew(self, job_id: str) -> None:
+        """Продление аренды выполняемой задачи"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = ?",
+                (now + settings.JOB_LEASE_SECONDS, job_id, RUNNING),
+            )
+
+    async def _heartbeat(self, job_id: str) -> None:
+        """Продлевает аренду задачи, пока она выполняется"""
+        while True:
+            await asyncio.sleep(settings.JOB_LEASE_SECONDS / 3)
+            self._renew(job_id)
+
+    def _complete(self, job_id: str, result: Dict[str, Any]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, updated_at = ? WHERE id = ?",
+                (COMPLETED, json.dumps(result, ensure_ascii=False), time.time(), job_id),
+            )
+
+    def _fail(self, job_id: str, attempts: int, error: str) -> str:
+        """Возврат задачи в очередь с задержкой или перевод в failed после последней попытки; возвращает новый статус"""
+        now = time.time()
+        if attempts < settings.JOB_MAX_ATTEMPTS:
+            delay = min(settings.JOB_RETRY_MAX_DELAY, settings.JOB_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+            status, next_run_at = QUEUED, now + delay
+            logger.warning(f"Задача {job_id}: ошибка ({error}), попытка {attempts} из {settings.JOB_MAX_ATTEMPTS}, повтор через {delay:.0f} сек.")
+        else:
+            status, next_run_at = FAILED, now
+            logger.error(f"Задача {job_id} завершилась ошибкой после {attempts} попыток: {error}")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, next_run_at = ?, updated_at = ? WHERE id = ?",
+                (status, error, next_run_at, now, job_id),
+            )
+        return status
+
+    def _recover(self) -> None:
+        """
+        Разбор задач с истекшей арендой и удаление старых завершенных
+
+        Задача, прерванная остановкой процесса, возвращается в очередь, а
+        если ее попытки исчерпаны — переводится в failed и передается в
+        finalizer.
+        """
+        now = time.time()
+        self._recovered_at = now
+        error = "Выполнение прервано: аренда задачи истекла"
+        with self._lock, self._conn:
+            expired = self._conn.execute(
+                "SELECT id, payload, attempts FROM jobs WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (RUNNING, now, settings.JOB_MAX_ATTEMPTS),
+            ).fetchall()
+            failed = []
+            for job_id, payload, attempts in expired:
+                if self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ? AND status = ? AND lease_until < ?",
+                    (FAILED, error, now, job_id, RUNNING, now),
+                ).rowcount:
+                    failed.append({"id": job_id, "payload": json.loads(payload), "attempts": attempts})
+            recovered = self._conn.execute(
+                "UPDATE jobs SET status = ?, next_run_at = ?, updated_at = ? WHERE status = ? AND lease_until < ?",
+                (QUEUED, now, now, RUNNING, now),
+            ).rowcount
+            purged = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (COMPLETED, FAILED, now - settings.JOB_RETENTION_DAYS * 86400),
+            ).rowcount
+        for job in failed:
+            logger.error(f"Задача {job['id']} прервана после {job['attempts']} попыток, переведена в failed")
+            self._finalize(job, None)
+        if recovered or purged or failed:
+            logger.info(f"Очередь задач: возвращено в очередь {recovered}, завершено ошибкой {len(failed)}, удалено старых {purged}")
+
+    async def _worker(self, number: int, handler: JobHandler) -> None:
+        """Воркер: берет задачи по одной и выполняет handler"""
+        while True:
+            if time.time() - self._recovered_at >= settings.JOB_LEASE_SECONDS:
+                self._recover()
+            job = self._claim()
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            logger.info(f"Воркер {number}: задача {job['id']}, попытка {job['attempts']}")
+            heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+            try:
+                result = await handler(job["payload"])
+            except asyncio.CancelledError:
+                # Остановка приложения: задача останется running и вернется в очередь, когда истечет аренда
+                raise
+            except Exception as e:
+                if self._fail(job["id"], job["attempts"], str(e)) == FAILED:
+                    self._finalize(job, None)
+            else:
+                self._complete(job["id"], result)
+                logger.info(f"Задача {job['id']} выполнена")
+                self._finalize(job, result)
+            finally:
+                heartbeat.cancel()
+
+    def _finalize(self, job: Dict[str, Any], result: Optional[Dict[str, Any]]) -> None:
+        """Вызов finalizer для задачи, которая больше не будет выполняться"""
+        if self._finalizer is None:
+            return
+        try:
+            self._finalizer(job["payload"], result)
+        except Exception as e:
+            logger.warning(f"Задача {job['id']}: ошибка при завершении: {str(e)}")
+
+    def start(self, handler: JobHandler, finalizer: Optional[JobFinalizer] = None) -> None:
+        """
+        Запуск воркеров в текущем цикле событий
+
+        Args:
+            handler: Асинхронная функция, выполняющая задачу по payload и
+                возвращающая JSON-сериализуемый результат
+            finalizer: Функция, получающая payload и результат задачи после ее
+                выполнения или payload и None после последней неудачной попытки
+        """
+        if self._workers:
+            return
+        self._finalizer = finalizer
+        self._recover()
+        self._wakeup = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._worker(number, handler))
+            for number in range(1, max(1, settings.JOB_WORKERS) + 1)
+        ]
+        logger.info(f"Запущено воркеров очереди задач: {len(self._workers)}")
+
+    async def stop(self) -> None:
+        """Остановка воркеров"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+# Экземпляр очереди
+job_queue = JobQueue(os.path.join(settings.CACHE_DIR, "jobs.sqlite3"))
@@ -0,0 +1,173 @@
+"""Локальный разбор типовых строк спецификации без обращения к LLM"""
+import re
+from typing import Any, Dict, Optional
+
+# Первое слово строки -> значение поля "Наименование" в таблице ЗАЯВКА
+ITEM_TYPES = {
+    "воздуховод": "Труба",
+    "труба": "Труба",
+    "отвод": "Отвод",
+    "заглушка": "Заглушка",
+}
+
+# Слова, которые встречаются в типовых строках и не влияют на результат.
+# Если после разбора в строке осталось что-то кроме них — строку отдаем в LLM.
+FILLER_WORDS = {
+    "из", "по", "мм", "листовой", "тонколистовой", "оцинкованной", "оцинкованный",
+    "оцинкованная", "оц", "стали", "сталь", "круглого", "круглый", "круглая",
+    "прямоугольного", "прямоугольный", "прямоугольная", "сечения",
+    "воздуховода", "воздуховодов",
+}
+
+UNITS = {
+    "шт": "шт",
+    "штук": "шт",
+    "м": "ПМ",
+    "m": "ПМ",
+    "пм": "ПМ",
+    "п.м": "ПМ",
+    "м.п": "ПМ",
+    "мп": "ПМ",
+}
+
+GOST_RE = re.compile(r"гост\s*[\d\-.]+")
+THICKNESS_RE = re.compile(r"(?<![a-zа-я])(?:b|s|δ|б|t)\s*=\s*(\d+(?:[.,]\d+)?)(?:\s*мм)?")
+RECT_SIZE_RE = re.compile(r"(?<!\d)(\d{2,4})\s*[xх×*]\s*(\d{2,4})(?!\d)")
+ROUND_SIZE_RE = re.compile(r"(?:ø|⌀|φ|(?<![a-zа-я])d|(?<![a-zа-я])ф)\s*(\d{2,4})(?!\d)")
+ANGLE_RE = re.compile(r"(?<!\d)(\d{1,2})\s*(?:°|град\w*)")
+DASH_ANGLE_RE = re.compile(r"^(отвод)\s*-\s*(\d{2})(?!\d)")
+TRAILING_QUANTITY_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(шт|штук|п\.?\s?м|м\.?\s?п|пм|м|m)\.?\s*$")
+# Число без обозначения считается диаметром только от трех цифр: двузначное
+# чаще угол ("Отвод 45") или что-то еще, что должна разобрать LLM
+BARE_NUMBER_RE = re.compile(r"(?<![\d.,])(\d{3,4})(?![\d.,])")
+
+# Стандартные углы отводов: такое число без обозначения у отвода может быть и
+# углом, и диаметром ("Отвод 180"), поэтому строка уходит в LLM
+BEND_ANGLES = {"15", "30", "45", "60", "75", "90", "120", "135", "150", "180"}
+
+
+def _parse_quantity(raw_quantity: Any, unit: str) -> Optional[str]:
+    """Количество как строка; для шт — только целое число"""
+    text = str(raw_quantity).strip().replace(",", ".")
+    try:
+        value = float(text)
+    except ValueError:
+        return None
+    if value <= 0:
+        return None
+    if unit == "шт":
+        if not value.is_integer():
+            return None
+        return str(int(value))
+    return str(int(value)) if value.is_integer() else str(value)
+
+
+def _normalize_unit(raw_unit: Any) -> Optional[str]:
+    """Приводит единицу измерения к виду из правил; None — если единица неизвестна"""
+    unit = str(raw_unit or "").strip().lower().rstrip(".").replace(" ", "")
+    if not unit:
+        return "шт"
+    return UNITS.get(unit)
+
+
+def parse_item_line(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Разбирает типовую строку товара в запись таблицы ЗАЯВКА
+
+    Разбираются только строки, в которых каждое слово распознано: тип
+    (воздуховод/труба, отвод, заглушка), размер, толщина, угол, количество
+    и слова из FILLER_WORDS. Все остальное возвращает None и уходит в LLM.
+
+    Args:
+        item: Товар с полями "Наименование", "Количество", "Ед.изм."
+
+    Returns:
+        Dict: Запись с полями "Длина", "Ед. изм.", "Кол-во", "Наименование",
+        "Размер", "Тип", "Толщина", "Угол" или None
+    """
+    text = str(item.get("Наименование") or "").strip().lower()
+    if not text:
+        return None
+
+    raw_quantity = item.get("Количество")
+    raw_unit = item.get("Ед.изм.")
+    if raw_quantity in (None, ""):
+        # Количество и единица могут стоять в конце строки: "... 55 м"
+        match = TRAILING_QUANTITY_RE.search(text)
+        if not match:
+            return None
+        raw_quantity, raw_unit = match.group(1), match.group(2)
+        text = text[:match.start()]
+
+    unit = _normalize_unit(raw_unit)
+    if unit is None:
+        return None
+    quantity = _parse_quantity(raw_quantity, unit)
+    if quantity is None:
+        return None
+
+    angle = None
+    match = DASH_ANGLE_RE.search(text)
+    if match:
+        angle = match.group(2)
+        text = match.group(1) + text[match.end():]
+
+    first_word = re.split(r"[\s,.\-]+", text, maxsplit=1)[0]
+    item_type = ITEM_TYPES.get(first_word)
+    if item_type is None:
+        return None
+    text = text[len(first_word):]
+
+    text = GOST_RE.sub(" ", text)
+
+    thickness = ""
+    thickness_matches = THICKNESS_RE.findall(text)
+    if len(thickness_matches) > 1:
+        return None
+    if thickness_matches:
+        thickness = thickness_matches[0].replace(".", ",")
+        text = THICKNESS_RE.sub(" ", text)
+
+    angle_matches = ANGLE_RE.findall(text)
+    if len(angle_matches) > 1 or (angle and angle_matches):
+        return None
+    if angle_matches:
+        angle = angle_matches[0]
+        text = ANGLE_RE.sub(" ", text)
+
+    sizes = [f"{w}x{h}" for w, h in RECT_SIZE_RE.findall(text)]
+    text = RECT_SIZE_RE.sub(" ", text)
+    sizes += ROUND_SIZE_RE.findall(text)
+    text = ROUND_SIZE_RE.sub(" ", text)
+    if not sizes:
+        # "Заглушка 160" — единственное число без обозначения считаем диаметром
+        sizes = BARE_NUMBER_RE.findall(text)
+        text = BARE_NUMBER_RE.sub(" ", text)
+        if item_type == "Отвод" and any(size in BEND_ANGLES for size in sizes):
+            return None
+    if len(sizes) != 1:
+        return None
+
+    leftover = [word for word in re.split(r"[\s,.;:()\-]+", text) if word]
+    if any(word not in FILLER_WORDS for word in leftover):
+        return None
+
+    if item_type == "Отвод":
+        if unit != "шт":
+            return None
+        angle = angle or "90"
+    elif angle:
+        return None
+    elif item_type == "Заглушка" and unit != "шт":
+        return None
+
+    return {
+        "Длина": "-",
+        "Ед. изм.": unit,
+        "Кол-во": quantity,
+        "Наименование": item_type,
+        "Размер": sizes[0],
+        "Тип": "-",
+        "Толщина": thickness,
+        "Угол": angle or "-",
+    }
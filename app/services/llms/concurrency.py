@@ -0,0 +1,109 @@
+"""Общее ограничение числа одновременных запросов к LLM"""
+import asyncio
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import LLM_QUEUE_WAIT, metrics
+
+# Время, проведенное запросами текущего вызова под лимитом (без ожидания
+# места и пауз между повторами); его записывает в длительность track_llm_call
+_request_time: ContextVar[Optional[List[float]]] = ContextVar("llm_request_time", default=None)
+
+
+@contextmanager
+def measure_request_time() -> Iterator[List[float]]:
+    """
+    Контекстный менеджер: суммирует время запросов под лимитом внутри блока
+
+    Returns:
+        List: Один элемент — сумма в секундах, заполняется по выходу из запросов
+    """
+    spent = [0.0]
+    token = _request_time.set(spent)
+    try:
+        yield spent
+    finally:
+        _request_time.reset(token)
+
+
+class LLMConcurrencyLimiter:
+    """
+    Семафор на все запросы к LLM процесса
+
+    Пачки, страницы и листы разных документов запускаются параллельно со
+    своими ограничениями; этот лимит (settings.LLM_MAX_CONCURRENCY) действует
+    поверх них, чтобы суммарно не превысить лимиты провайдера. Семафор
+    создается при первом запросе, внутри работающего цикла событий.
+    """
+
+    def __init__(self):
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.waiting = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max(1, settings.LLM_MAX_CONCURRENCY))
+        return self._semaphore
+
+    async def run(self, call: Callable, *args, **kwargs):
+        """
+        Выполняет запрос, дождавшись свободного места
+
+        Ожидание места записывается в LLM_QUEUE_WAIT, время самого запроса —
+        в measure_request_time вызывающего.
+        """
+        semaphore = self._get_semaphore()
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        acquired = time.perf_counter()
+        LLM_QUEUE_WAIT.observe(acquired - start)
+        self.in_flight += 1
+        try:
+            return await call(*args, **kwargs)
+        finally:
+            self.in_flight -= 1
+            semaphore.release()
+            spent = _request_time.get()
+            if spent is not None:
+                spent[0] += time.perf_counter() - acquired
+
+    def state(self) -> Dict[tuple, float]:
+        """Запросы в работе и ожидающие места (для gauge)"""
+        return {("running",): self.in_flight, ("waiting",): self.waiting}
+
+
+# Экземпляр ограничителя
+llm_limiter = LLMConcurrencyLimiter()
+
+metrics.gauge_callback(
+    "llm_concurrency", "Запросы к LLM в работе и ожидающие места под общим лимитом", ("state",), llm_limiter.state
+)
+
+
+def limit_concurrency(method: Callable) -> Callable:
+    """
+    Декоратор для chat_completion / image_to_text наследников LLMWork
+
+    Запрос ждет места под общим лимитом llm_limiter. Должен стоять под
+    cached_response, чтобы ответы из кэша не занимали место.
+
+    Ответ с ошибкой возвращается как есть: повторяет запрос только
+    call_with_retry вызывающего кода. Каждая его попытка занимает место
+    заново, а пауза между попытками проходит вне лимита. Собственные повторы
+    SDK провайдеров выключены: они ждали бы, занимая место.
+    """
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        return await llm_limiter.run(method, self, *args, **kwargs)
+
+    return wrapper
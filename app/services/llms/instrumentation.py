@@ -0,0 +1,44 @@
+"""Метрики запросов к LLM"""
+import functools
+from typing import Callable
+
+from app.core.metrics import LLM_REQUEST_DURATION, LLM_REQUESTS, LLM_TOKENS
+from app.services.llms.concurrency import measure_request_time
+
+
+def track_llm_call(method: Callable) -> Callable:
+    """
+    Декоратор для chat_completion / image_to_text наследников LLMWork
+
+    Считает запросы по статусу (ok, error, cache_hit), длительность и токены
+    с разбивкой по провайдеру, модели и методу. Модель берется из ответа
+    провайдера, если он ее вернул, иначе из аргумента model или self.model.
+    Должен стоять над cached_response, чтобы попадания в кэш тоже учитывались.
+
+    Длительность — время запросов под общим лимитом (limit_concurrency):
+    ожидание места (llm_queue_wait_seconds) и паузы между повторами в нее
+    не входят.
+    """
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        provider = type(self).__name__.replace("Work", "").lower()
+        status = "error"
+        model = kwargs.get("model") or self.model or "unknown"
+        try:
+            with measure_request_time() as spent:
+                response = await method(self, *args, **kwargs)
+            if isinstance(response, dict) and not response.get("error"):
+                status = "cache_hit" if response.get("response_cache_hit") else "ok"
+                model = getattr(response.get("raw_response"), "model", None) or model
+            return response
+        finally:
+            labels = {"provider": provider, "model": str(model), "method": method.__name__}
+            LLM_REQUESTS.inc(status=status, **labels)
+            if status != "cache_hit":
+                LLM_REQUEST_DURATION.observe(spent[0], **labels)
+            if status == "ok":
+                LLM_TOKENS.inc(response.get("tokens") or 0, kind="total", **labels)
+                LLM_TOKENS.inc(response.get("cached_tokens") or 0, kind="cached", **labels)
+
+    return wrapper
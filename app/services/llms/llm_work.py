@@ -1,6 +1,7 @@
 """Абстрактный класс для работы с различными LLM сервисами"""
 from abc import ABC, abstractmethod
 from typing import List, Dict, Any, Optional, Union
+import json
 import os
 from loguru import logger
 
@@ -28,7 +29,8 @@ class LLMWork(ABC):
     async def chat_completion(self, messages: List[Dict[str, str]], 
                             model: Optional[str] = None,
                             temperature: float = 0.9, 
-                            max_tokens: int = 2000) -> Dict[str, Any]:
+                            max_tokens: int = 2000,
+                            response_schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Отправляет запрос на генерацию текста с историей сообщений
 
@@ -37,6 +39,9 @@ class LLMWork(ABC):
             model: Модель для использования
             temperature: Температура генерации (0.0-1.0)
             max_tokens: Максимальное количество токенов в ответе
+            response_schema: Схема ответа {"name", "schema"} (см. llms/schemas.py);
+                если задана, используется режим структурированного вывода провайдера,
+                а разобранный ответ кладется в поле "data"
 
         Returns:
             Dict: Ответ от LLM модели
@@ -77,13 +82,15 @@ class LLMWork(ABC):
         pass
     
     @abstractmethod
-    async def image_to_text(self, image_path: str, prompt: Optional[str] = None) -> str:
+    async def image_to_text(self, image_path: Union[str, List[str]], prompt: Optional[str] = None,
+                            response_schema: Optional[Dict[str, Any]] = None) -> str:
         """
         Распознает и описывает содержимое изображения
 
         Args:
-            image_path: Путь к изображению
+            image_path: Путь к изображению или список путей (части одного изображения по порядку)
             prompt: Дополнительные инструкции для распознавания
+            response_schema: Схема ответа для структурированного вывода (как в chat_completion)
 
         Returns:
             str: Текстовое описание изображения
@@ -105,6 +112,7 @@ class LLMWork(ABC):
             return {
                 "text": self._extract_text(response, isImage),
                 "tokens": self._extract_tokens(response),
+                "cached_tokens": self._extract_cached_tokens(response),
                 "finish_reason": self._extract_finish_reason(response),
                 "raw_response": response
             }
@@ -112,6 +120,29 @@ class LLMWork(ABC):
             self.logger.error(f"Ошибка при форматировании ответа: {str(e)}")
             return {"text": "", "error": str(e), "raw_response": response}
     
+    def _attach_structured_data(self, result: Dict[str, Any], response_schema: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Добавляет в ответ поле "data" с разобранным JSON при структурированном выводе
+
+        Args:
+            result: Ответ после format_response
+            response_schema: Схема, с которой был сделан запрос (None — ничего не делаем)
+
+        Returns:
+            Dict: Тот же ответ с полем "data" (None, если JSON не разобрался)
+        """
+        if response_schema is None:
+            return result
+        result["data"] = None
+        text = result.get("text")
+        if not text:
+            return result
+        try:
+            result["data"] = json.loads(text)
+        except json.JSONDecodeError as e:
+            self.logger.warning(f"Структурированный ответ ({response_schema.get('name')}) не является JSON: {str(e)}")
+        return result
+
     def _extract_text(self, response: Any, isImage: bool = False) -> str:
         """
         Извлекает текст из ответа модели
@@ -138,6 +169,19 @@ class LLMWork(ABC):
         # Переопределяется в конкретных реализациях
         return 0
     
+    def _extract_cached_tokens(self, response: Any) -> int:
+        """
+        Извлекает количество токенов запроса, взятых из кэша префиксов провайдера
+        
+        Args:
+            response: Ответ от LLM модели
+            
+        Returns:
+            int: Количество закэшированных токенов
+        """
+        # Переопределяется в конкретных реализациях
+        return 0
+    
     def _extract_finish_reason(self, response: Any) -> str:
         """
         Извлекает причину завершения генерации
@@ -1,9 +1,12 @@
 """Сервис для работы с Mistral AI API"""
 import os
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 from mistralai import Mistral
 # from mistralai.models.chat_completion import ChatMessage
 from app.services.llms.llm_work import LLMWork
+from app.services.llms.response_cache import cached_response
+from app.services.llms.instrumentation import track_llm_call
+from app.services.llms.concurrency import limit_concurrency
 from app.core.config import settings
 
 
@@ -36,10 +39,14 @@ class MistralWork(LLMWork):
             self.logger.error(f"Ошибка при инициализации клиента Mistral AI: {str(e)}")
             self.client = None
 
+    @track_llm_call
+    @cached_response
+    @limit_concurrency
     async def chat_completion(self, messages: List[Dict[str, str]], 
                             model: Optional[str] = None,
                             temperature: float = 0.7, 
-                            max_tokens: int = 2000) -> Dict[str, Any]:
+                            max_tokens: int = 2000,
+                            response_schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Отправляет запрос на генерацию текста с историей сообщений через Mistral AI ChatCompletion API
 
@@ -48,6 +55,7 @@ class MistralWork(LLMWork):
             model: Модель для использования
             temperature: Температура генерации (0.0-1.0)
             max_tokens: Максимальное количество токенов в ответе
+            response_schema: Схема ответа; включает response_format json_schema
 
         Returns:
             Dict: Форматированный ответ от Mistral AI
@@ -67,10 +75,11 @@ class MistralWork(LLMWork):
                 model=model or self.model,
                 messages=messages,
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
+                **self._response_format_params(response_schema)
             )
             
-            return self.format_response(response)
+            return self._attach_structured_data(self.format_response(response), response_schema)
         except Exception as e:
             self.logger.error(f"Ошибка при выполнении chat_completion: {str(e)}")
             return {"text": "", "error": str(e)}
@@ -141,28 +150,36 @@ class MistralWork(LLMWork):
             self.logger.error(f"Ошибка при получении эмбеддингов через Mistral AI API: {str(e)}")
             return []
     
-    async def image_to_text(self, image_path: str, prompt: Optional[str] = None) -> str:
+    @track_llm_call
+    @cached_response
+    @limit_concurrency
+    async def image_to_text(self, image_path: Union[str, List[str]], prompt: Optional[str] = None,
+                            response_schema: Optional[Dict[str, Any]] = None) -> str:
         """
         Распознавание изображений не поддерживается Mistral AI на данный момент.
         
         Args:
-            image_path: Путь к изображению
+            image_path: Путь к изображению или список путей (части одного изображения по порядку)
             prompt: Дополнительные инструкции для распознавания
+            response_schema: Схема ответа для структурированного вывода
 
         Returns:
             str: Сообщение об ошибке
         """
-        uploaded_pdf = await self.client.files.upload_async(
-            file={
-                "file_name": image_path,
-                "content": open(image_path, "rb"),
-            },
-            purpose="ocr",
-        )
-        await self.client.files.retrieve_async(file_id=uploaded_pdf.id)
-        signed_url = await self.client.files.get_signed_url_async(
-            file_id=uploaded_pdf.id
-        )
+        image_parts = []
+        for path in [image_path] if isinstance(image_path, str) else image_path:
+            uploaded_pdf = await self.client.files.upload_async(
+                file={
+                    "file_name": path,
+                    "content": open(path, "rb"),
+                },
+                purpose="ocr",
+            )
+            await self.client.files.retrieve_async(file_id=uploaded_pdf.id)
+            signed_url = await self.client.files.get_signed_url_async(
+                file_id=uploaded_pdf.id
+            )
+            image_parts.append({"type": "image_url", "image_url": signed_url.url})
 
         messages = [
             {
@@ -173,20 +190,37 @@ class MistralWork(LLMWork):
                         # "text": 'найди все позиции и верни их в виде списка в формате json "Наименование": наиминование, "Количество": количество, "Ед.изм.": ед.изм. даже если это 1 элемент то верни 1 элемент' ,
                         "text": prompt
                     },
-                    {"type": "image_url", "image_url": signed_url.url},
+                    *image_parts,
                 ],
             }
         ]
 
         # Get the chat response
         chat_response = await self.client.chat.complete_async(
-            model="pixtral-12b-2409", messages=messages
+            model="pixtral-12b-2409", messages=messages,
+            **self._response_format_params(response_schema)
         )
 
         # Print the content of the response
         response = self.format_response(chat_response)
 
-        return response
+        return self._attach_structured_data(response, response_schema)
+
+    @staticmethod
+    def _response_format_params(response_schema: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Параметр response_format для структурированного вывода Mistral"""
+        if response_schema is None:
+            return {}
+        return {
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": response_schema["name"],
+                    "schema_definition": response_schema["schema"],
+                    "strict": True,
+                },
+            }
+        }
     
     def _extract_text(self, response: Any) -> str:
         """
@@ -1,9 +1,12 @@
 """Сервис для работы с OpenAI API"""
 import os
 import base64
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 from openai import AsyncOpenAI
 from app.services.llms.llm_work import LLMWork
+from app.services.llms.response_cache import cached_response
+from app.services.llms.instrumentation import track_llm_call
+from app.services.llms.concurrency import limit_concurrency
 from app.core.config import settings
 
 # MODEL="gpt-4.1-nano-2025-04-14"
@@ -27,22 +30,27 @@ class OpenAIWork(LLMWork):
         super().__init__(api_key, model)
         # Используем API ключ из аргументов или из конфигурации приложения
         self.api_key = api_key or settings.OPENAI_API_KEY or os.environ.get("OPENAI_API_KEY")
-        self.model = model
+        self.model = model or MODEL
         if not self.api_key:
             self.logger.warning("API ключ OpenAI не найден. Некоторые функции могут быть недоступны.")
         
         # Инициализация клиента OpenAI
         try:
-            self.client = AsyncOpenAI(api_key=self.api_key)
+            # Повторы выполняет limit_concurrency: повторы SDK ждали бы, занимая место под лимитом
+            self.client = AsyncOpenAI(api_key=self.api_key, max_retries=0)
             self.logger.info("Клиент OpenAI успешно инициализирован")
         except Exception as e:
             self.logger.error(f"Ошибка при инициализации клиента OpenAI: {str(e)}")
             self.client = None
 
+    @track_llm_call
+    @cached_response
+    @limit_concurrency
     async def chat_completion(self, messages: List[Dict[str, str]], 
                             model: Optional[str] = None,
                             temperature: float = 0.9, 
-                            max_tokens: int = 16000) -> Dict[str, Any]:
+                            max_tokens: int = 16000,
+                            response_schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Отправляет запрос на генерацию текста с историей сообщений через OpenAI ChatCompletion API
 
@@ -51,6 +59,7 @@ class OpenAIWork(LLMWork):
             model: Модель для использования
             temperature: Температура генерации (0.0-1.0)
             max_tokens: Максимальное количество токенов в ответе
+            response_schema: Схема ответа; включает response_format json_schema
 
         Returns:
             Dict: Форматированный ответ от OpenAI
@@ -60,16 +69,27 @@ class OpenAIWork(LLMWork):
             return {"text": "", "error": "Клиент OpenAI не инициализирован"}
         
         if model is None:
-            model=MODEL
+            model=self.model
         self.logger.info(f"Вызов chat_completion с моделью: {model}")
+        extra_params = {}
+        if response_schema is not None:
+            extra_params["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": response_schema["name"],
+                    "schema": response_schema["schema"],
+                    "strict": True,
+                },
+            }
         try:
             response = await self.client.chat.completions.create(
                 model=model,
                 messages=messages,
                 temperature=temperature,
-                # max_tokens=max_tokens
+                max_tokens=max_tokens,
+                **extra_params
             )
-            return self.format_response(response)
+            return self._attach_structured_data(self.format_response(response), response_schema)
         except Exception as e:
             self.logger.error(f"Ошибка при выполнении chat_completion: {str(e)}")
             return {"text": "", "error": str(e)}
@@ -126,7 +146,8 @@ class OpenAIWork(LLMWork):
             for i in range(0, len(texts), batch_size):
                 batch_texts = texts[i:i+batch_size]
                 
-                response = await self.client.embeddings.create(
+                # Эмбеддинги идут мимо limit_concurrency и call_with_retry: повторяет сам SDK
+                response = await self.client.with_options(max_retries=settings.LLM_MAX_RETRIES).embeddings.create(
                     model=embedding_model,
                     input=batch_texts
                 )
@@ -140,13 +161,18 @@ class OpenAIWork(LLMWork):
             self.logger.error(f"Ошибка при получении эмбеддингов через OpenAI API: {str(e)}")
             return []
     
-    async def image_to_text(self, image_path: str, prompt: Optional[str] = None) -> str:
+    @track_llm_call
+    @cached_response
+    @limit_concurrency
+    async def image_to_text(self, image_path: Union[str, List[str]], prompt: Optional[str] = None,
+                            response_schema: Optional[Dict[str, Any]] = None) -> str:
         """
         Распознает и описывает содержимое изображения через OpenAI Vision API
 
         Args:
-            image_path: Путь к изображению
+            image_path: Путь к изображению или список путей (части одного изображения по порядку)
             prompt: Дополнительные инструкции для распознавания (если None, используется "Опиши подробно, что изображено на фото")
+            response_schema: Схема ответа; включает text.format json_schema
 
         Returns:
             str: Текстовое описание изображения
@@ -155,14 +181,22 @@ class OpenAIWork(LLMWork):
             self.logger.error("Клиент OpenAI не инициализирован")
             return "Ошибка: Клиент OpenAI не инициализирован"
         
-        if not os.path.exists(image_path):
-            self.logger.error(f"Изображение не найдено: {image_path}")
-            return f"Ошибка: Изображение не найдено: {image_path}"
+        image_paths = [image_path] if isinstance(image_path, str) else list(image_path)
+        for path in image_paths:
+            if not os.path.exists(path):
+                self.logger.error(f"Изображение не найдено: {path}")
+                return f"Ошибка: Изображение не найдено: {path}"
         
         try:
-            # Загружаем изображение и кодируем в base64
-            with open(image_path, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+            # Загружаем изображения и кодируем в base64
+            image_parts = []
+            for path in image_paths:
+                with open(path, "rb") as image_file:
+                    base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+                image_parts.append({
+                    "type": "input_image",
+                    "image_url": f"data:image/jpeg;base64,{base64_image}",
+                })
             
 
             # Подготавливаем сообщение с изображением
@@ -171,15 +205,22 @@ class OpenAIWork(LLMWork):
                     "role": "user",
                     "content": [
                         { "type": "input_text", "text": prompt or "Опиши подробно, что изображено на фото" },
-                        {
-                            "type": "input_image",
-                            "image_url": f"data:image/jpeg;base64,{base64_image}",
-                        },
+                        *image_parts,
                     ],
                 }
             ]
 
-            
+            extra_params = {}
+            if response_schema is not None:
+                extra_params["text"] = {
+                    "format": {
+                        "type": "json_schema",
+                        "name": response_schema["name"],
+                        "schema": response_schema["schema"],
+                        "strict": True,
+                    }
+                }
+
             # Отправляем запрос
             # response = await self.client.chat.completions.create(
             response = await self.client.responses.create(
@@ -187,12 +228,13 @@ class OpenAIWork(LLMWork):
                 model='gpt-4.1-nano',
                 input=content_parts,
                 # max_tokens=1000
+                **extra_params
             )
             # from pprint import pprint
             # pprint(response)
             # Извлекаем описание
             formatted_response = self.format_response(response, True)
-            return formatted_response
+            return self._attach_structured_data(formatted_response, response_schema)
             
         except Exception as e:
             self.logger.error(f"Ошибка при распознавании изображения: {str(e)}")
@@ -231,6 +273,24 @@ class OpenAIWork(LLMWork):
         except:
             return 0
     
+    def _extract_cached_tokens(self, response: Any) -> int:
+        """
+        Извлекает количество токенов запроса, взятых из кэша префиксов OpenAI
+        
+        Args:
+            response: Ответ от OpenAI API
+            
+        Returns:
+            int: Количество закэшированных токенов
+        """
+        try:
+            usage = response.usage
+            # Chat Completions API и Responses API отдают детали в разных полях
+            details = getattr(usage, "prompt_tokens_details", None) or getattr(usage, "input_tokens_details", None)
+            return details.cached_tokens or 0
+        except:
+            return 0
+    
     def _extract_finish_reason(self, response: Any) -> str:
         """
         Извлекает причину завершения генерации
@@ -0,0 +1,76 @@
+"""Кэш ответов LLM по содержимому запроса"""
+import functools
+import inspect
+import json
+import os
+from typing import Any, Callable, Dict
+
+from loguru import logger
+
+from app.core.config import settings
+from app.services.disk_cache import DiskLRUCache, file_digest
+
+# Ключ — хэш провайдера, модели и всех параметров запроса, значение — ответ
+# в формате format_response без raw_response
+llm_response_cache = DiskLRUCache(
+    os.path.join(settings.CACHE_DIR, "llm_responses.sqlite3"),
+    max_entries=settings.LLM_RESPONSE_CACHE_MAX_ENTRIES,
+    name="llm_responses",
+    ttl=settings.LLM_RESPONSE_CACHE_TTL,
+)
+
+
+def cached_response(method: Callable) -> Callable:
+    """
+    Декоратор для chat_completion / image_to_text наследников LLMWork
+
+    Если кэш включен (settings.LLM_RESPONSE_CACHE_ENABLED), ответ ищется по
+    хэшу (класс провайдера, метод, модель, все аргументы запроса); вместо пути
+    к изображению в ключ идет хэш его содержимого. В детерминированном режиме
+    температура принудительно равна 0. Ответы с ошибкой и пустым текстом
+    не кэшируются. У ответа из кэша tokens = 0 и response_cache_hit = True.
+    """
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        if not settings.LLM_RESPONSE_CACHE_ENABLED:
+            return await method(self, *args, **kwargs)
+
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        arguments: Dict[str, Any] = dict(bound.arguments)
+        arguments.pop("self", None)
+
+        if settings.LLM_RESPONSE_CACHE_DETERMINISTIC and "temperature" in arguments:
+            arguments["temperature"] = 0.0
+
+        key_arguments = dict(arguments)
+        if key_arguments.get("model") is None:
+            key_arguments["model"] = self.model
+        if "image_path" in key_arguments:
+            try:
+                image_path = key_arguments["image_path"]
+                key_arguments["image_path"] = (
+                    file_digest(image_path) if isinstance(image_path, str) else [file_digest(path) for path in image_path]
+                )
+            except OSError:
+                return await method(self, **arguments)
+
+        key = DiskLRUCache.make_key(
+            type(self).__name__,
+            method.__name__,
+            json.dumps(key_arguments, ensure_ascii=False, sort_keys=True, default=str),
+        )
+        cached = await llm_response_cache.aget(key)
+        if cached is not None:
+            logger.debug(f"Ответ {type(self).__name__}.{method.__name__} взят из кэша")
+            cached.update({"tokens": 0, "cached_tokens": 0, "raw_response": None, "response_cache_hit": True})
+            return cached
+
+        response = await method(self, **arguments)
+        if isinstance(response, dict) and response.get("text") and not response.get("error"):
+            await llm_response_cache.aset(key, {k: v for k, v in response.items() if k != "raw_response"})
+        return response
+
+    return wrapper
@@ -0,0 +1,63 @@
+"""Повтор запросов к LLM при ошибках транспорта"""
+import asyncio
+import random
+from typing import Any, Awaitable, Callable, Dict
+
+from loguru import logger
+
+from app.core.config import settings
+
+
+class LLMRequestError(Exception):
+    """Запрос к LLM не удался после всех повторов"""
+
+
+def retry_delay(attempt: int) -> float:
+    """
+    Задержка перед повтором: экспонента от базовой задержки с потолком и небольшим джиттером
+
+    Args:
+        attempt: Номер неудавшейся попытки (с 1)
+
+    Returns:
+        float: Задержка в секундах
+    """
+    delay = min(settings.LLM_RETRY_MAX_DELAY, settings.LLM_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+async def call_with_retry(call: Callable[[], Awaitable[Dict[str, Any]]], description: str = "запрос к LLM") -> Dict[str, Any]:
+    """
+    Выполняет запрос к LLM, повторяя его при ошибке транспорта
+
+    Ошибкой транспорта считается исключение или ответ с полем "error"
+    (так LLMWork сообщает о сбое запроса). Ответ, который пришел, но не
+    разобрался, ошибкой транспорта не считается и не повторяется.
+
+    Args:
+        call: Функция без аргументов, выполняющая запрос
+        description: Описание запроса для логов
+
+    Returns:
+        Dict: Ответ LLM
+
+    Raises:
+        LLMRequestError: Если все попытки (settings.LLM_MAX_RETRIES + 1) завершились ошибкой
+    """
+    attempts = max(0, settings.LLM_MAX_RETRIES) + 1
+    last_error = None
+    for attempt in range(1, attempts + 1):
+        try:
+            response = await call()
+            if not (isinstance(response, dict) and response.get("error")):
+                return response
+            last_error = response["error"]
+        except Exception as e:
+            last_error = str(e)
+
+        if attempt < attempts:
+            delay = retry_delay(attempt)
+            logger.warning(f"{description}: ошибка ({last_error}), попытка {attempt} из {attempts}, повтор через {delay:.1f} сек.")
+            await asyncio.sleep(delay)
+
+    raise LLMRequestError(f"{description}: {last_error}")
@@ -0,0 +1,137 @@
+"""JSON-схемы ответов LLM и разбор структурированного вывода"""
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+# Провайдеры принимают в режиме структурированного вывода только объект на
+# верхнем уровне, поэтому список товаров всегда лежит в поле "items".
+ITEMS_KEY = "items"
+
+
+def _items_schema(name: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Схема ответа вида {"items": [{...}, ...]}
+
+    Args:
+        name: Имя схемы (передается провайдеру)
+        fields: Поля одной записи в формате JSON Schema
+
+    Returns:
+        Dict: {"name": имя, "schema": JSON Schema}
+    """
+    return {
+        "name": name,
+        "schema": {
+            "type": "object",
+            "properties": {
+                ITEMS_KEY: {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": fields,
+                        "required": list(fields),
+                        "additionalProperties": False,
+                    },
+                }
+            },
+            "required": [ITEMS_KEY],
+            "additionalProperties": False,
+        },
+    }
+
+
+# Товары, извлеченные из документа, изображения или сообщения
+EXTRACTED_ITEMS_SCHEMA = _items_schema(
+    "extracted_items",
+    {
+        "Наименование": {"type": "string"},
+        "Количество": {"type": ["number", "string"]},
+        "Ед.изм.": {"type": "string"},
+    },
+)
+
+# Поле с номером строки исходной таблицы в товарах, извлеченных из XLSX
+SOURCE_ROW_FIELD = "Строка"
+
+# Товары, извлеченные из строк листа XLSX, с номером строки-источника
+XLSX_ITEMS_SCHEMA = _items_schema(
+    "xlsx_items",
+    {
+        **EXTRACTED_ITEMS_SCHEMA["schema"]["properties"][ITEMS_KEY]["items"]["properties"],
+        SOURCE_ROW_FIELD: {"type": "integer"},
+    },
+)
+
+# Записи таблицы ЗАЯВКА после нормализации наименований
+NORMALIZED_ITEMS_SCHEMA = _items_schema(
+    "normalized_items",
+    {
+        "Длина": {"type": "string"},
+        "Ед. изм.": {"type": "string"},
+        "Кол-во": {"type": ["number", "string"]},
+        "Наименование": {"type": "string"},
+        "Размер": {"type": "string"},
+        "Тип": {"type": "string"},
+        "Толщина": {"type": "string"},
+        "Угол": {"type": "string"},
+    },
+)
+
+
+def parse_json_text(text: str) -> Optional[Any]:
+    """
+    Разбор JSON из текста ответа модели, в том числе обернутого в ```json
+
+    Args:
+        text: Текст ответа
+
+    Returns:
+        Any: Разобранный объект или None при ошибке
+    """
+    if not text:
+        return None
+    try:
+        return json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        pass
+
+    json_match = re.search(r"```json\s*(.*?)\s*```", text, re.DOTALL)
+    candidate = json_match.group(1) if json_match else text
+    try:
+        return json.loads(candidate)
+    except (json.JSONDecodeError, TypeError, ValueError):
+        pass
+    try:
+        return json.loads(candidate.replace("'", '"'))
+    except (json.JSONDecodeError, TypeError, ValueError) as e:
+        logger.warning(f"Ошибка разбора JSON из ответа модели: {str(e)}")
+        return None
+
+
+def response_items(response: Dict[str, Any]) -> Optional[List[Any]]:
+    """
+    Список записей из ответа LLMWork
+
+    Берет разобранный структурированный вывод (поле "data"), а если его нет —
+    разбирает текст ответа. Принимает как {"items": [...]}, так и голый список.
+
+    Args:
+        response: Ответ chat_completion / image_to_text
+
+    Returns:
+        List: Записи или None, если ответ не удалось разобрать
+    """
+    if not isinstance(response, dict):
+        return None
+
+    data = response.get("data")
+    if data is None:
+        data = parse_json_text(response.get("text", ""))
+
+    if isinstance(data, dict):
+        data = data.get(ITEMS_KEY)
+    if not isinstance(data, list):
+        return None
+    return data
@@ -1,16 +1,29 @@
+import asyncio
 import base64
 import json
-import re
-from typing import Optional
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
 import uuid
 from loguru import logger
 from mistralai import Mistral
 
-from app.services.price_list_service import PriceListService
+from app.services.price_list_service import PriceListService, ItemsCallback
+from app.services.pdf_text_extractor import TextPage, extract_text_pages, page_content_hashes
+from app.services.disk_cache import DiskLRUCache, file_digest
+from app.services.batching import get_token_budget
+from app.services.page_packer import PageChunk, pack_pages
+from app.services.page_filter import PageFilter
+from app.services.image_preprocessor import merge_tile_items, preprocess_image
 
 from app.core.config import settings
+from app.core.metrics import OCR_PAGES, OCR_REQUEST_DURATION
+from app.core.executors import executors
 from app.models.document import DocumentResponse, DocumentItem, DocumentType
 from app.services.llms.llm_factory import LLMFactory
+from app.services.llms.retry import LLMRequestError, call_with_retry
+from app.services.llms.schemas import EXTRACTED_ITEMS_SCHEMA, response_items
 
 openai_llm = LLMFactory.get_instance("openai")
 llm = openai_llm
@@ -30,6 +43,30 @@ logger.add(
 )
 
 
+# Промпт извлечения товаров со страницы документа
+PAGE_EXTRACTION_PROMPT = "найди все товары и верни их в виде списка в формате json 'Наименование': наименование, 'Количество': количество, 'Ед.изм.': ед.изм."
+
+# Разметка страниц OCR по хэшу содержимого страницы
+ocr_page_cache = DiskLRUCache(
+    os.path.join(settings.CACHE_DIR, "ocr_pages.sqlite3"),
+    max_entries=settings.OCR_PAGE_CACHE_MAX_ENTRIES,
+    name="ocr_pages",
+)
+# Товары, извлеченные из разметки страницы: хэш модели, промпта и разметки -> список товаров
+page_items_cache = DiskLRUCache(
+    os.path.join(settings.CACHE_DIR, "page_items.sqlite3"),
+    max_entries=settings.OCR_PAGE_CACHE_MAX_ENTRIES,
+    name="page_items",
+)
+# Файлы, уже загруженные в Mistral: хэш содержимого -> file_id и подписанный URL
+mistral_files_cache = DiskLRUCache(
+    os.path.join(settings.CACHE_DIR, "mistral_files.sqlite3"),
+    max_entries=1000,
+    name="mistral_files",
+    ttl=settings.MISTRAL_FILE_TTL,
+)
+
+
 class OCRService:
     def __init__(self):
         self._client = Mistral(
@@ -38,6 +75,8 @@ class OCRService:
         )  # 5 минут
         self._results = {}  # Временное хранилище результатов
         self.progress_bars = {}
+        # Документы, у которых остались необработанные страницы: id -> состояние постраничной обработки
+        self._page_jobs: Dict[str, Dict[str, Any]] = {}
     
     def update_progress_bar(self, progress_bar_id: str, text: str, processed:int, total:int):
         self.progress_bars[progress_bar_id] = {
@@ -61,91 +100,123 @@ class OCRService:
             print(f"Error: {e}")
             return None
 
-    async def send_mistral_document_batch(self, pages, progress_bar_id: str = None):
-        all_text = []
-        count_pages = 0
-        self.update_progress_bar(progress_bar_id, "Получение товаров из документа ", 14, 100)
-        max_percent_is_step=90
-        now_percent_step=self.progress_bars[progress_bar_id]['processed']
-        max_percent_step=max_percent_is_step - now_percent_step
-        percent_step=round(max_percent_step/len(pages),1)
-        for page in tqdm(
-            pages, desc="Обработка страниц из документа (Mistral API)"
-        ):
-            self.update_progress_bar(progress_bar_id, "Получение товаров из документа ", percent_step*count_pages, 100)
-            if count_pages >= 20:
-                print(all_text)
-                return all_text
-            
-            # continue
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "найди все товары и верни их в виде списка в формате json 'Наименование': наименование, 'Количество': количество, 'Ед.изм.': ед.изм.",
-                        },
-                        {"type": "text", "text": page.markdown},
-                    ],
-                }
-            ]
-            # logger.debug(f"Сообщения для API: {messages}")
-            # Get the chat response
-            # chat_response = await self._client.chat.complete_async(
-            #     model="mistral-large-latest", messages=messages, max_tokens=40000
-            # )
-
-            # # Print the content of the response
-            # text = chat_response.choices[0].message.content
-
-            response = await llm.chat_completion(messages=messages)
-            text=response['text']
-            prepared_text = self.prepare_text_anserw_to_dict(text)
-            logger.debug(f"Обработанная страница: {prepared_text}")
-            if prepared_text:
-                all_text.extend(prepared_text)
-            count_pages += 1
+    async def send_mistral_document_batch(self, pages, progress_bar_id: str = None, on_items: ItemsCallback = None,
+                                          progress_range: Tuple[float, float] = (14, 90), usage: Dict[str, int] = None,
+                                          page_filter: PageFilter = None):
+        """
+        Извлечение товаров из страниц OCR
 
-        return all_text
+        Сначала PageFilter отбрасывает пустые, служебные и повторяющиеся страницы.
 
-    def prepare_text_anserw_to_dict(self, text: str) -> list:
-        """
-        Извлекает список товаров из текста, содержащего JSON-блок
+        Разметка страниц сжимается и упаковывается в запросы по бюджету токенов
+        модели (page_packer.pack_pages): страница уходит одним запросом, большие
+        таблицы делятся по строкам; страницы в одном запросе не смешиваются. Если settings.OCR_PAGE_PACKING_ENABLED
+        выключен, каждая страница уходит отдельным запросом как есть.
+        Запросы выполняются параллельно, не более settings.OCR_PAGE_CONCURRENCY
+        одновременно; товары собираются в порядке страниц. Запросы, текст
+        которых уже встречался (та же страница в этом или другом документе),
+        берутся из page_items_cache без обращения к LLM.
 
         Args:
-            text: Исходный текст с JSON-блоком
+            pages: Страницы из ответа OCR
+            progress_bar_id: ID прогресс-бара для обновления
+            on_items: Асинхронный колбэк, получающий товары каждого запроса сразу после его обработки
+            progress_range: Диапазон прогресс-бара (в процентах), который занимают эти страницы
+            usage: Словарь для накопления статистики (items_cache_hits, extraction_requests)
+            page_filter: Фильтр страниц документа (хранит отпечатки уже просмотренных страниц);
+                по умолчанию — новый фильтр только для этих страниц
 
         Returns:
-            list: Список словарей с товарами или None при ошибке
+            list: Товары со всех обработанных страниц
         """
-        try:
-            # Ищем JSON-блок между ```json и ```
-            json_match = re.search(r"```json\s*(.*?)\s*```", text, re.DOTALL)
-            
-            # Если не нашли в формате ```json```, пробуем найти просто JSON в тексте
-            if not json_match:
-                # Пробуем найти JSON-массив в тексте напрямую
-                text=text.replace("'",'"')
-                data=json.loads(text)
-                return data
-                
-            json_str = json_match.group(0) if not json_match.groups() else json_match.group(1)
-            data = json.loads(json_str)
-
-            if not isinstance(data, list):
-                raise TypeError("JSON не содержит список")
-
-            return data
-
-        except (json.JSONDecodeError, TypeError, ValueError) as e:
-            print(f"Ошибка извлечения списка: {str(e)}")
-            return None
+        page_filter = page_filter or PageFilter()
+        skipped_before = len(page_filter.skipped)
+        pages = page_filter.select(pages)
+        if len(page_filter.skipped) > skipped_before:
+            logger.info(f"Пропущены страницы без товаров: {page_filter.skipped[skipped_before:]}")
+        if settings.OCR_PAGE_PACKING_ENABLED:
+            chunks = pack_pages(pages, get_token_budget(llm.model))
+        else:
+            chunks = [PageChunk(pages=[page.index], markdown=page.markdown) for page in pages]
+        logger.debug(f"Страниц {len(pages)}, запросов извлечения товаров {len(chunks)}")
+
+        self.update_progress_bar(progress_bar_id, "Получение товаров из документа ", progress_range[0], 100)
+        max_percent_is_step=progress_range[1]
+        now_percent_step=self.progress_bars[progress_bar_id]['processed']
+        max_percent_step=max_percent_is_step - now_percent_step
+        percent_step=round(max_percent_step/max(len(chunks), 1),1)
+
+        semaphore = asyncio.Semaphore(max(1, settings.OCR_PAGE_CONCURRENCY))
+        chunk_items = [[] for _ in chunks]
+        completed = 0
+
+        async def process_chunk(index: int, chunk: PageChunk):
+            nonlocal completed
+            cache_key = DiskLRUCache.make_key(llm.model, PAGE_EXTRACTION_PROMPT, EXTRACTED_ITEMS_SCHEMA["name"], chunk.markdown)
+            prepared_text = await page_items_cache.aget(cache_key)
+            if prepared_text is not None:
+                if usage is not None:
+                    usage["items_cache_hits"] = usage.get("items_cache_hits", 0) + 1
+            else:
+                messages = [
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "text",
+                                "text": PAGE_EXTRACTION_PROMPT,
+                            },
+                            {"type": "text", "text": chunk.markdown},
+                        ],
+                    }
+                ]
+                try:
+                    async with semaphore:
+                        response = await call_with_retry(
+                            lambda: llm.chat_completion(messages=messages, response_schema=EXTRACTED_ITEMS_SCHEMA),
+                            f"Извлечение товаров со страниц {[page + 1 for page in chunk.pages]}",
+                        )
+                except LLMRequestError as e:
+                    logger.error(str(e))
+                    response = {"text": "", "error": str(e)}
+                if usage is not None:
+                    usage["extraction_requests"] = usage.get("extraction_requests", 0) + 1
+                prepared_text = response_items(response)
+                if prepared_text is not None:
+                    await page_items_cache.aset(cache_key, prepared_text)
+            logger.debug(f"Обработаны страницы {[page + 1 for page in chunk.pages]}: {prepared_text}")
+            if prepared_text:
+                chunk_items[index] = prepared_text
+                if on_items is not None:
+                    try:
+                        await on_items(prepared_text)
+                    except Exception as e:
+                        logger.warning(f"Ошибка передачи товаров страницы в колбэк: {str(e)}")
+
+            # Прогресс считаем по завершенным запросам, а не по порядку запуска
+            completed += 1
+            self.update_progress_bar(
+                progress_bar_id,
+                f"Получение товаров из документа: обработано частей {completed} из {len(chunks)}",
+                now_percent_step + percent_step*completed,
+                100,
+            )
+
+        await asyncio.gather(*(process_chunk(index, chunk) for index, chunk in enumerate(chunks)))
+
+        return [item for items in chunk_items for item in items]
 
     async def process_document(
-        self, file_path: str, original_filename: str, file_type: str = None, progress_bar_id: str = None
+        self, file_path: str, original_filename: str, file_type: str = None, progress_bar_id: str = None,
+        on_items: ItemsCallback = None, owns_file: bool = False,
     ) -> DocumentResponse:
-        """Обработка документа или изображения с использованием Mistral API"""
+        """Обработка документа или изображения с использованием Mistral API
+
+        on_items получает товары по мере готовности: для PDF — постранично,
+        для изображений — по пачкам нормализации. С owns_file=True файл
+        удаляется, когда документ обработан целиком или его остаток не
+        продолжали дольше settings.OCR_PAGE_JOB_TTL.
+        """
         # try:
         # Определяем расширение файла, если тип не передан явно
         if not file_type:
@@ -159,82 +230,317 @@ class OCRService:
         self.update_progress_bar(progress_bar_id, "Обработка документа", 10, 100)
         # Обработка в зависимости от типа файла
         if file_type == DocumentType.IMAGE:
-            return await self.process_image(file_path, original_filename, progress_bar_id)
+            return await self.process_image(file_path, original_filename, progress_bar_id, on_items)
+
+        # Иначе обрабатываем как документ. Файл загружается в Mistral только
+        # если на страницах окна нет пригодного текстового слоя
+        self._expire_page_jobs()
+        document_id = uuid.uuid4().hex
+        self._page_jobs[document_id] = {
+            "file_path": file_path,
+            "owns_file": owns_file,
+            "touched_at": time.time(),
+            "file_id": None,
+            "original_filename": original_filename,
+            "next_page": 0,
+            "processed_pages": 0,
+            "text_layer_pages": 0,
+            "ocr_pages": 0,
+            "total_pages": await executors.run_io(self._count_pdf_pages, file_path),
+            "content_hash": await executors.run_io(file_digest, file_path),
+            "ocr_cache_pages": 0,
+            "items_cache_hits": 0,
+            "extraction_requests": 0,
+            "page_filter": PageFilter(),
+        }
+        products = await self._process_page_windows(document_id, progress_bar_id, on_items)
+        return self._store_document_result(document_id, products, progress_bar_id)
 
-        # Иначе обрабатываем как документ
-        # Загрузка файла в Mistral
-        self.update_progress_bar(progress_bar_id, "Загрузка файла в Mistral", 11, 100)
-        
-        
-        uploaded_file = await self._client.files.upload_async(
-            file={
-                "file_name": original_filename,
-                "content": open(file_path, "rb"),
-            },
-            purpose="ocr",
-        )
-        logger.debug(f"Загруженный файл: {uploaded_file}")
-        self.update_progress_bar(progress_bar_id, "Получение подписанного URL для доступа к файлу", 12, 100)
-        #
-        # 
+    async def continue_document(
+        self, document_id: str, progress_bar_id: str = None, on_items: ItemsCallback = None
+    ) -> Optional[DocumentResponse]:
+        """
+        Обработка следующей порции страниц документа, не поместившегося в бюджет
+
+        Новые товары добавляются к уже сохраненному результату документа.
+
+        Args:
+            document_id: ID документа из process_document
+            progress_bar_id: ID прогресс-бара для обновления
+            on_items: Асинхронный колбэк для товаров каждой страницы
+
+        Returns:
+            DocumentResponse: Обновленный результат или None, если необработанных страниц нет
+        """
+        self._expire_page_jobs()
+        if document_id not in self._page_jobs:
+            return None
+        self.update_progress_bar(progress_bar_id, "Продолжение обработки документа", 10, 100)
+        products = await self._process_page_windows(document_id, progress_bar_id, on_items)
+        return self._store_document_result(document_id, products, progress_bar_id)
+
+    def _expire_page_jobs(self) -> None:
+        """Удаление остатков документов, которые не продолжали дольше settings.OCR_PAGE_JOB_TTL"""
+        deadline = time.time() - settings.OCR_PAGE_JOB_TTL
+        for document_id, job in list(self._page_jobs.items()):
+            if job["touched_at"] < deadline:
+                logger.info(f"Документ {document_id}: продолжение не запрошено, необработанные страницы с {job['next_page'] + 1} отброшены")
+                self._drop_page_job(document_id)
+
+    def _drop_page_job(self, document_id: str) -> None:
+        """Удаление состояния постраничной обработки и файла документа, если он принадлежит задаче"""
+        job = self._page_jobs.pop(document_id)
+        if job["owns_file"]:
+            try:
+                os.remove(job["file_path"])
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _count_pdf_pages(file_path: str) -> Optional[int]:
+        """Количество страниц PDF или None, если его не удалось определить"""
+        try:
+            import fitz
+
+            with fitz.open(file_path) as pdf:
+                return pdf.page_count
+        except Exception as e:
+            logger.warning(f"Не удалось определить количество страниц {file_path}: {str(e)}")
+            return None
+
+    async def _get_signed_url(self, job: Dict[str, Any], progress_bar_id: str = None) -> str:
+        """
+        Подписанный URL файла задачи в Mistral; файл загружается при первом обращении
+
+        Файл с тем же содержимым повторно не загружается: file_id и подписанный
+        URL берутся из mistral_files_cache, пока URL действителен.
+
+        Args:
+            job: Состояние постраничной обработки документа
+            progress_bar_id: ID прогресс-бара для обновления
+
+        Returns:
+            str: URL для OCR
+        """
+        cached = await mistral_files_cache.aget(job["content_hash"])
+        if cached is not None:
+            if job["file_id"] is None:
+                job["file_id"] = cached["file_id"]
+            # Запас в 10 минут, чтобы URL не истек во время OCR
+            if cached["file_id"] == job["file_id"] and cached["url_expires_at"] > time.time() + 600:
+                logger.debug(f"Файл {job['original_filename']} уже загружен в Mistral ({job['file_id']}), URL переиспользован")
+                return cached["url"]
+
+        if job["file_id"] is not None:
+            try:
+                return await self._sign_file_url(job)
+            except Exception as e:
+                # Файл мог быть удален в Mistral — загружаем заново
+                logger.warning(f"Не удалось получить URL для файла {job['file_id']}: {str(e)}")
+                await executors.run_io(mistral_files_cache.delete, job["content_hash"])
+                job["file_id"] = None
+
+        if job["file_id"] is None:
+            # Загрузка файла в Mistral
+            self.update_progress_bar(progress_bar_id, "Загрузка файла в Mistral", self.progress_bars.get(progress_bar_id, {}).get("processed", 11), 100)
+            uploaded_file = await self._client.files.upload_async(
+                file={
+                    "file_name": job["original_filename"],
+                    "content": open(job["file_path"], "rb"),
+                },
+                purpose="ocr",
+            )
+            logger.debug(f"Загруженный файл: {uploaded_file}")
+            job["file_id"] = uploaded_file.id
+
+        return await self._sign_file_url(job)
+
+    async def _sign_file_url(self, job: Dict[str, Any]) -> str:
+        """Получение подписанного URL для файла задачи с сохранением в mistral_files_cache"""
+        expiry_hours = settings.MISTRAL_SIGNED_URL_EXPIRY_HOURS
         #  Получение подписанного URL для доступа к файлу
         signed_url = await self._client.files.get_signed_url_async(
-            file_id=uploaded_file.id
+            file_id=job["file_id"], expiry=expiry_hours
         )
         logger.debug(f"Подписанный URL: {signed_url}")
-        
-        
-        self.update_progress_bar(progress_bar_id, "Обработка документа через OCR", 13, 100)
-        # Обработка документа через OCR
-        ocr_response = await self._client.ocr.process_async(
-            model="mistral-ocr-latest",
-            document={
-                "type": "document_url",
-                "document_url": signed_url.url,
-            },
-            # include_image_base64=True
+        await mistral_files_cache.aset(job["content_hash"], {
+            "file_id": job["file_id"],
+            "url": signed_url.url,
+            "url_expires_at": time.time() + expiry_hours * 3600,
+        })
+        return signed_url.url
+
+    async def _process_page_windows(
+        self, document_id: str, progress_bar_id: str = None, on_items: ItemsCallback = None
+    ) -> List[Dict[str, Any]]:
+        """
+        OCR и извлечение товаров окнами по settings.OCR_PAGE_WINDOW страниц
+
+        Страницы с пригодным текстовым слоем читаются локально (PyMuPDF),
+        в Mistral OCR уходят только остальные страницы окна. За один вызов обрабатывается не больше settings.OCR_PAGE_BUDGET страниц,
+        начиная с next_page задачи. В памяти одновременно держится только
+        разметка одного окна. После вызова next_page указывает на первую
+        необработанную страницу или равен None, если документ обработан целиком.
+
+        Args:
+            document_id: ID документа
+            progress_bar_id: ID прогресс-бара для обновления
+            on_items: Асинхронный колбэк для товаров каждой страницы
+
+        Returns:
+            list: Товары с обработанных страниц
+        """
+        job = self._page_jobs[document_id]
+        job["touched_at"] = time.time()
+        signed_url = None
+
+        start = job["next_page"]
+        total_pages = job["total_pages"]
+        budget_end = start + max(1, settings.OCR_PAGE_BUDGET)
+        if total_pages is not None:
+            budget_end = min(budget_end, total_pages)
+        window = max(1, settings.OCR_PAGE_WINDOW)
+        windows_count = max(1, -(-(budget_end - start) // window))
+        progress_step = (90 - 13) / windows_count
+
+        products = []
+        window_index = 0
+        while start is not None and start < budget_end:
+            end = min(start + window, budget_end)
+            progress_start = 13 + progress_step * window_index
+            self.update_progress_bar(
+                progress_bar_id, f"Чтение текста документа: страницы {start + 1}-{end}", progress_start, 100
+            )
+            window_indices = list(range(start, end))
+            text_pages = await executors.run_cpu(extract_text_pages, job["file_path"], window_indices)
+            ocr_indices = [index for index in window_indices if index not in text_pages]
+            pages = list(text_pages.values())
+            job["text_layer_pages"] += len(text_pages)
+
+            # Страницы, которые уже распознавались (в этом или другом документе)
+            page_hashes = {}
+            if ocr_indices:
+                page_hashes = await executors.run_cpu(page_content_hashes, job["file_path"], ocr_indices)
+            for index in list(ocr_indices):
+                if index not in page_hashes:
+                    continue
+                markdown = await ocr_page_cache.aget(page_hashes[index])
+                if markdown is not None:
+                    pages.append(TextPage(index=index, markdown=markdown, source="ocr_cache"))
+                    ocr_indices.remove(index)
+                    job["ocr_cache_pages"] += 1
+
+            received_ocr_pages = 0
+            if ocr_indices:
+                if signed_url is None:
+                    signed_url = await self._get_signed_url(job, progress_bar_id)
+                self.update_progress_bar(
+                    progress_bar_id, f"Обработка документа через OCR: страниц {len(ocr_indices)} из {len(window_indices)}", progress_start, 100
+                )
+                # Обработка страниц без текстового слоя через OCR
+                with OCR_REQUEST_DURATION.time():
+                    ocr_response = await self._client.ocr.process_async(
+                        model="mistral-ocr-latest",
+                        document={
+                            "type": "document_url",
+                            "document_url": signed_url,
+                        },
+                        pages=ocr_indices,
+                        # include_image_base64=True
+                    )
+                received_ocr_pages = len(ocr_response.pages)
+                OCR_PAGES.inc(received_ocr_pages)
+                for page in ocr_response.pages:
+                    if page.index in page_hashes:
+                        await ocr_page_cache.aset(page_hashes[page.index], page.markdown)
+                job["ocr_pages"] += received_ocr_pages
+                pages.extend(ocr_response.pages)
+            pages.sort(key=lambda page: page.index)
+            job["processed_pages"] += len(pages)
+            logger.debug(f"Страницы {start + 1}-{end}: из текстового слоя {len(text_pages)}, через OCR {received_ocr_pages}, из кэша OCR {len(pages) - len(text_pages) - received_ocr_pages}")
+
+            products.extend(await self.send_mistral_document_batch(
+                pages, progress_bar_id, on_items,
+                progress_range=(progress_start + 1, progress_start + progress_step),
+                usage=job,
+                page_filter=job["page_filter"],
+            ))
+
+            if total_pages is None and received_ocr_pages < len(ocr_indices):
+                # Количество страниц неизвестно: короткое окно означает конец документа
+                start = None
+            else:
+                start = end
+            window_index += 1
+
+        if start is not None and total_pages is not None and start >= total_pages:
+            start = None
+        job["next_page"] = start
+        if start is not None:
+            logger.info(f"Документ {document_id}: достигнут бюджет страниц, продолжение со страницы {start + 1}")
+        return products
+
+    def _store_document_result(
+        self, document_id: str, products: List[Dict[str, Any]], progress_bar_id: str = None
+    ) -> DocumentResponse:
+        """
+        Сохранение результата постраничной обработки документа
+
+        Товары добавляются к ранее сохраненному результату документа (если он есть).
+        Пока остаются необработанные страницы, статус результата — "partial",
+        а в stats["pages"] указано, с какой страницы продолжать.
+        """
+        job = self._page_jobs[document_id]
+        previous = self._results.get(document_id)
+        items = list(previous.items) if previous else []
+        items.extend(
+            DocumentItem(
+                text=item
+                if isinstance(item, str)
+                else json.dumps(item, ensure_ascii=False)
+            )
+            for item in products
         )
 
-        logger.debug(f"Обработанный документ: {ocr_response}")
-        self.update_progress_bar(progress_bar_id, "Обработка страниц из документа (Mistral API)", 14, 100)
-        all_texts = await self.send_mistral_document_batch(ocr_response.pages)
-        products = all_texts
-        print(products)
-        # for text in all_texts:
-        #     try:
-        #         # Пытаемся распарсить JSON
-        #      products = self.prepare_text_anserw_to_dict(text)
-        #     except json.JSONDecodeError as e:
-        #         # Если не удалось распарсить JSON, возвращаем текст как есть
-        #         logger.warning(f"Не удалось распарсить JSON: {str(e)}, возвращаем текст как есть")
-        #         # Создаем простой формат для отображения
-        #         continue
-        #         # products = [{"Наименование": text, "Количество": "", "Ед.изм.": ""}]
+        next_page = job["next_page"]
+        stats = dict(self.progress_bars.get(progress_bar_id, {}).get("stats") or {})
+        stats["pages"] = {
+            "processed": job["processed_pages"],
+            "text_layer": job["text_layer_pages"],
+            "ocr": job["ocr_pages"],
+            "ocr_cache": job["ocr_cache_pages"],
+            "items_cache": job["items_cache_hits"],
+            "extraction_requests": job["extraction_requests"],
+            "skipped": job["page_filter"].skipped,
+            "total": job["total_pages"],
+            "next_page": next_page,
+        }
 
         document_response = DocumentResponse(
-            id=uploaded_file.id,
-            original_filename=original_filename,
-            items=[
-                DocumentItem(
-                    text=item
-                    if isinstance(item, str)
-                    else json.dumps(item, ensure_ascii=False)
-                )
-                for item in products
-            ],
+            id=document_id,
+            original_filename=job["original_filename"],
+            items=items,
+            status="partial" if next_page is not None else "completed",
+            stats=stats,
         )
 
         # Сохранение результата
-        self._results[uploaded_file.id] = document_response
+        self._results[document_id] = document_response
+        job["touched_at"] = time.time()
+        if next_page is None:
+            self._drop_page_job(document_id)
+        if progress_bar_id in self.progress_bars:
+            self.update_progress_bar(
+                progress_bar_id,
+                "Обработка завершена" if next_page is None else f"Обработана часть документа, продолжение со страницы {next_page + 1}",
+                100, 100,
+            )
 
         return document_response
 
-        # except Exception as e:
-        #     logger.error(f"Ошибка при обработке документа {original_filename}: {str(e)}")
-        #     raise
-
     async def process_image(
-        self, file_path: str, original_filename: str, progress_bar_id: str = None
+        self, file_path: str, original_filename: str, progress_bar_id: str = None,
+        on_items: ItemsCallback = None,
     ) -> DocumentResponse:
         """Обработка изображения с использованием Mistral API"""
         self.update_progress_bar(progress_bar_id, "Загрузка изображения в Mistral", 10, 100)
@@ -273,15 +579,54 @@ class OCRService:
         # # Print the content of the response
         # products = chat_response.choices[0].message.content
         prompt="найди все позиции и верни их в виде списка в формате json 'Наименование': наименование, 'Количество': количество, 'Ед.изм.': ед.изм. даже если это 1 элемент то верни 1 элемент"
-        response = await llm.image_to_text(file_path, prompt)
-        text=response['text']
+        semaphore = asyncio.Semaphore(max(1, settings.OCR_PAGE_CONCURRENCY))
 
+        tile_prompt = prompt + ". Это горизонтальная полоса большого изображения: строки, обрезанные верхним или нижним краем полосы, не включай"
+        parts_prompt = (
+            tile_prompt + ". Полоса передана несколькими частями слева направо с перекрытием: "
+            "собери каждую строку таблицы из всех частей и не повторяй позиции из перекрытия"
+        )
 
-        logger.debug(f"Полученный ответ от API: {text}")
-        products = self.prepare_text_anserw_to_dict(text)
+        async def recognize(image_paths: List[str], is_tile: bool) -> list:
+            if len(image_paths) > 1:
+                request_prompt = parts_prompt
+            else:
+                request_prompt = tile_prompt if is_tile else prompt
+            try:
+                async with semaphore:
+                    response = await call_with_retry(
+                        lambda: llm.image_to_text(
+                            image_paths[0] if len(image_paths) == 1 else image_paths,
+                            request_prompt,
+                            response_schema=EXTRACTED_ITEMS_SCHEMA,
+                        ),
+                        f"Распознавание изображения {os.path.basename(image_paths[0])}",
+                    )
+            except LLMRequestError as e:
+                logger.error(str(e))
+                response = {"text": "", "error": str(e)}
+            logger.debug(f"Полученный ответ от API: {response.get('text') if isinstance(response, dict) else response}")
+            return response_items(response) or []
+
+        # Поворот, уменьшение и сжатие изображения; многостраничный TIFF — по странице за запрос,
+        # очень большие страницы — перекрывающимися полосами, все запросы параллельно
+        with tempfile.TemporaryDirectory(prefix="prepared_") as prepared_dir:
+            try:
+                pages = await executors.run_cpu(preprocess_image, file_path, prepared_dir)
+            except ValueError as e:
+                self.update_progress_bar(progress_bar_id, f"Ошибка: {str(e)}", 100, 100)
+                raise
+            tile_products = await asyncio.gather(*(
+                recognize(tile.paths, len(tiles) > 1) for tiles in pages for tile in tiles
+            ))
+        products = []
+        offset = 0
+        for tiles in pages:
+            products.extend(merge_tile_items(tiles, tile_products[offset:offset + len(tiles)]))
+            offset += len(tiles)
         
         price_list_service = PriceListService()
-        products = await price_list_service.find_matching_items(products, self.progress_bars, progress_bar_id)
+        products = await price_list_service.find_matching_items(products, self.progress_bars, progress_bar_id, on_items)
 
             
         documentID_UUID=uuid.uuid4().hex
@@ -296,6 +641,7 @@ class OCRService:
             )
             for item in products
             ],
+        stats=self.progress_bars.get(progress_bar_id, {}).get("stats"),
         )
 
         # Сохранение результата
@@ -0,0 +1,126 @@
+"""Локальный отбор страниц документа перед извлечением товаров через LLM"""
+import hashlib
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.line_parser import RECT_SIZE_RE, ROUND_SIZE_RE
+from app.services.page_packer import minify_markdown
+
+# Основы слов, по которым страница считается похожей на спецификацию
+PRODUCT_KEYWORDS = (
+    "воздуховод", "труба", "отвод", "заглушк", "тройник", "врезк", "переход", "ниппел",
+    "дроссел", "дефлектор", "шумоглушител", "клапан", "диффузор", "решетк", "решётк",
+    "пенофол", "скотч", "вентилятор", "кондиционер", "фильтр", "изоляци", "хомут",
+    "наименование", "кол-во", "количество", "ед. изм", "ед.изм",
+)
+
+# Количество с единицей измерения: "12 шт", "4,5 м", "10 п.м", в таблице — "12|шт"
+QUANTITY_RE = re.compile(r"(?<![\w.,])\d+(?:[.,]\d+)?\s*\|?\s*(?:шт|п\.?\s?м|м\.?\s?п|пм|м2|м²|кг|компл|м)(?![а-яa-z])")
+NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)?")
+WORD_RE = re.compile(r"\w+")
+
+
+def _simhash(text: str) -> int:
+    """64-битный simhash по тройкам соседних слов"""
+    words = WORD_RE.findall(text)
+    shingles = [" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))]
+    weights = [0] * 64
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+@dataclass
+class _Fingerprint:
+    page: int
+    digest: str
+    simhash: int
+    numbers: Tuple[str, ...]
+
+
+@dataclass
+class PageFilter:
+    """
+    Отбор страниц документа без обращения к LLM
+
+    Пропускаются страницы:
+    - blank — почти без текста (меньше settings.PAGE_FILTER_MIN_CHARS букв и цифр);
+    - duplicate — повтор уже встречавшейся страницы: тот же текст или почти тот
+      же (simhash отличается не больше чем на settings.PAGE_FILTER_SIMHASH_DISTANCE
+      бит) с теми же числами — так отличие только в шуме OCR, а не в количествах;
+    - no_products — без признаков товаров (названия изделий, заголовки
+      "Наименование"/"Кол-во", размеры, количество с единицами): титульные
+      листы, штампы и листы согласования, в том числе оформленные таблицей.
+
+    Экземпляр хранит отпечатки просмотренных страниц, поэтому один фильтр
+    используется для всех окон и продолжений одного документа.
+    """
+
+    fingerprints: List[_Fingerprint] = field(default_factory=list)
+    skipped: List[Dict[str, object]] = field(default_factory=list)
+
+    def check(self, index: int, markdown: str) -> Optional[str]:
+        """
+        Причина пропуска страницы или None, если страницу нужно обработать
+
+        Args:
+            index: Номер страницы (с 0)
+            markdown: Разметка страницы
+
+        Returns:
+            str: blank, duplicate или no_products; None — страница нужна
+        """
+        text = minify_markdown(markdown or "").lower()
+        if sum(1 for char in text if char.isalnum()) < settings.PAGE_FILTER_MIN_CHARS:
+            return "blank"
+
+        fingerprint = _Fingerprint(
+            page=index,
+            digest=hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest(),
+            simhash=_simhash(text),
+            numbers=tuple(sorted(NUMBER_RE.findall(text))),
+        )
+        for seen in self.fingerprints:
+            if seen.digest == fingerprint.digest or (
+                seen.numbers == fingerprint.numbers
+                and bin(seen.simhash ^ fingerprint.simhash).count("1") <= settings.PAGE_FILTER_SIMHASH_DISTANCE
+            ):
+                return "duplicate"
+        self.fingerprints.append(fingerprint)
+
+        signals = (
+            sum(text.count(keyword) for keyword in PRODUCT_KEYWORDS)
+            + len(QUANTITY_RE.findall(text))
+            + len(RECT_SIZE_RE.findall(text))
+            + len(ROUND_SIZE_RE.findall(text))
+        )
+        if signals == 0:
+            return "no_products"
+        return None
+
+    def select(self, pages) -> list:
+        """
+        Страницы, которые нужно отправить на извлечение товаров
+
+        Пропущенные страницы добавляются в skipped как {"page": номер с 1, "reason": причина}.
+
+        Args:
+            pages: Страницы с полями index и markdown
+
+        Returns:
+            list: Оставшиеся страницы в исходном порядке
+        """
+        if not settings.PAGE_FILTER_ENABLED:
+            return list(pages)
+        kept = []
+        for page in pages:
+            reason = self.check(page.index, page.markdown)
+            if reason is None:
+                kept.append(page)
+            else:
+                self.skipped.append({"page": page.index + 1, "reason": reason})
+        return kept
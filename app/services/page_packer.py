@@ -0,0 +1,189 @@
+"""Сжатие разметки страниц и упаковка страниц в запросы извлечения товаров"""
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.services.batching import estimate_tokens, pack_batches
+
+# Оценка токенов ответа на одну позицию сверх длины ее строки (ключи JSON, кавычки)
+EXTRACTED_ITEM_TOKENS = 20
+
+# Заголовки столбцов с порядковым номером строки — для извлечения товаров они не нужны
+ROW_NUMBER_HEADERS = {"№", "n", "no", "#", "п/п", "№п/п", "№ п/п", "n п/п", "№ пп", "№пп"}
+
+_SEPARATOR_CELL = re.compile(r"^:?-{2,}:?$")
+_IMAGE_REF = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_HTML_BREAK = re.compile(r"<br\s*/?>", re.IGNORECASE)
+_SPACES = re.compile(r"[ \t ]+")
+
+
+def _clean(text: str) -> str:
+    """Схлопывает пробелы и переносы внутри ячейки или строки текста"""
+    return _SPACES.sub(" ", _HTML_BREAK.sub(" ", text)).strip()
+
+
+def _split_row(line: str) -> List[str]:
+    """Ячейки строки markdown-таблицы"""
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|"):
+        line = line[:-1]
+    return [_clean(cell) for cell in line.split("|")]
+
+
+def _is_row_number_column(header: str, values: List[str]) -> bool:
+    """Столбец "№ п/п": заголовок номера строки и только целые числа в ячейках"""
+    if header.lower().rstrip(".") not in ROW_NUMBER_HEADERS:
+        return False
+    return all(value.rstrip(".").isdigit() for value in values if value)
+
+
+def _minify_table(lines: List[str]) -> List[List[str]]:
+    """
+    Строки таблицы без разделителя заголовка, пустых строк и лишних столбцов
+
+    Удаляются столбцы без значений (заголовок не считается: столбец с
+    заголовком, но пустыми ячейками тоже удаляется) и столбцы с номером строки.
+
+    Returns:
+        List: Строки таблицы как списки ячеек; первая строка — заголовок
+    """
+    rows = [_split_row(line) for line in lines]
+    rows = [
+        row for row in rows
+        if any(row) and not all(_SEPARATOR_CELL.match(cell) for cell in row if cell)
+    ]
+    if not rows:
+        return []
+
+    width = max(len(row) for row in rows)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    # Таблица из одного заголовка сохраняется как есть
+    values = rows[1:] or rows
+    keep = [
+        column for column in range(width)
+        if any(row[column] for row in values)
+        and not _is_row_number_column(rows[0][column], [row[column] for row in rows[1:]])
+    ]
+    return [[row[column] for column in keep] for row in rows if any(row[column] for column in keep)]
+
+
+@dataclass
+class _Block:
+    """Часть страницы: абзац текста (header is None) или строка таблицы со своим заголовком"""
+
+    page: int
+    text: str
+    header: Optional[str] = None
+
+
+def _page_blocks(page_index: int, markdown: str) -> List[_Block]:
+    """Разбиение разметки страницы на абзацы и строки таблиц в сжатом виде"""
+    blocks: List[_Block] = []
+    paragraph: List[str] = []
+    table: List[str] = []
+
+    def flush_paragraph():
+        text = " ".join(paragraph).strip()
+        if text:
+            blocks.append(_Block(page_index, text))
+        paragraph.clear()
+
+    def flush_table():
+        rows = _minify_table(table)
+        if rows:
+            header = "|".join(rows[0])
+            if len(rows) == 1:
+                blocks.append(_Block(page_index, header))
+            for row in rows[1:]:
+                blocks.append(_Block(page_index, "|".join(row), header))
+        table.clear()
+
+    for line in _IMAGE_REF.sub("", markdown).splitlines():
+        if line.lstrip().startswith("|"):
+            flush_paragraph()
+            table.append(line)
+            continue
+        flush_table()
+        line = _clean(line)
+        if line:
+            paragraph.append(line)
+        else:
+            flush_paragraph()
+    flush_paragraph()
+    flush_table()
+    return blocks
+
+
+def minify_markdown(markdown: str) -> str:
+    """
+    Сжатая разметка страницы для запроса к LLM
+
+    Убирает выравнивающие пробелы и разделитель заголовка таблиц, столбцы
+    без значений и нумерационные столбцы, ссылки на изображения и пустые строки. Строки
+    таблицы записываются как "a|b|c".
+
+    Args:
+        markdown: Разметка страницы (OCR или текстовый слой)
+
+    Returns:
+        str: Сжатая разметка
+    """
+    return _render_blocks(_page_blocks(0, markdown))
+
+
+def _render_blocks(blocks: Iterable[_Block]) -> str:
+    """Текст запроса из блоков; заголовок таблицы повторяется в начале каждой части"""
+    parts: List[str] = []
+    current_header: Optional[Tuple[int, str]] = None
+    for block in blocks:
+        if block.header is None:
+            current_header = None
+        elif current_header != (block.page, block.header):
+            current_header = (block.page, block.header)
+            parts.append(block.header)
+        parts.append(block.text)
+    return "\n".join(parts)
+
+
+@dataclass
+class PageChunk:
+    """Текст одного запроса извлечения товаров и страницы, из которых он собран"""
+
+    pages: List[int]
+    markdown: str
+    blocks: int = 0
+
+
+def pack_pages(pages, budget: Dict[str, int]) -> List[PageChunk]:
+    """
+    Упаковка страниц в запросы извлечения товаров по бюджету токенов
+
+    Разметка каждой страницы сжимается (minify_markdown), делится на абзацы и
+    строки таблиц и жадно собирается в запросы через pack_batches: страница
+    целиком или, если не помещается, части с повтором заголовка таблицы.
+    Запрос не смешивает страницы: тогда его текст зависит только от своей
+    страницы, и кэш извлеченных товаров после правки документа промахивается
+    только на измененных страницах. Порядок страниц и строк сохраняется.
+
+    Args:
+        pages: Страницы с полями index и markdown, в порядке документа
+        budget: Бюджет из get_token_budget
+
+    Returns:
+        List: Запросы в порядке документа
+    """
+    def input_tokens(block: _Block) -> int:
+        # Заголовок таблицы может повториться в начале запроса
+        return estimate_tokens(block.text) + (estimate_tokens(block.header) if block.header else 0)
+
+    def output_tokens(block: _Block) -> int:
+        return EXTRACTED_ITEM_TOKENS + estimate_tokens(block.text) if block.header else estimate_tokens(block.text)
+
+    chunks = []
+    for page in pages:
+        blocks = _page_blocks(page.index, page.markdown or "")
+        for batch in pack_batches(blocks, input_tokens, output_tokens, budget):
+            chunks.append(PageChunk(pages=[page.index], markdown=_render_blocks(batch), blocks=len(batch)))
+    return chunks
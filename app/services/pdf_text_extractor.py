@@ -0,0 +1,144 @@
+"""Извлечение текстового слоя PDF локально через PyMuPDF"""
+import hashlib
+from dataclasses import dataclass
+from typing import Dict, Iterable
+
+from loguru import logger
+
+from app.core.config import settings
+
+try:
+    import pymupdf
+except ImportError:  # pragma: no cover - pymupdf есть в зависимостях проекта
+    pymupdf = None
+
+
+@dataclass
+class TextPage:
+    """
+    Страница с текстом, полученным без OCR
+
+    Повторяет поля страницы из ответа Mistral OCR, которые используются
+    при извлечении товаров (index, markdown).
+    """
+
+    index: int
+    markdown: str
+    source: str = "text_layer"
+
+
+def is_usable_text(text: str) -> bool:
+    """
+    Достаточно ли на странице нормального текста, чтобы не отправлять ее в OCR
+
+    Отсекаются страницы-сканы (текста нет или почти нет) и страницы со
+    шрифтами без таблицы Unicode, которые дают "(cid:NN)" и символы замены.
+
+    Args:
+        text: Текст страницы
+
+    Returns:
+        bool: True, если текст можно использовать вместо OCR
+    """
+    meaningful = sum(1 for char in text if char.isalnum())
+    if meaningful < settings.PDF_TEXT_MIN_CHARS:
+        return False
+    garbage = text.count("\ufffd") + text.count("(cid:") * 5
+    return garbage / max(meaningful, 1) < 0.05
+
+
+def _page_markdown(page) -> str:
+    """
+    Текст страницы: обычные блоки плюс таблицы в markdown
+
+    Блоки текста, попадающие в найденные таблицы, не дублируются.
+    """
+    tables = []
+    try:
+        tables = page.find_tables().tables
+    except Exception as e:
+        logger.debug(f"Поиск таблиц на странице {page.number + 1} не удался: {str(e)}")
+
+    table_rects = [pymupdf.Rect(table.bbox) for table in tables]
+    blocks = [
+        block[4].strip()
+        for block in page.get_text("blocks", sort=True)
+        if block[6] == 0 and not any(pymupdf.Rect(block[:4]).intersects(rect) for rect in table_rects)
+    ]
+    parts = [block for block in blocks if block]
+    for table in tables:
+        try:
+            parts.append(table.to_markdown())
+        except Exception as e:
+            logger.debug(f"Не удалось преобразовать таблицу страницы {page.number + 1}: {str(e)}")
+    return "\n\n".join(parts)
+
+
+def page_content_hashes(file_path: str, page_indices: Iterable[int]) -> Dict[int, str]:
+    """
+    Хэши содержимого страниц PDF
+
+    В хэш входят размер и поворот страницы, ее потоки содержимого, потоки
+    Form XObject (в том числе вложенных), в которых часто лежит все
+    содержимое страницы, и сырые данные изображений. Одинаковые страницы в
+    разных (в том числе исправленных) версиях документа дают одинаковый хэш.
+
+    Args:
+        file_path: Путь к PDF
+        page_indices: Номера страниц (с 0)
+
+    Returns:
+        Dict: Номер страницы -> sha256; пустой, если PDF не удалось прочитать
+    """
+    if pymupdf is None:
+        return {}
+
+    hashes = {}
+    try:
+        with pymupdf.open(file_path) as pdf:
+            for index in page_indices:
+                if index >= pdf.page_count:
+                    break
+                page = pdf[index]
+                digest = hashlib.sha256(f"{tuple(page.rect)}|{page.rotation}".encode("utf-8"))
+                for xref in page.get_contents():
+                    digest.update(pdf.xref_stream_raw(xref) or b"")
+                for xobject in page.get_xobjects():
+                    digest.update(f"|form:{xobject[1]}|".encode("utf-8"))
+                    digest.update(pdf.xref_stream_raw(xobject[0]) or b"")
+                for image in page.get_images(full=True):
+                    digest.update(pdf.xref_stream_raw(image[0]) or b"")
+                hashes[index] = digest.hexdigest()
+    except Exception as e:
+        logger.warning(f"Не удалось вычислить хэши страниц {file_path}: {str(e)}")
+        return {}
+    return hashes
+
+
+def extract_text_pages(file_path: str, page_indices: Iterable[int]) -> Dict[int, TextPage]:
+    """
+    Извлекает текстовый слой указанных страниц PDF
+
+    Args:
+        file_path: Путь к PDF
+        page_indices: Номера страниц (с 0)
+
+    Returns:
+        Dict: Номер страницы -> TextPage для страниц с пригодным текстом;
+        страниц без текста (сканов) в результате нет
+    """
+    if pymupdf is None or not settings.PDF_TEXT_LAYER_ENABLED:
+        return {}
+
+    pages = {}
+    try:
+        with pymupdf.open(file_path) as pdf:
+            for index in page_indices:
+                if index >= pdf.page_count:
+                    break
+                markdown = _page_markdown(pdf[index])
+                if is_usable_text(markdown):
+                    pages[index] = TextPage(index=index, markdown=markdown)
+    except Exception as e:
+        logger.warning(f"Не удалось прочитать текстовый слой {file_path}: {str(e)}")
+    return pages
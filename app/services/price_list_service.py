@@ -1,12 +1,12 @@
 """Сервис для работы с прайс-листами и векторной базой данных ChromaDB"""
-import re
+import asyncio
 # from price_validator_service import PriceValidatorService
 from pprint import pprint
 import json
 import traceback
 import uuid
 import pandas as pd
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Awaitable, Callable, Optional
 import chromadb
 from chromadb.config import Settings as ChromaSettings
 from loguru import logger
@@ -16,13 +16,41 @@ from mistralai import Mistral
 from datetime import datetime
 
 from app.core.config import settings
+from app.core.metrics import CHROMA_OPERATION_DURATION, POSTPROCESS_DURATION, POSTPROCESS_RECORDS
 from app.models.document import PriceListResponse
 import math
 from app.services.llms.llm_factory import LLMFactory
+from app.services.disk_cache import DiskLRUCache
+from app.services.rules_service import rules_service
+from app.services.line_parser import parse_item_line
+from app.services.llms.schemas import NORMALIZED_ITEMS_SCHEMA, response_items
+from app.services.llms.retry import LLMRequestError, call_with_retry
+from app.services.batching import estimate_tokens, get_token_budget, pack_batches
+from app.services.excel_readers import read_excel_price_list
+from app.core.executors import executors
 
 openai_llm = LLMFactory.get_instance("openai")
 llm = openai_llm
 
+# Файл правил наименования для LLM
+NAMING_RULES_PATH = "rules/промпт для заявки 2.txt"
+
+# Формат ответа при нормализации (часть неизменного системного сообщения)
+NORMALIZATION_FORMAT_INSTRUCTION = 'Ответ возвращай в формате json: объект {"items": [...]}, где items — список записей в порядке входных строк с полями "Длина", "Ед. изм.", "Кол-во", "Наименование", "Размер", "Тип", "Толщина", "Угол"'
+
+# Колбэк, в который по мере готовности передаются обработанные товары
+ItemsCallback = Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]]
+
+# Оценка токенов ответа на одну запись из 8 полей без учета наименования
+NORMALIZATION_RECORD_TOKENS = estimate_tokens('{"Длина": "-", "Ед. изм.": "шт", "Кол-во": 1, "Наименование": "", "Размер": "", "Тип": "-", "Толщина": "", "Угол": "-"}, ')
+
+# Кэш нормализованных строк: строка товара + хэш правил -> запись из 8 полей
+normalization_cache = DiskLRUCache(
+    os.path.join(settings.CACHE_DIR, "normalization.sqlite3"),
+    max_entries=settings.NORMALIZATION_CACHE_MAX_ENTRIES,
+    name="normalization",
+)
+
 class PriceListService:
     """Сервис для работы с прайс-листами и векторной базой данных ChromaDB"""
 
@@ -117,7 +145,7 @@ class PriceListService:
             elif file_path.endswith(".json"):
                 data = self._read_json_price_list(file_path)
             elif file_path.endswith(".xlsx") or file_path.endswith(".xls"):
-                data = self._read_excel_price_list(file_path)
+                data = await self._read_excel_price_list(file_path)
             else:
                 raise ValueError(f"Неподдерживаемый формат файла: {file_path}")
 
@@ -256,8 +284,7 @@ class PriceListService:
 
     async def _read_excel_price_list(self, file_path: str) -> Dict[str, Any]:
         """
-        Чтение прайс-листа из Excel файла, пропуская первые 5 строк заголовка
-        Специально для формата прайс-листа с воздуховодами и объединенными ячейками
+        Чтение прайс-листа из Excel файла в пуле процессов (см. excel_readers.read_excel_price_list)
 
         Args:
             file_path: Путь к Excel файлу
@@ -265,150 +292,7 @@ class PriceListService:
         Returns:
             Dict: Структурированные данные прайс-листа
         """
-        try:
-            # Попытка определить дату из имени файла или содержимого
-            price_list_date = pd.Timestamp.now().strftime("%Y-%m-%d")
-            try:
-                # Чтение первых строк для поиска даты
-                header_df = pd.read_excel(file_path, header=None, nrows=5)
-                # Ищем строку с датой (обычно в первой строке первый столбец содержит "Прайс-лист на")
-                for i in range(5):
-                    for j in range(3):  # Проверяем первые 3 столбца
-                        cell_value = str(header_df.iloc[i, j]).strip() if not pd.isna(header_df.iloc[i, j]) else ""
-                        if "прайс-лист на" in cell_value.lower():
-                            # Извлекаем дату из строки
-                            date_parts = cell_value.split("на")[-1].strip().split()
-                            if len(date_parts) >= 3:
-                                # Конвертируем месяц в числовой формат
-                                month_map = {
-                                    "января": "01", "февраля": "02", "марта": "03", "апреля": "04",
-                                    "мая": "05", "июня": "06", "июля": "07", "августа": "08",
-                                    "сентября": "09", "октября": "10", "ноября": "11", "декабря": "12"
-                                }
-                                day = date_parts[0]
-                                month = month_map.get(date_parts[1].lower(), "01")
-                                year = date_parts[2].replace("г.", "").strip()
-                                price_list_date = f"{year}-{month}-{day}"
-                                break
-            except Exception as e:
-                self.logger.warning(f"Не удалось извлечь дату из заголовка прайс-листа: {str(e)}")
-
-            # Чтение Excel файла, пропуская первые 5 строк для заголовков
-            df = pd.read_excel(file_path, header=5)
-
-            # Переименуем столбцы для лучшего понимания
-            # Предполагаем, что первая колонка содержит наименование
-            # а последние две колонки - цену и валюту
-            column_names = {}
-            for i, col in enumerate(df.columns):
-                if i == 0:
-                    column_names[col] = 'Наименование'
-                elif i == len(df.columns) - 2:
-                    column_names[col] = 'Цена'
-                elif i == len(df.columns) - 1:
-                    column_names[col] = 'Валюта'
-                else:
-                    # Ищем колонку с описанием (обычно колонка с наибольшим количеством текста)
-                    non_null_values = df[col].dropna()
-                    if len(non_null_values) > 0 and isinstance(non_null_values.iloc[0], str) and len(non_null_values.iloc[0]) > 10:
-                        column_names[col] = 'Описание'
-
-            df.rename(columns=column_names, inplace=True)
-
-            # Определяем валюту
-            currency = "RUB"  # По умолчанию рубли
-            if 'Валюта' in df.columns:
-                currencies = df['Валюта'].dropna().unique()
-                if len(currencies) > 0:
-                    currency = str(currencies[0])
-
-            # Обработка иерархической структуры
-            df['Категория'] = None
-            df['Подкатегория'] = None
-            current_category = None
-            current_subcategory = None
-
-            for i, row in df.iterrows():
-                name = row.get('Наименование', '')
-                price = row.get('Цена', None)
-                
-                # Проверяем наличие значений
-                if pd.isna(name):
-                    continue
-                    
-                name = str(name).strip()
-                    
-                # Если строка без цены и не содержит артикул (не начинается с 'VTL-'), 
-                # то это категория или подкатегория
-                if (pd.isna(price) or price == 0) and not name.startswith('VTL-'):
-                    if current_category is None or "воздуховоды" in name.lower():
-                        current_category = name
-                        current_subcategory = None
-                    else:
-                        current_subcategory = name
-                
-                df.at[i, 'Категория'] = current_category
-                df.at[i, 'Подкатегория'] = current_subcategory
-
-            # Отфильтруем только строки с товарами (имеющие цену)
-            products_df = df.dropna(subset=['Цена']).copy()
-            products_df = products_df[products_df['Цена'] > 0].copy()
-
-            # Формируем структуру прайс-листа
-            price_list_data = {
-                "price_list_date": price_list_date,
-                "currency": currency,
-                "categories": {}
-            }
-
-            # Группировка по категориям и подкатегориям
-            for _, row in products_df.iterrows():
-                category = row.get('Категория')
-                subcategory = row.get('Подкатегория')
-                
-                if pd.isna(category) or category is None:
-                    category = "Неизвестная категория"
-                    
-                if pd.isna(subcategory) or subcategory is None:
-                    subcategory = "Неизвестная подкатегория"
-                
-                if category not in price_list_data["categories"]:
-                    price_list_data["categories"][category] = {}
-
-                if subcategory not in price_list_data["categories"][category]:
-                    price_list_data["categories"][category][subcategory] = []
-
-                # Получаем артикул из наименования
-                article = row.get('Наименование', '')
-                name = article  # По умолчанию
-                
-                # Выделяем описание
-                description = str(row.get('Описание', '')) if not pd.isna(row.get('Описание', '')) else ""
-                
-                # Если нет описания, но есть длинное наименование, попробуем выделить описание из наименования
-                if not description and len(str(article)) > 20:
-                    # Предполагаем, что артикул в формате "VTL-XXXXXXXX" и идет в начале
-                    parts = str(article).split(" ", 1)
-                    if len(parts) > 1 and parts[0].startswith("VTL-"):
-                        article = parts[0]
-                        description = parts[1]
-                        name = parts[0]  # VTL-код как наименование
-                
-                # Добавляем товар
-                price_list_data["categories"][category][subcategory].append({
-                    "article": article,
-                    "name": name,
-                    "description": description,
-                    "price": float(row.get('Цена')),
-                    "unit": "шт",  # По умолчанию используем "шт"
-                })
-
-            self.logger.info(f"Excel прайс-лист успешно прочитан, найдено {len(products_df)} товаров с ценами")
-            return price_list_data
-
-        except Exception as e:
-            self.logger.error(f"Ошибка при чтении Excel файла: {str(e)}")
-            raise Exception(f"Ошибка при чтении Excel файла: {str(e)}")
+        return await executors.run_cpu(read_excel_price_list, file_path)
 
     def _load_data_to_chroma(
         self, data: Dict[str, Any], price_list_id: str
@@ -481,19 +365,21 @@ class PriceListService:
                 # Используем эмбеддинги Mistral, если они доступны
                 if embeddings:
                     batch_embeddings = embeddings[i : i + batch_size]
-                    self.collection.add(
-                        ids=batch_ids,
-                        documents=batch_documents,
-                        metadatas=batch_metadatas,
-                        embeddings=batch_embeddings
-                    )
+                    with CHROMA_OPERATION_DURATION.time(operation="add"):
+                        self.collection.add(
+                            ids=batch_ids,
+                            documents=batch_documents,
+                            metadatas=batch_metadatas,
+                            embeddings=batch_embeddings
+                        )
                 else:
                     # Если эмбеддинги Mistral недоступны, используем встроенные эмбеддинги ChromaDB
-                    self.collection.add(
-                        ids=batch_ids,
-                        documents=batch_documents,
-                        metadatas=batch_metadatas,
-                    )
+                    with CHROMA_OPERATION_DURATION.time(operation="add"):
+                        self.collection.add(
+                            ids=batch_ids,
+                            documents=batch_documents,
+                            metadatas=batch_metadatas,
+                        )
 
             self.logger.info(
                 f"В ChromaDB успешно загружено {total_items} товаров из прайс-листа {price_list_id}"
@@ -562,32 +448,36 @@ class PriceListService:
                 # Поиск с фильтрацией
                 if query_embedding:
                     # Если есть эмбеддинг запроса от Mistral, используем его
-                    results = self.collection.query(
-                        query_embeddings=[query_embedding],
-                        n_results=search_limit,
-                        where=where_filter
-                    )
+                    with CHROMA_OPERATION_DURATION.time(operation="query"):
+                        results = self.collection.query(
+                            query_embeddings=[query_embedding],
+                            n_results=search_limit,
+                            where=where_filter
+                        )
                 else:
                     # Иначе используем текстовый запрос
-                    results = self.collection.query(
-                        query_texts=[query],
-                        n_results=search_limit,
-                        where=where_filter
-                    )
+                    with CHROMA_OPERATION_DURATION.time(operation="query"):
+                        results = self.collection.query(
+                            query_texts=[query],
+                            n_results=search_limit,
+                            where=where_filter
+                        )
             else:
                 # Поиск без фильтрации
                 if query_embedding:
                     # Если есть эмбеддинг запроса от Mistral, используем его
-                    results = self.collection.query(
-                        query_embeddings=[query_embedding],
-                        n_results=search_limit
-                    )
+                    with CHROMA_OPERATION_DURATION.time(operation="query"):
+                        results = self.collection.query(
+                            query_embeddings=[query_embedding],
+                            n_results=search_limit
+                        )
                 else:
                     # Иначе используем текстовый запрос
-                    results = self.collection.query(
-                        query_texts=[query],
-                        n_results=search_limit
-                    )
+                    with CHROMA_OPERATION_DURATION.time(operation="query"):
+                        results = self.collection.query(
+                            query_texts=[query],
+                            n_results=search_limit
+                        )
 
             # Форматируем результаты
             pprint(results)
@@ -907,19 +797,21 @@ class PriceListService:
                 # Используем эмбеддинги Mistral, если они доступны
                 if embeddings:
                     batch_embeddings = embeddings[batch_start:batch_end]
-                    self.collection.add(
-                        ids=batch_ids,
-                        documents=batch_documents,
-                        metadatas=batch_metadatas,
-                        embeddings=batch_embeddings
-                    )
+                    with CHROMA_OPERATION_DURATION.time(operation="add"):
+                        self.collection.add(
+                            ids=batch_ids,
+                            documents=batch_documents,
+                            metadatas=batch_metadatas,
+                            embeddings=batch_embeddings
+                        )
                 else:
                     # Если эмбеддинги Mistral недоступны, используем встроенные эмбеддинги ChromaDB
-                    self.collection.add(
-                        ids=batch_ids,
-                        documents=batch_documents,
-                        metadatas=batch_metadatas,
-                    )
+                    with CHROMA_OPERATION_DURATION.time(operation="add"):
+                        self.collection.add(
+                            ids=batch_ids,
+                            documents=batch_documents,
+                            metadatas=batch_metadatas,
+                        )
 
             self.logger.info(
                 f"В ChromaDB успешно загружено {total_items} товаров из прайс-листа {price_list_id} от поставщика {supplier_id}"
@@ -940,39 +832,6 @@ class PriceListService:
                 f"Ошибка при загрузке данных в ChromaDB: {str(e)}"
             )
             raise Exception(f"Ошибка при загрузке данных в ChromaDB: {str(e)}")
-    def prepare_text_anserw_to_dict(self, text: str) -> list:
-        """
-        Извлекает список товаров из текста, содержащего JSON-блок
-
-        Args:
-            text: Исходный текст с JSON-блоком
-
-        Returns:
-            list: Список словарей с товарами или None при ошибке
-        """
-        try:
-            # Ищем JSON-блок между ```json и ```
-            json_match = re.search(r"```json\s*(.*?)\s*```", text, re.DOTALL)
-            
-            # Если не нашли в формате ```json```, пробуем найти просто JSON в тексте
-            if not json_match:
-                # Пробуем найти JSON-массив в тексте напрямую
-                text=text.replace("'",'"')
-                data=json.loads(text)
-                return data
-                
-            json_str = json_match.group(0) if not json_match.groups() else json_match.group(1)
-            data = json.loads(json_str)
-
-            if not isinstance(data, list):
-                raise TypeError("JSON не содержит список")
-
-            return data
-
-        except (json.JSONDecodeError, TypeError, ValueError) as e:
-            print(f"Ошибка извлечения списка: {str(e)}")
-            return None
-        
     async def _get_embeddings(self, texts: List[str]) -> List[List[float]]:
         """
         Получение эмбеддингов для текстов с использованием Mistral API
@@ -1065,26 +924,177 @@ class PriceListService:
 
 
 
+    @staticmethod
+    def _item_to_line(item: Dict[str, Any]) -> str:
+        """Строка товара в том виде, в котором она отправляется в LLM"""
+        return item.get("Наименование", "") + ' Количество:' + str(item.get("Количество", "")) + ' Ед.изм.:' + str(item.get("Ед.изм.", ""))
+
+    @staticmethod
+    def _normalization_cache_key(line: str, prompt_hash: str) -> str:
+        """
+        Ключ кэша нормализации: строка товара без учета регистра и лишних пробелов
+        плюс хэш правил, чтобы правка файла правил автоматически делала записи неактуальными
+        """
+        normalized_line = " ".join(line.lower().split())
+        return DiskLRUCache.make_key(prompt_hash, normalized_line)
+
+    async def _postprocess_groups(self, groups: List[List[Dict[str, Any]]]) -> List[Optional[List[Dict[str, Any]]]]:
+        """
+        Постобработка записей LLM через newcode.process_row_from_list в пуле процессов
+
+        Группы обрабатываются независимо одним вызовом пула (newcode.process_record_groups).
+
+        Args:
+            groups: Группы записей с полями "Длина", "Ед. изм.", "Кол-во", "Наименование", "Размер", "Тип", "Толщина", "Угол"
+
+        Returns:
+            List: Для каждой группы обработанные товары или None, если записи не удалось обработать
+        """
+        if not groups:
+            return []
+        from newcode import process_record_groups
+
+        with POSTPROCESS_DURATION.time():
+            outcomes = await executors.run_cpu(process_record_groups, groups)
+
+        results = []
+        for records, (processed, error) in zip(groups, outcomes):
+            if error is not None:
+                POSTPROCESS_RECORDS.inc(len(records), status="error")
+                self.logger.warning(f"Не удалось обработать ответ LLM ({len(records)} записей): {error}")
+            else:
+                POSTPROCESS_RECORDS.inc(len(records), status="ok")
+            results.append(processed)
+        return results
+
+    async def _normalize_batch(self, lines: List[str], promt: str, usage: Dict[str, int] = None, max_tokens: int = 2000) -> List[Dict[str, Any]]:
+        """
+        Преобразование наименований одной пачки товаров через LLM
+
+        Системное сообщение не зависит от пачки (правила + формат ответа),
+        поэтому провайдер может переиспользовать его из кэша префиксов.
+        Переменная часть — только в сообщении пользователя.
+
+        Args:
+            lines: Строки товаров пачки
+            promt: Текст правил наименования
+            usage: Словарь для накопления статистики токенов (tokens, cached_tokens)
+            max_tokens: Максимальное количество токенов в ответе
+
+        Returns:
+            List[Dict]: Записи из ответа LLM или None, если ответ не удалось разобрать
+
+        Raises:
+            LLMRequestError: Если запрос не удался после всех повторов
+        """
+        messages = [
+            {"role": "system", "content": f"вот правила для правильного наименования {promt}\n\n{NORMALIZATION_FORMAT_INSTRUCTION}"},
+            {"role": "user", "content": f"верни правильное наименование для: {lines}"}
+        ]
+
+        response = await call_with_retry(
+            lambda: llm.chat_completion(messages=messages, max_tokens=max_tokens, response_schema=NORMALIZED_ITEMS_SCHEMA),
+            f"Нормализация пачки из {len(lines)} товаров",
+        )
+        if response.get("finish_reason") == "length":
+            self.logger.warning(f"Ответ LLM для пачки из {len(lines)} товаров обрезан по max_tokens={max_tokens}")
+        if usage is not None:
+            usage["tokens"] = usage.get("tokens", 0) + response.get("tokens", 0)
+            usage["cached_tokens"] = usage.get("cached_tokens", 0) + response.get("cached_tokens", 0)
+        self.logger.info(f"Пачка из {len(lines)} товаров: токенов {response.get('tokens', 0)}, из кэша префиксов {response.get('cached_tokens', 0)}")
+
+        answer = response_items(response)
+        if answer is None:
+            self.logger.warning(f"Не удалось разобрать ответ LLM для пачки из {len(lines)} товаров")
+            return None
+        return answer
+
+    @staticmethod
+    def _failed_item(item: Dict[str, Any], reason: str) -> Dict[str, Any]:
+        """
+        Товар, который не удалось нормализовать, в формате результата с пометкой ❌
+
+        Args:
+            item: Исходный товар
+            reason: Причина для пользователя
+
+        Returns:
+            Dict: Запись с полями "Наименование", "Кол-во", "Ед. изм."
+        """
+        return {
+            "Наименование": f"❌ {reason}: {item.get('Наименование', '')}",
+            "Кол-во": item.get("Количество") or 1,
+            "Ед. изм.": item.get("Ед.изм.") or "-",
+        }
+
+    async def _emit_items(self, on_items: ItemsCallback, results: List[List[Dict[str, Any]]]) -> None:
+        """
+        Передача готовых товаров в колбэк потоковой выдачи
+
+        Ошибка колбэка (например, клиент закрыл соединение) не прерывает обработку.
+
+        Args:
+            on_items: Колбэк или None
+            results: Результаты по строкам (у каждой строки — список товаров)
+        """
+        if on_items is None:
+            return
+        ready_items = [item for result in results for item in result]
+        if not ready_items:
+            return
+        try:
+            await on_items(ready_items)
+        except Exception as e:
+            self.logger.warning(f"Ошибка передачи готовых товаров в колбэк: {str(e)}")
+
     @logger.catch
-    async def find_matching_items(self, items: List[Dict[str, Any]], progress_bars: Dict[str, Any], progress_bar_id: str = None) -> List[Dict[str, Any]]:
+    async def find_matching_items(self, items: List[Dict[str, Any]], progress_bars: Dict[str, Any], progress_bar_id: str = None, on_items: ItemsCallback = None) -> List[Dict[str, Any]]:
         """
-        Поиск соответствий распознанных товаров в векторной базе и замена названий на эталонные
-        
+        Поиск соответствий распознанных товаров (см. find_matching_item_groups) одним списком
+
         Args:
             items: Список распознанных товаров
-            similarity_threshold: Минимальный порог сходства для замены (0.0-1.0)
-            
+            progress_bars: Словарь прогресс-баров сервиса
+            progress_bar_id: ID прогресс-бара для обновления
+            on_items: Асинхронный колбэк для готовых товаров
+
         Returns:
             List[Dict]: Список обогащенных товаров с эталонными названиями
         """
-        from chromaWork import ChromaWork
-        from newcode import process_row_from_list
+        groups = await self.find_matching_item_groups(items, progress_bars, progress_bar_id, on_items)
+        return [record for group in groups for record in group]
+
+    @logger.catch
+    async def find_matching_item_groups(self, items: List[Dict[str, Any]], progress_bars: Dict[str, Any], progress_bar_id: str = None, on_items: ItemsCallback = None) -> List[List[Dict[str, Any]]]:
+        """
+        Поиск соответствий распознанных товаров в векторной базе и замена названий на эталонные
+
+        Сначала каждая строка пробует локальный разбор (line_parser), затем
+        кэш нормализации; в LLM уходят только оставшиеся строки. Пачки промахов отправляются параллельно, не более
+        settings.LLM_BATCH_CONCURRENCY одновременно. Результаты собираются
+        в исходном порядке товаров.
+
+        Ошибки транспорта повторяются с экспоненциальной задержкой. Если ответ
+        на пачку не разобрался или не совпал с ней построчно, пачка делится
+        пополам и отправляется заново, вплоть до отдельных строк. Строки, которые
+        не удалось обработать и так, возвращаются с пометкой ❌ в наименовании.
+
+        Если передан on_items, готовые товары отдаются в него сразу: сначала
+        все разобранные локально и найденные в кэше, затем результат каждой
+        пачки по мере ее завершения (порядок пачек не гарантируется).
+
+        Args:
+            items: Список распознанных товаров
+            progress_bars: Словарь прогресс-баров сервиса
+            progress_bar_id: ID прогресс-бара для обновления
+            on_items: Асинхронный колбэк для готовых товаров
+
+        Returns:
+            List[List[Dict]]: Обогащенные записи для каждого товара в порядке items
+            (одна строка может дать несколько записей или ни одной)
+        """
         try:
-            chromaDB = ChromaWork('test')
-            # Результирующий список
-            enriched_items = []
-            
-            try: 
+            try:
                 progress_bars[progress_bar_id]['text'] = "Поиск соответствий для " + str(len(items)) + " товаров"
             except:
                 progress_bars.setdefault(progress_bar_id, {'text': "Поиск соответствий для " + str(len(items)) + " товаров", 'processed': 45, 'total': 100})
@@ -1092,109 +1102,148 @@ class PriceListService:
             max_percent_is_step=90
             now_percent_step=progress_bars[progress_bar_id]['processed']
             max_percent_step=max_percent_is_step - now_percent_step
-            #
-            # Обработка по 17 элементов за итерацию
-            batch_size = 17
-
-            percent_step=round(max_percent_step/math.ceil(len(items)/batch_size),1)
-            index=1
-            for i in range(0, len(items), batch_size):
-                batch = items[i:i + batch_size]
-                progress_bars[progress_bar_id]['processed'] += percent_step
-                progress_bars[progress_bar_id]['text'] = f"Преобразование наименований товаров {i+1}-{i+len(batch)} из {len(items)}"
-                
-                # Получаем срез из максимум 15 элементов
-                
-                print(f"Преобразование наименований товаров {i+1}-{i+len(batch)} из {len(items)}")
-                
-                # pprint(batch)
-                # Получаем наименования для текущей пачки
-                names = [item.get("Наименование", "") + ' Количество:' + str(item.get("Количество", "")) + ' Ед.изм.:' + str(item.get("Ед.изм.", "")) for item in batch]
 
-                # item_name = item.text
-                    
-                # Если имя товара не пустое, ищем совпадения в базе
-                if names:
-                    # self.logger.info(f"[Товар {idx+1}] Поиск соответствий для: '{item_name}'")
-                    # item_name = item_name.replace("Φ", "d")
-                    # item_name = item_name.replace("Ф", "d")
-                    # Ищем похожие товары в векторной базе
-                    # promt = chromaDB.get_items(item_name, isReturnPromt=True)
-                    promt = open("rules/промпт для заявки 2.txt", "r").read()
-                    logger.info(f"вот правила для правильного наименования: {promt[:50]} ...")
-
-                    messages = [
-                        {"role": "system", "content": f"вот правила для правильного наименования {promt}"},
-                        {"role": "user", "content": f'верни правильное наименование для: {names} в формате json список с полями "Длина", "Ед. изм.", "Кол-во", "Наименование", "Размер", "Тип", "Толщина", "Угол" '}
-                    ]
-
-                    # pprint(messages)
-                    # response = await self.mistral_client.chat.complete_async(
-                    #     model="mistral-small-latest",
-                    #     messages=messages,
-                    #         # {"role": "system", "content": f"Ты помощник для поиска соответствий в базе данных. Ты должен найти соответствие для запроса среди списка текстов. Если соответствие найдено, верни его в формате json с полями 'Наименование', 'Ед.изм.', 'Количество'. Если соответствие не найдено, верни null. и учти что Ф это d. Вот еще правила  {promt}"},
-                    #         # {"role": "user", "content": f"Найди соответствие для: {item_name} среди: {allTexts}"}
-                        
-                    
-                    #     max_tokens=50000,
-                    #     temperature=0.9
-                    # )
-
-                    # response = await llm.chat_completion(messages=messages, model="gpt-4.1-nano-2025-04-14")
-                    response = await llm.chat_completion(messages=messages)
-                    # pprint(response)
-                    text=response['text']
-                    answer = self.prepare_text_anserw_to_dict(text)
-                    # print("Правильное наименование: ", answer)
-                    # pprint(answer)
-                    try:
-                        prepare_anser=process_row_from_list(answer)
-                    except:
-                        continue
-                    # try:
-                    #     answerName = answer[0]["Наименование"]
-                    # except:
-                    #     continue
+            # Правила читаются с диска только при изменении файла
+            promt, prompt_hash = rules_service.get_prompt(NAMING_RULES_PATH)
+
+            # Результаты по позициям исходного списка
+            results = [None] * len(items)
+            lines = [self._item_to_line(item) for item in items]
+            cache_keys = [self._normalization_cache_key(line, prompt_hash) for line in lines]
+
+            # Типовые строки разбираем локально, без LLM
+            parsed = [(index, parse_item_line(item)) for index, item in enumerate(items)]
+            parsed = [(index, record) for index, record in parsed if record is not None]
+            fast_path_indices = []
+            processed_groups = await self._postprocess_groups([[record] for _, record in parsed])
+            for (index, _), processed in zip(parsed, processed_groups):
+                if processed is not None:
+                    results[index] = processed
+                    fast_path_indices.append(index)
+
+            pending = [index for index in range(len(items)) if results[index] is None]
+            cached = list(zip(pending, await executors.run_io(
+                lambda: [normalization_cache.get(cache_keys[index]) for index in pending]
+            )))
+            cache_hits = 0
+            missed_indices = [index for index, record in cached if record is None]
+            cached = [(index, record) for index, record in cached if record is not None]
+            processed_groups = await self._postprocess_groups([[record] for _, record in cached])
+            for (index, _), processed in zip(cached, processed_groups):
+                if processed is not None:
+                    results[index] = processed
+                    cache_hits += 1
+                else:
+                    missed_indices.append(index)
+            missed_indices.sort()
+
+            # Пачки промахов собираются по бюджету токенов модели: длинные строки —
+            # меньше строк в пачке, короткие — больше, ответ не выходит за max_tokens
+            budget = get_token_budget(llm.model)
+
+            def pack(indices: List[int]) -> List[List[int]]:
+                return list(pack_batches(
+                    indices,
+                    input_tokens=lambda i: estimate_tokens(lines[i]),
+                    output_tokens=lambda i: NORMALIZATION_RECORD_TOKENS + estimate_tokens(lines[i]) // 2,
+                    budget=budget,
+                ))
+
+            batches = pack(missed_indices)
+
+            stats = progress_bars[progress_bar_id].setdefault('stats', {})
+            stats['fast_path'] = {
+                "parsed": len(fast_path_indices),
+                "total": len(items),
+                "hit_rate": round(len(fast_path_indices) / len(items), 3) if items else 0.0,
+                "llm_calls_saved": len(pack(sorted(missed_indices + fast_path_indices))) - len(batches),
+            }
+            stats['normalization_cache'] = {"hits": cache_hits, "misses": len(missed_indices)}
+            stats['normalization_batches'] = len(batches)
+            self.logger.info(f"Локальный разбор: {len(fast_path_indices)} из {len(items)} товаров, сэкономлено запросов к LLM: {stats['fast_path']['llm_calls_saved']}")
+            self.logger.info(f"Кэш нормализации: {cache_hits} попаданий, {len(missed_indices)} промахов, пачек для LLM: {len(batches)}")
+            await self._emit_items(on_items, [results[i] for i in range(len(items)) if results[i]])
 
-                    # matches = await self.search_similar_items(query=answerName, limit=5)
-                        
+            percent_step=round(max_percent_step/max(len(batches), 1),1)
+
+            semaphore = asyncio.Semaphore(max(1, settings.LLM_BATCH_CONCURRENCY))
+            completed = 0
+            token_usage = {"tokens": 0, "cached_tokens": 0}
+            stats['normalization_tokens'] = token_usage
+
+            retry_stats = {"bisections": 0, "failed_items": 0}
+            stats['normalization_retries'] = retry_stats
+
+            def mark_failed(indices: List[int], reason: str):
+                retry_stats["failed_items"] += len(indices)
+                for index in indices:
+                    results[index] = [self._failed_item(items[index], reason)]
+
+            async def normalize(batch_indices: List[int]):
+                try:
+                    async with semaphore:
+                        answer = await self._normalize_batch([lines[i] for i in batch_indices], promt, token_usage, budget["output"])
+                except LLMRequestError as e:
+                    # LLM недоступна — дробить пачку бессмысленно, это только умножит запросы
+                    self.logger.error(str(e))
+                    mark_failed(batch_indices, "Сервис нормализации недоступен")
+                    return
+
+                failed = list(batch_indices)
+                if answer and len(answer) == len(batch_indices):
+                    # Ответ совпал с пачкой построчно — обрабатываем и кэшируем каждую запись отдельно
+                    failed = []
+                    processed_groups = await self._postprocess_groups([[record] for record in answer])
+                    for index, record, processed in zip(batch_indices, answer, processed_groups):
+                        if processed is None:
+                            failed.append(index)
+                            continue
+                        results[index] = processed
+                        await normalization_cache.aset(cache_keys[index], record)
+                elif answer and len(batch_indices) == 1:
+                    # Одна строка дала несколько записей — принимаем, но не кэшируем
+                    processed = (await self._postprocess_groups([answer]))[0]
+                    if processed is not None:
+                        results[batch_indices[0]] = processed
+                        failed = []
+
+                if not failed:
+                    return
+                if len(batch_indices) == 1:
+                    mark_failed(failed, "Не удалось обработать")
+                    return
+                if len(failed) < len(batch_indices):
+                    # Переспрашиваем только строки, которые не прошли постобработку
+                    await normalize(failed)
+                    return
+                retry_stats["bisections"] += 1
+                middle = len(batch_indices) // 2
+                self.logger.warning(f"Ответ на пачку из {len(batch_indices)} товаров не разобран, делим на {middle} и {len(batch_indices) - middle}")
+                await asyncio.gather(normalize(batch_indices[:middle]), normalize(batch_indices[middle:]))
+
+            async def run_batch(batch_indices: List[int]):
+                nonlocal completed
+                await normalize(batch_indices)
+                await self._emit_items(on_items, [results[i] for i in batch_indices if results[i]])
+
+                # Прогресс считаем по завершенным пачкам, а не по порядку запуска
+                completed += 1
+                progress_bars[progress_bar_id]['processed'] += percent_step
+                progress_bars[progress_bar_id]['text'] = f"Преобразование наименований товаров: обработано пачек {completed} из {len(batches)}"
+                print(f"Преобразование наименований товаров: обработано пачек {completed} из {len(batches)}")
+
+            await asyncio.gather(*(run_batch(batch) for batch in batches))
+            self.logger.info(f"Нормализация: токенов {token_usage['tokens']}, из кэша префиксов {token_usage['cached_tokens']}, делений пачек {retry_stats['bisections']}, необработанных строк {retry_stats['failed_items']}")
 
-                    # pprint(matches)
-                    # allTexts = [match["description"] for match in matches]
-                    
-                    # allTexts = '\n'.join(allTexts)
-                    # print("Список похожих товаров из базы данных: ", allTexts)
-                    # response = await self.mistral_client.chat.complete_async(
-                    #     model="mistral-small-latest",
-                    #     messages=[
-                    #         {"role": "system", "content": f"вот список товаров из базы данных {allTexts}"},
-                    #         {"role": "user", "content": f"верни то что больше соответствует: {answerName} в формате json список с полями 'Наименование', 'Ед.изм.', 'Количество'"}
-                    #         # {"role": "system", "content": f"Ты помощник для поиска соответствий в базе данных. Ты должен найти соответствие для запроса среди списка текстов. Если соответствие найдено, верни его в формате json с полями 'Наименование', 'Ед.изм.', 'Количество'. Если соответствие не найдено, верни null. и учти что Ф это d. Вот еще правила  {promt}"},
-                    #         # {"role": "user", "content": f"Найди соответствие для: {item_name} среди: {allTexts}"}
-                    #     ],
-                    #     max_tokens=40000,
-                    #     temperature=0.9
-                    # )
-                    # # print("===================\n", allTexts)
-                    # answer = self.prepare_text_anserw_to_dict(response.choices[0].message.content)
-                    # print("более подходящий товар: для ", answerName, answer)
-
-
-
-                    index+=1
-                    enriched_items.extend(prepare_anser)
-                    
-            
             progress_bars[progress_bar_id]['processed'] = 100
             progress_bars[progress_bar_id]['text'] = "Обработка завершена"
-            # pprint(enriched_items)
-            return enriched_items
-            
+            return [result or [] for result in results]
+
         except Exception as e:
             self.logger.error(f"{traceback.format_exc()}")
             self.logger.error(f"Ошибка при поиске соответствий товаров: {str(e)}")
-            # В случае ошибки возвращаем исходный список
-            return items
+            # В случае ошибки возвращаем исходные товары
+            return [[item] for item in items]
 
 # Экземпляр сервиса
 price_list_service = PriceListService()
@@ -35,6 +35,9 @@ class RulesService:
         
         self.block_separator = "=========="
         self.title_separator = "==="
+
+        # Кэш текстов промптов: путь -> (mtime, размер, текст, sha256)
+        self._prompt_cache = {}
     
     def load_rule_files(self) -> None:
         """Загружает все текстовые файлы из директории rules"""
@@ -49,6 +52,31 @@ class RulesService:
             # Добавляем в словарь
             self.rules_files[rule_type] = file_path
     
+    def get_prompt(self, file_path: str) -> Tuple[str, str]:
+        """
+        Получение текста файла правил из памяти
+
+        Файл перечитывается с диска только если изменились его mtime или размер.
+        Хэш возвращается вместе с текстом, чтобы зависящие от правил кэши
+        понимали, что правила поменялись.
+
+        Args:
+            file_path: Путь к файлу правил
+
+        Returns:
+            Tuple[str, str]: Текст файла и его sha256
+        """
+        stat = os.stat(file_path)
+        cached = self._prompt_cache.get(file_path)
+        if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+            return cached[2], cached[3]
+
+        with open(file_path, 'r', encoding='utf-8') as file:
+            content = file.read()
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        self._prompt_cache[file_path] = (stat.st_mtime, stat.st_size, content, content_hash)
+        return content, content_hash
+
     def get_rule_type_from_filename(self, filename: str) -> str:
         """Получает тип правил из имени файла"""
         # Удаляем расширение и разделяем по пробелам
@@ -0,0 +1,119 @@
+"""Компактная запись таблиц для запросов к LLM"""
+import re
+from typing import List, Optional, Sequence, Tuple
+
+# Разделитель столбцов: один токен и не требует выравнивания пробелами
+DELIMITER = "|"
+
+# Заголовок столбца с номером строки исходной таблицы
+ROW_NUMBER_HEADER = "стр"
+
+# Строка-разделитель markdown-таблицы: |---|:---:|
+MARKDOWN_SEPARATOR_RE = re.compile(r"^\s*\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?\s*$")
+# Выравнивание столбцов пробелами, как в тексте, скопированном из таблиц
+ALIGNED_COLUMNS_RE = re.compile(r"\s{2,}")
+
+# Пояснение к таблицам в запросе: номер строки не путать с номером позиции и количеством
+TABLE_FORMAT_NOTE = (
+    f'Таблица записана построчно, столбцы разделены "{DELIMITER}", пустые столбцы опущены. '
+    f'Первый столбец ("{ROW_NUMBER_HEADER}") — номер строки исходной таблицы, это не количество и не номер позиции.'
+)
+
+# Минимум подряд идущих строк, чтобы считать фрагмент сообщения таблицей
+MIN_TABLE_LINES = 2
+
+
+def _clean_cell(cell: str) -> str:
+    return " ".join(str(cell).split()).replace(DELIMITER, "/")
+
+
+def serialize_rows(rows: Sequence[Tuple[int, Sequence[str]]], header: Optional[Sequence[str]] = None) -> str:
+    """
+    Таблица одной строкой на запись через "|" без выравнивания
+
+    Столбцы, пустые во всех строках (заголовок не учитывается), отбрасываются.
+    Первым столбцом идет номер строки исходной таблицы, чтобы ответ можно было
+    сопоставить с источником.
+
+    Args:
+        rows: Строки (номер строки, ячейки)
+        header: Ячейки заголовка или None
+
+    Returns:
+        str: Заголовок (если есть) и строки, разделенные переводом строки
+    """
+    cleaned = [(number, [_clean_cell(cell) for cell in cells]) for number, cells in rows]
+    width = max([len(cells) for _, cells in cleaned] + [len(header or [])])
+    columns = [
+        index for index in range(width)
+        if any(index < len(cells) and cells[index] for _, cells in cleaned)
+    ]
+
+    def line(first: str, cells: List[str]) -> str:
+        values = [cells[index] if index < len(cells) else "" for index in columns]
+        return DELIMITER.join([first] + values).rstrip(DELIMITER)
+
+    lines = []
+    if header is not None:
+        lines.append(line(ROW_NUMBER_HEADER, [_clean_cell(cell) for cell in header]))
+    lines.extend(line(str(number), cells) for number, cells in cleaned)
+    return "\n".join(lines)
+
+
+def _split_table_line(line: str) -> Optional[Tuple[str, List[str]]]:
+    """Вид таблицы (tsv, markdown, aligned) и ячейки строки или None, если строка не табличная"""
+    if "\t" in line:
+        return "tsv", line.split("\t")
+    stripped = line.strip()
+    if stripped.startswith("|") and stripped.count("|") >= 2:
+        return "markdown", [cell.strip() for cell in stripped.strip("|").split("|")]
+    # Для выравнивания пробелами нужно хотя бы три столбца, чтобы не принять
+    # за таблицу обычный текст с двойными пробелами
+    cells = ALIGNED_COLUMNS_RE.split(stripped)
+    return ("aligned", cells) if len(cells) >= 3 else None
+
+
+def compact_text(text: str) -> Tuple[str, int]:
+    """
+    Сжатие таблиц в свободном тексте (например, скопированных из Excel в чат)
+
+    Фрагменты из нескольких строк подряд, разбитых табуляцией, "|" или
+    выравниванием пробелами, записываются через serialize_rows с номером
+    строки сообщения; в остальных строках схлопываются повторы пробелов.
+
+    Args:
+        text: Исходный текст
+
+    Returns:
+        Tuple: (текст с компактными таблицами, число найденных таблиц)
+    """
+    result: List[str] = []
+    tables = 0
+    block: List[Tuple[int, List[str]]] = []
+    block_kind = None
+
+    def flush():
+        nonlocal tables
+        if len(block) >= MIN_TABLE_LINES:
+            tables += 1
+            result.append(serialize_rows(block))
+        else:
+            result.extend(" ".join(DELIMITER.join(cells).split()) for _, cells in block)
+        block.clear()
+
+    for number, line in enumerate(text.splitlines(), start=1):
+        if MARKDOWN_SEPARATOR_RE.match(line) and block:
+            continue
+        table_line = _split_table_line(line)
+        if table_line is not None:
+            # Соседние таблицы разного вида — разные таблицы
+            if table_line[0] != block_kind:
+                flush()
+                block_kind = table_line[0]
+            block.append((number, table_line[1]))
+            continue
+        flush()
+        block_kind = None
+        result.append(" ".join(line.split()))
+    flush()
+    return "\n".join(result), tables
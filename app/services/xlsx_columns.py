@@ -0,0 +1,199 @@
+"""Распознавание столбцов заявки XLSX по заголовку без обращения к LLM"""
+import os
+import re
+from typing import Dict, List, Optional, Tuple, Union
+
+from app.core.config import settings
+from app.services.disk_cache import DiskLRUCache
+
+# Версия правил распознавания: входит в ключ кэша, чтобы правка синонимов
+# делала старые записи неактуальными
+MAPPING_VERSION = 2
+
+# Поля записи, как их возвращает извлечение товаров LLM (EXTRACTED_ITEMS_SCHEMA)
+NAME_FIELD = "Наименование"
+QUANTITY_FIELD = "Количество"
+UNIT_FIELD = "Ед.изм."
+# Столбец типа и марки (спецификации по ГОСТ 21.110): не поле записи,
+# его значение дописывается к наименованию
+TYPE_COLUMN = "Тип, марка"
+
+# Синонимы заголовков после нормализации (нижний регистр, без пробелов и знаков):
+# точные совпадения и префиксы; "weak" используются, только если других совпадений нет
+COLUMN_SYNONYMS = {
+    NAME_FIELD: {
+        "exact": {"наименование", "название", "номенклатура"},
+        "prefix": ("наименование", "номенклатура", "названиетовара", "наимен"),
+        "weak": {"товар", "материал", "изделие", "продукция"},
+    },
+    QUANTITY_FIELD: {
+        "exact": {"кол", "колво", "количество", "клво", "кво"},
+        "prefix": ("количество", "колво"),
+    },
+    UNIT_FIELD: {
+        "exact": {"ед", "едизм", "едиз", "единица", "единицаизмерения", "единицыизмерения", "изм"},
+        "prefix": ("едизм", "единиц"),
+    },
+    TYPE_COLUMN: {
+        "exact": {"тип", "марка", "типмарка"},
+        "prefix": ("типмарк", "маркаоборуд"),
+    },
+}
+
+# Единица в заголовке столбца количества: "Кол-во, шт", "Количество (м)"
+HEADER_UNITS = {"шт": "шт", "м": "м", "пм": "п.м", "м2": "м2", "кг": "кг", "компл": "компл"}
+
+QUANTITY_RE = re.compile(r"^\s*(\d+(?:[.,]\d+)?)\s*([a-zа-я.²2]*)\s*$", re.IGNORECASE)
+# Итоговые строки таблицы: не товары
+TOTAL_RE = re.compile(r"^\s*(итого|всего)\b", re.IGNORECASE)
+
+# Найденные строки заголовка: хэш заголовка -> {"columns": {поле: номер столбца}, "unit": ед. из заголовка}
+column_mapping_cache = DiskLRUCache(
+    os.path.join(settings.CACHE_DIR, "xlsx_columns.sqlite3"),
+    max_entries=10000,
+    name="xlsx_columns",
+)
+
+
+def _normalize_header(cell: str) -> str:
+    return re.sub(r"[^0-9a-zа-я]", "", cell.lower().replace("ё", "е"))
+
+
+def _match_field(normalized: str) -> Tuple[Optional[str], bool]:
+    """Поле записи, которому соответствует заголовок столбца, и признак слабого совпадения"""
+    for field, synonyms in COLUMN_SYNONYMS.items():
+        if normalized in synonyms["exact"] or normalized.startswith(synonyms["prefix"]):
+            return field, False
+        if normalized in synonyms.get("weak", ()):
+            return field, True
+    return None, False
+
+
+def detect_columns(header: List[str]) -> Dict[str, Union[Dict[str, int], str, None]]:
+    """
+    Столбцы наименования, количества, единицы и типа (марки) по строке заголовка
+
+    Args:
+        header: Ячейки строки заголовка
+
+    Returns:
+        Dict: {"columns": {поле: номер столбца} или None, если наименование и
+        количество не найдены; "unit": единица из заголовка количества или None}
+    """
+    normalized = [_normalize_header(cell) for cell in header]
+    columns: Dict[str, int] = {}
+    weak_columns: Dict[str, int] = {}
+    for index, cell in enumerate(normalized):
+        field, weak = _match_field(cell)
+        if field is not None:
+            (weak_columns if weak else columns).setdefault(field, index)
+    columns = {**weak_columns, **columns}
+
+    unit = None
+    if QUANTITY_FIELD in columns:
+        quantity_header = normalized[columns[QUANTITY_FIELD]]
+        for suffix, value in HEADER_UNITS.items():
+            if quantity_header.endswith(suffix) and quantity_header != suffix:
+                unit = value
+                break
+
+    return {
+        "columns": columns if NAME_FIELD in columns and QUANTITY_FIELD in columns else None,
+        "unit": unit,
+    }
+
+
+def find_header(rows: List[Tuple[int, List[str]]]) -> Tuple[Optional[int], Dict[str, Union[Dict[str, int], str, None]]]:
+    """
+    Поиск строки заголовка с распознаваемыми столбцами среди первых строк листа
+
+    Найденный заголовок кэшируется по его отпечатку, поэтому повторные заявки
+    по тому же шаблону распознаются без разбора; строки, не оказавшиеся
+    заголовком, в кэш не попадают. Обращается к кэшу на диске — вызывать вне
+    цикла событий (executors.run_io).
+
+    Args:
+        rows: Первые непустые строки листа (номер строки, ячейки)
+
+    Returns:
+        Tuple: (позиция заголовка в rows или None, результат detect_columns)
+    """
+    for position, (_, cells) in enumerate(rows):
+        key = DiskLRUCache.make_key(MAPPING_VERSION, *(_normalize_header(cell) for cell in cells))
+        cached = column_mapping_cache.get(key)
+        if cached is not None:
+            return position, cached
+        mapping = detect_columns(cells)
+        if mapping["columns"]:
+            column_mapping_cache.set(key, mapping)
+            return position, mapping
+    return None, {"columns": None, "unit": None}
+
+
+def _cell(cells: List[str], index: Optional[int]) -> str:
+    return cells[index].strip() if index is not None and index < len(cells) else ""
+
+
+def skip_row(cells: List[str], mapping: Dict[str, Union[Dict[str, int], str, None]]) -> Optional[str]:
+    """
+    Причина пропуска строки распознанной таблицы, в которой нет товара
+
+    Строка с наименованием, но без количества — обычно заголовок раздела,
+    но может быть и товаром с незаполненным количеством, поэтому для нее
+    возвращается отдельная причина: вызывающий код учитывает такие строки
+    в статистике листа.
+
+    Args:
+        cells: Ячейки строки
+        mapping: Результат detect_columns с найденными столбцами
+
+    Returns:
+        str: no_name, total или empty_quantity; None — строку нужно разобрать
+        или отправить в LLM
+    """
+    columns = mapping["columns"]
+    name = _cell(cells, columns[NAME_FIELD])
+    if not name:
+        return "no_name"
+    if TOTAL_RE.match(name) is not None:
+        return "total"
+    if not _cell(cells, columns[QUANTITY_FIELD]):
+        return "empty_quantity"
+    return None
+
+
+def map_row(cells: List[str], mapping: Dict[str, Union[Dict[str, int], str, None]]) -> Optional[Dict[str, Union[str, int, float]]]:
+    """
+    Товар из строки таблицы по распознанным столбцам
+
+    Тип и марка (столбец TYPE_COLUMN) дописываются к наименованию, если оно
+    их еще не содержит: "Вентилятор радиальный" + "ВР 80-75-4" ->
+    "Вентилятор радиальный ВР 80-75-4".
+
+    Args:
+        cells: Ячейки строки
+        mapping: Результат detect_columns с найденными столбцами
+
+    Returns:
+        Dict: {"Наименование", "Количество", "Ед.изм."} или None, если строку
+        нельзя разобрать однозначно (количество не число) — такая строка
+        уходит на извлечение через LLM
+    """
+    columns = mapping["columns"]
+    name = _cell(cells, columns[NAME_FIELD])
+    match = QUANTITY_RE.match(_cell(cells, columns[QUANTITY_FIELD]).replace(" ", ""))
+    if not name or not match:
+        return None
+
+    value = float(match.group(1).replace(",", "."))
+    if value <= 0:
+        return None
+    brand = _cell(cells, columns.get(TYPE_COLUMN)).strip("-— ")
+    if brand and brand.lower() not in name.lower():
+        name = f"{name} {brand}"
+    unit = _cell(cells, columns.get(UNIT_FIELD)) or match.group(2) or mapping["unit"] or ""
+    return {
+        NAME_FIELD: name,
+        QUANTITY_FIELD: int(value) if value.is_integer() else value,
+        UNIT_FIELD: unit,
+    }
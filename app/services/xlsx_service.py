@@ -1,19 +1,39 @@
+import asyncio
+import itertools
 import json
-import re
-import pandas as pd
-from typing import Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from loguru import logger
 from mistralai import Mistral
-from tqdm import tqdm
 
 from app.core.config import settings
 from app.models.document import DocumentResponse, DocumentItem
-from app.services.price_list_service import PriceListService
+from app.services.price_list_service import PriceListService, ItemsCallback
 from app.services.llms.llm_factory import LLMFactory
+from app.services.llms.retry import LLMRequestError, call_with_retry
+from app.services.llms.schemas import SOURCE_ROW_FIELD, XLSX_ITEMS_SCHEMA, response_items
+from app.services.batching import estimate_tokens, get_token_budget, pack_batches
+from app.services.excel_readers import XlsxRowStream, list_sheet_names
+from app.services.table_serializer import TABLE_FORMAT_NOTE, serialize_rows
+from app.services.xlsx_columns import find_header, map_row, skip_row
+from app.core.executors import executors
 
 openai_llm = LLMFactory.get_instance("openai")
 llm = openai_llm
 
+# Инструкция для извлечения товаров из батча строк листа
+XLSX_EXTRACTION_PROMPT = """найди все товары и верни их в виде списка в формате json с полями "Наименование":"наименование товара","Количество":"количество товара","Ед.изм.":"единица измерения товара" . Одним массивом например [
+        {
+          "Наименование": "Воздуховод гибкии изолированный",
+          "Количество": 12,
+          "Ед.изм.": "м"
+        },
+        {
+          "Наименование": "Воздуховод гибкии изолированный",
+          "Количество": 1,
+          "Ед.изм.": "м"
+        }] 
+        """ + f'В поле "{SOURCE_ROW_FIELD}" укажи номер строки таблицы (столбец "стр"), из которой взят товар.'
+
 logger.add(
     "xlsx_service.log",
     encoding="utf-8",
@@ -24,6 +44,35 @@ logger.add(
 )
 
 
+def _source_rows(products: List[Any], row_numbers: List[int]) -> List[Tuple[int, Any]]:
+    """
+    Номер строки листа для каждого товара из ответа LLM на батч
+
+    Номер берется из поля SOURCE_ROW_FIELD (поле удаляется из товара). Если
+    номера нет или он не из этого батча, товар относится к строке
+    предыдущего товара — так сохраняется порядок ответа внутри батча.
+
+    Args:
+        products: Товары из ответа LLM
+        row_numbers: Номера строк листа в батче по порядку
+
+    Returns:
+        List: (номер строки листа, товар)
+    """
+    batch_rows = set(row_numbers)
+    row_number = row_numbers[0]
+    entries = []
+    for product in products:
+        if isinstance(product, dict):
+            source_row = product.pop(SOURCE_ROW_FIELD, None)
+            if isinstance(source_row, str) and source_row.strip().isdigit():
+                source_row = int(source_row)
+            if source_row in batch_rows:
+                row_number = source_row
+        entries.append((row_number, product))
+    return entries
+
+
 class XLSXService:
     def __init__(self):
         self._client = Mistral(
@@ -47,138 +96,226 @@ class XLSXService:
     def get_progress_bar(self, progress_bar_id: str) -> dict:
         return self.progress_bars.get(progress_bar_id, None)
 
-    def prepare_text_anserw_to_dict(self, text: str) -> list:
+    async def _extract_sheet(
+        self, file_path: str, sheet_name: str, progress: Callable[[int, int], None],
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
         """
-        Извлекает список товаров из текста, содержащего JSON-блок
+        Извлечение товаров с одного листа книги
+
+        Лист читается построчно (openpyxl read_only) и сразу собирается в батчи
+        по бюджету токенов модели: на строку таблицы в ответе приходится
+        ~20 токенов JSON-обвязки. В памяти одновременно только батчи в работе.
 
         Args:
-            text: Исходный текст с JSON-блоком
+            file_path: Путь к XLSX файлу
+            sheet_name: Имя листа
+            progress: Функция (обработано строк, всего строк) для прогресс-бара
 
         Returns:
-            list: Список словарей с товарами или None при ошибке
+            Tuple: (товары в порядке строк листа, статистика распознавания столбцов)
         """
-        try:
-            # Ищем JSON-блок между ```json и ```
-            json_match = re.search(r"```json\s*(.*?)\s*```", text, re.DOTALL)
+        stream = await executors.run_io(XlsxRowStream, file_path, sheet_name)
+        with stream:
+            budget = get_token_budget(llm.model)
+            rows = stream.rows()
+            # Заголовок ищется среди первых непустых строк: над таблицей часто
+            # идут название заявки и реквизиты. Если столбцы наименования и
+            # количества распознаны, строки с числовым количеством берутся без LLM,
+            # а заголовки разделов и итоги пропускаются
+            head = []
+            while len(head) < max(1, settings.XLSX_HEADER_SCAN_ROWS):
+                row = await executors.run_io(next, rows, None)
+                if row is None:
+                    break
+                head.append(row)
+            position, mapping = (None, {"columns": None})
+            if settings.XLSX_COLUMN_MAPPING_ENABLED:
+                position, mapping = await executors.run_io(find_header, head)
+            if position is None:
+                # Столбцы не распознаны — заголовком считается первая строка
+                position = 0
+            header = head[position] if head else None
+            header_cells = header[1] if header else None
+            column_stats = {
+                "columns": mapping["columns"],
+                "header_row": header[0] if header else None,
+                "direct_rows": 0,
+                "llm_rows": 0,
+                "skipped_rows": 0,
+                "empty_quantity_rows": 0,
+            }
+            # Строки с наименованием без количества: пропускаются как заголовки
+            # разделов, номера сохраняются для предупреждения в логе
+            empty_quantity_rows = []
+            # Найденные напрямую товары и товары из ответов LLM: (номер строки листа, товар)
+            entries = []
+
+            def llm_rows():
+                for row_number, cells in itertools.chain(head[position + 1:], rows):
+                    if mapping["columns"]:
+                        reason = skip_row(cells, mapping)
+                        if reason is not None:
+                            column_stats["skipped_rows"] += 1
+                            if reason == "empty_quantity":
+                                column_stats["empty_quantity_rows"] += 1
+                                empty_quantity_rows.append(row_number)
+                            continue
+                        item = map_row(cells, mapping)
+                        if item is not None:
+                            entries.append((row_number, item))
+                            column_stats["direct_rows"] += 1
+                            continue
+                    column_stats["llm_rows"] += 1
+                    yield row_number, cells
+
+            # Батч — список (номер строки, ячейки); заголовок повторяется в каждом батче.
+            # Оценка по строке через "|" — так строка попадет в запрос (serialize_rows)
+            def row_tokens(row) -> int:
+                return estimate_tokens(f"{row[0]}|" + "|".join(row[1]))
+
+            header_tokens = row_tokens(("стр", header_cells)) if header_cells else 0
+            batches = pack_batches(
+                llm_rows(),
+                input_tokens=row_tokens,
+                output_tokens=lambda row: 20 + row_tokens(row),
+                budget={**budget, "input": max(1, budget["input"] - header_tokens)},
+            )
+            total_rows = stream.max_row or 0
+            logger.debug(f"Лист XLSX {sheet_name}: около {total_rows} строк, бюджет {budget}, заголовок: {header_cells}, столбцы: {mapping['columns']}")
+
+            semaphore = asyncio.Semaphore(max(1, settings.LLM_BATCH_CONCURRENCY))
+            completed_rows = 0
 
-            if not json_match:
-                # Пробуем найти JSON-массив в тексте напрямую
-                text=text.replace("'",'"')
-                data=json.loads(text)
-                return data
+            async def extract(index: int, batch_rows: list):
+                nonlocal completed_rows
+                try:
+                    # Компактная запись: через "|", без пустых столбцов, с номерами строк листа
+                    batch = serialize_rows(batch_rows, header_cells)
+                    messages = [
+                        {
+                            "role": "user",
+                            "content": [
+                                {"type": "text", "text": XLSX_EXTRACTION_PROMPT},
+                                {"type": "text", "text": TABLE_FORMAT_NOTE},
+                                {"type": "text", "text": batch},
+                            ],
+                        }
+                    ]
+                    try:
+                        response = await call_with_retry(
+                            lambda: llm.chat_completion(messages=messages, max_tokens=budget["output"], response_schema=XLSX_ITEMS_SCHEMA),
+                            f"Батч {index} листа {sheet_name}",
+                        )
+                    except LLMRequestError as e:
+                        logger.error(str(e))
+                        response = {"text": "", "error": str(e)}
+                    if response.get("finish_reason") == "length":
+                        logger.warning(f"Ответ для батча {index} листа {sheet_name} обрезан по max_tokens={budget['output']}")
+                    logger.debug(f"Полученный ответ от API: {response['text']}")
 
-            json_str = json_match.group(1)
-            data = json.loads(json_str)
+                    # Структурированный ответ уже разобран; текст разбирается только как запасной вариант
+                    products = response_items(response)
+                    if not products:
+                        logger.warning(f"Не удалось получить товары из ответа для батча {index} листа {sheet_name}")
+                        products = []
+                    entries.extend(_source_rows(products, [row_number for row_number, _ in batch_rows]))
+                finally:
+                    semaphore.release()
 
-            if not isinstance(data, list):
-                raise TypeError("JSON не содержит список")
+                # Прогресс считаем по завершенным батчам, а не по порядку запуска
+                completed_rows += len(batch_rows)
+                rows_done = (column_stats["header_row"] or 0) + column_stats["direct_rows"] + column_stats["skipped_rows"] + completed_rows
+                progress(rows_done, total_rows)
 
-            return data
+            # Батчи отправляются в LLM параллельно, не более settings.LLM_BATCH_CONCURRENCY
+            # одновременно. Следующий батч читается из файла только при свободном месте,
+            # поэтому в памяти остаются лишь батчи в работе
+            tasks = []
+            try:
+                while True:
+                    await semaphore.acquire()
+                    batch_rows = await executors.run_io(next, batches, None)
+                    if batch_rows is None:
+                        semaphore.release()
+                        break
+                    tasks.append(asyncio.create_task(extract(len(tasks) + 1, batch_rows)))
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+            progress(total_rows, total_rows)
 
-        except (json.JSONDecodeError, TypeError, ValueError) as e:
-            logger.warning(f"Ошибка извлечения списка: {str(e)}")
-            return None
+        logger.info(f"Лист XLSX {sheet_name}: батчей {len(tasks)}, без LLM разобрано строк {column_stats['direct_rows']}, через LLM {column_stats['llm_rows']}")
+        if empty_quantity_rows:
+            shown = ", ".join(str(number) for number in empty_quantity_rows[:20])
+            more = f" и еще {len(empty_quantity_rows) - 20}" if len(empty_quantity_rows) > 20 else ""
+            logger.warning(f"Лист XLSX {sheet_name}: пропущены строки с наименованием без количества: {shown}{more}")
+        # Товары в порядке строк листа; товары одной строки — в порядке ответа
+        entries.sort(key=lambda entry: entry[0])
+        return [item for _, item in entries], column_stats
 
     async def process_xlsx_file(
-        self, file_path: str, original_filename: str, progress_bar_id: str = None
+        self, file_path: str, original_filename: str, progress_bar_id: str = None,
+        on_items: ItemsCallback = None,
     ) -> DocumentResponse:
-        """Обработка XLSX файла с использованием Mistral API"""
+        """Обработка XLSX файла с использованием Mistral API
+
+        Каждый видимый лист книги обрабатывается отдельным потоком, не более
+        settings.XLSX_SHEET_CONCURRENCY листов одновременно; запросы всех листов
+        делят общий лимит LLM (settings.LLM_MAX_CONCURRENCY). Товары в ответе
+        идут по порядку листов и строк и помечены именем листа.
+
+        on_items получает нормализованные товары по мере готовности пачек.
+        """
         try:
             logger.debug(f"Обработка XLSX файла: {original_filename} {progress_bar_id}")
             self.update_progress_bar(progress_bar_id, "Обработка XLSX файла", 10, 100)
-            # Чтение данных из XLSX файла
             try:
-                df = pd.read_excel(file_path)
-                # Преобразование DataFrame в текстовый формат
-                xlsx_content = df.to_string(index=False)
-                logger.debug("Содержимое XLSX файла преобразовано в текст")
+                sheet_names = await executors.run_io(list_sheet_names, file_path)
             except Exception as e:
                 logger.error(f"Ошибка при чтении XLSX файла: {str(e)}")
                 raise ValueError(f"Не удалось прочитать XLSX файл: {str(e)}")
-            xlsx_content=xlsx_content.replace('NaN', '')
-            logger.debug(f"Содержимое XLSX файла: \n{xlsx_content}")
 
-            # Разбиваем содержимое на батчи по 30 строк
-            
-            lines = xlsx_content.split('\n')
-            batch_size = 30
-            batches = ['\n'.join(lines[i:i+batch_size]) for i in range(0, len(lines), batch_size)]
-            logger.debug(f"Файл разбит на {len(batches)} батчей по {batch_size} строк")
-            
-            self.update_progress_bar(progress_bar_id, f"Обработка батчей XLSX {len(batches)} по {batch_size} строк", 11, 100)
-            all_products = []
-            index=1
+            self.update_progress_bar(progress_bar_id, f"Обработка листов XLSX: {len(sheet_names)}", 11, 100)
             max_percent_is_step=40
             now_percent_step=self.progress_bars[progress_bar_id]['processed']
             max_percent_step=max_percent_is_step - now_percent_step
-            percent_step=round(max_percent_step/len(batches),1)
-            logger.debug(f"percent_step: {percent_step}")
-            
-            for batch in tqdm(batches, desc="Обработка батчей XLSX"):
-                self.update_progress_bar(progress_bar_id, f"Распознавание товаров из батча {index} из {len(batches)}", percent_step*index, 100)
-                messages = [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": """найди все товары и верни их в виде списка в формате json с полями "Наименование":"наименование товара","Количество":"количество товара","Ед.изм.":"единица измерения товара" . Одним массивом например [
-    {
-      "Наименование": "Воздуховод гибкии изолированный",
-      "Количество": 12,
-      "Ед.изм.": "м"
-    },
-    {
-      "Наименование": "Воздуховод гибкии изолированный",
-      "Количество": 1,
-      "Ед.изм.": "м"
-    }] 
-    """,
-                            },
-                            {"type": "text", "text": batch},
-                        ],
-                    }
-                ]
-
-                # Получаем ответ от API
-                # chat_response = await self._client.chat.complete_async(
-                #     model="mistral-large-latest", messages=messages, max_tokens=40000
-                # )
-
-                # # Получаем содержимое ответа
-                # text = chat_response.choices[0].message.content
-                # response = await llm.chat_completion(messages=messages, model='gpt-4.1-nano-2025-04-14')
-                response = await llm.chat_completion(messages=messages)
-                text=response['text']
-
-                logger.debug(f"Полученный ответ от API: {text}")
+            sheet_progress = {name: 0.0 for name in sheet_names}
+            sheet_stats = {}
+            self.progress_bars[progress_bar_id].setdefault("stats", {})["xlsx_sheets"] = sheet_stats
 
-                try:
-                    # Пытаемся распарсить JSON
-                    products = self.prepare_text_anserw_to_dict(text)
-                    if not products:
-                        # Если не удалось распарсить JSON или результат пустой, создаем пустой список
-                        products = []
-                except Exception as e:
-                    logger.warning(
-                        f"Не удалось распарсить JSON: {str(e)}, возвращаем текст как есть"
-                    )
-                    # Создаем простой формат для отображения
-                    products = [
-                        {"Наименование": text, "Количество": "", "Ед.изм.": ""}
-                    ]
+            def progress_for(sheet_name: str) -> Callable[[int, int], None]:
+                def update(rows_done: int, total_rows: int):
+                    sheet_progress[sheet_name] = min(1.0, rows_done / max(total_rows, 1))
+                    percent = now_percent_step + max_percent_step * sum(sheet_progress.values()) / max(len(sheet_progress), 1)
+                    self.update_progress_bar(progress_bar_id, f"Распознавание товаров: лист {sheet_name}, строк {min(rows_done, total_rows)} из {total_rows}", percent, 100)
+                return update
+
+            sheet_semaphore = asyncio.Semaphore(max(1, settings.XLSX_SHEET_CONCURRENCY))
+
+            async def process_sheet(sheet_name: str) -> List[Dict[str, Any]]:
+                async with sheet_semaphore:
+                    products, column_stats = await self._extract_sheet(file_path, sheet_name, progress_for(sheet_name))
+                sheet_stats[sheet_name] = {**column_stats, "items": len(products)}
+                return products
 
-                all_products.extend(products)
-                index+=1
+            sheet_products = await asyncio.gather(*(process_sheet(name) for name in sheet_names))
+            self.progress_bars[progress_bar_id]["stats"]["xlsx_sheets"] = {name: sheet_stats[name] for name in sheet_names}
+            all_products = [item for products in sheet_products for item in products]
+            item_sheets = [name for name, products in zip(sheet_names, sheet_products) for _ in products]
             # Создаем уникальный ID для файла
             file_id = f"xlsx_{original_filename}"
 
             
             price_list_service = PriceListService()
 
-            enriched_products = await price_list_service.find_matching_items(items=all_products,
+            # Нормализация одним списком по всем листам, чтобы пачки LLM были полными;
+            # записи каждого товара остаются привязаны к его листу
+            enriched_groups = await price_list_service.find_matching_item_groups(items=all_products,
                                                     progress_bars=self.progress_bars,
-                                                    progress_bar_id=progress_bar_id)
+                                                    progress_bar_id=progress_bar_id,
+                                                    on_items=on_items)
 
             document_response = DocumentResponse(
                 id=file_id,
@@ -187,10 +324,13 @@ class XLSXService:
                     DocumentItem(
                         text=item
                         if isinstance(item, str)
-                        else json.dumps(item, ensure_ascii=False)
+                        else json.dumps(item, ensure_ascii=False),
+                        sheet=sheet_name,
                     )
-                    for item in enriched_products
+                    for sheet_name, group in zip(item_sheets, enriched_groups)
+                    for item in group
                 ],
+                stats=self.progress_bars.get(progress_bar_id, {}).get("stats"),
             )
 
             # Сохранение результата
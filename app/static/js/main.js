@@ -179,7 +179,7 @@ document.addEventListener('DOMContentLoaded', () => {
                         // Отображаем результаты
                         displayResults(statusData);
                         break;
-                    } else if (statusData.status === 'error') {
+                    } else if (statusData.status === 'error' || statusData.status === 'failed') {
                         // Произошла ошибка
                         stopProgressMonitoring();
                         throw new Error(statusData.error || 'Произошла ошибка при обработке документа');
@@ -3,6 +3,7 @@ import os
 from pprint import pprint
 import uuid
 from app.core.config import settings
+from app.core.metrics import CHROMA_OPERATION_DURATION
 from mistralai import Mistral
 import chromadb
 from chromadb.config import Settings as ChromaSettings
@@ -114,12 +115,13 @@ class ChromaWork:
             })
             embeddings.append(embedding)
             
-        self.collection.add(
-            ids=[pitem["id"] for pitem in prepared_items],
-            documents=[pitem["document"] for pitem in prepared_items],
-            metadatas=[pitem["metadata"] for pitem in prepared_items],
-            embeddings=embeddings  # Передаем список эмбеддингов
-        )
+        with CHROMA_OPERATION_DURATION.time(operation="add"):
+            self.collection.add(
+                ids=[pitem["id"] for pitem in prepared_items],
+                documents=[pitem["document"] for pitem in prepared_items],
+                metadatas=[pitem["metadata"] for pitem in prepared_items],
+                embeddings=embeddings  # Передаем список эмбеддингов
+            )
         
     def get_items(self,query:str,n_results:int=2, isReturnPromt:bool=False):
         embeddings = self.mistral_client.embeddings.create(
@@ -130,20 +132,22 @@ class ChromaWork:
         embeddings = embeddings.data[0].embedding
         # print(embeddings)
         if isReturnPromt:
-            requests=self.collection.query(
-                query_embeddings=[embeddings],
-                n_results=n_results
-            )
+            with CHROMA_OPERATION_DURATION.time(operation="query"):
+                requests=self.collection.query(
+                    query_embeddings=[embeddings],
+                    n_results=n_results
+                )
             # pprint(requests)
             return requests['metadatas'][0][0]["promt"]
         else:
             
             
-            return self.collection.query(
-                query_embeddings=[embeddings],
-                # query_texts=[query],
-                n_results=n_results
-            )
+            with CHROMA_OPERATION_DURATION.time(operation="query"):
+                return self.collection.query(
+                    query_embeddings=[embeddings],
+                    # query_texts=[query],
+                    n_results=n_results
+                )
     def delete_collection(self):    
         self.logger.info(f"Удаление коллекции {self.CHROMA_COLLECTION_NAME}")        
         self.client.delete_collection(name=self.CHROMA_COLLECTION_NAME)
@@ -920,6 +920,28 @@ def process_row_from_list(result)->list[dict]:
 # Отвод круглого воздуховода 90° Ø125, b=0,8 5 шт 
 # Отвод прямоугольного воздуховода 90° 100×150, b=0,8 1 шт 
 # Отвод прямоугольного воздуховода 90° 150×100, b=0,8 1 шт
+def process_record_groups(groups: list[list[dict]]) -> list[tuple]:
+    """
+    Обработка нескольких независимых групп записей одним вызовом
+
+    Нужна для пула процессов: одна отправка в дочерний процесс вместо вызова
+    process_row_from_list на каждую запись. Ошибка в группе не влияет на остальные.
+
+    Args:
+        groups: Группы записей для process_row_from_list
+
+    Returns:
+        list: Для каждой группы (товары, None) или (None, текст ошибки)
+    """
+    results = []
+    for records in groups:
+        try:
+            results.append((process_row_from_list(records), None))
+        except Exception as e:
+            results.append((None, str(e)))
+    return results
+
+
 if __name__ == "__main__":  
     from pprint import pprint
     result = [{'Длина': '1250',
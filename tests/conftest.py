@@ -0,0 +1,7 @@
+"""Общие настройки тестов: кэши, очередь задач и векторная база пишутся во временный каталог"""
+import os
+import tempfile
+
+_TEST_DIR = tempfile.mkdtemp(prefix="ocr_tests_")
+os.environ.setdefault("CACHE_DIR", _TEST_DIR)
+os.environ.setdefault("CHROMA_DB_DIR", os.path.join(_TEST_DIR, "vectordb"))
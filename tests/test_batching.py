@@ -0,0 +1,44 @@
+from app.core.config import settings
+from app.services.batching import OUTPUT_BUDGET_RESERVE, estimate_tokens, get_token_budget, pack_batches
+
+
+def pack(items, budget, max_items=100):
+    return list(pack_batches(items, len, lambda item: 1, budget, max_items=max_items))
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("a" * 10) == 4
+
+
+def test_batches_respect_input_budget_and_keep_order():
+    items = ["a" * 4, "b" * 4, "c" * 4, "d" * 4, "e" * 4]
+    batches = pack(items, {"input": 10, "output": 100})
+    assert batches == [items[0:2], items[2:4], items[4:]]
+
+
+def test_batches_respect_output_budget():
+    budget = {"input": 1000, "output": 10}
+    batches = pack(["x"] * 20, budget)
+    assert [len(batch) for batch in batches] == [int(10 * OUTPUT_BUDGET_RESERVE)] * 2 + [4]
+
+
+def test_batches_respect_max_items():
+    assert [len(batch) for batch in pack(["x"] * 7, {"input": 1000, "output": 1000}, max_items=3)] == [3, 3, 1]
+
+
+def test_oversized_item_goes_alone():
+    items = ["a", "b" * 50, "c"]
+    assert pack(items, {"input": 10, "output": 100}) == [["a"], ["b" * 50], ["c"]]
+
+
+def test_accepts_generator():
+    generated = (str(number) for number in range(5))
+    assert pack(generated, {"input": 2, "output": 100}) == [["0", "1"], ["2", "3"], ["4"]]
+
+
+def test_model_budget_overrides_default(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_DEFAULT_TOKEN_BUDGET", {"input": 100, "output": 50})
+    monkeypatch.setattr(settings, "LLM_TOKEN_BUDGETS", {"big": {"input": 1000}})
+    assert get_token_budget("big") == {"input": 1000, "output": 50}
+    assert get_token_budget("other") == {"input": 100, "output": 50}
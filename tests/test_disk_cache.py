@@ -0,0 +1,43 @@
+import asyncio
+
+from app.services.disk_cache import DiskLRUCache
+
+
+def test_set_get_and_overwrite(tmp_path):
+    cache = DiskLRUCache(str(tmp_path / "cache.sqlite3"), max_entries=10)
+    cache.set("a", {"value": 1})
+    cache.set("a", {"value": 2})
+    assert cache.get("a") == {"value": 2}
+    assert cache.get("missing") is None
+    assert len(cache) == 1
+    assert cache._count == 1
+
+
+def test_eviction_keeps_recent_entries_and_frees_slack(tmp_path):
+    cache = DiskLRUCache(str(tmp_path / "cache.sqlite3"), max_entries=100)
+    for index in range(101):
+        cache.set(f"key{index}", index)
+    # Вытеснение освобождает запас, а не одну запись
+    assert len(cache) == 100 - int(100 * DiskLRUCache.EVICTION_SLACK)
+    assert cache._count == len(cache)
+    assert cache.get("key0") is None
+    assert cache.get("key100") == 100
+
+
+def test_count_survives_reopen_and_delete(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = DiskLRUCache(path, max_entries=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.delete("a")
+    assert DiskLRUCache(path, max_entries=10)._count == 1
+
+
+def test_async_wrappers(tmp_path):
+    cache = DiskLRUCache(str(tmp_path / "cache.sqlite3"), max_entries=10)
+
+    async def scenario():
+        await cache.aset("a", [1, 2])
+        return await cache.aget("a")
+
+    assert asyncio.run(scenario()) == [1, 2]
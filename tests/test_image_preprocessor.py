@@ -0,0 +1,93 @@
+import pytest
+from PIL import Image
+
+from app.core.config import settings
+from app.services.image_preprocessor import ImageTile, _tile_boxes, merge_tile_items, preprocess_image
+
+
+def item(name, quantity="1", unit="шт"):
+    return {"Наименование": name, "Количество": quantity, "Ед.изм.": unit}
+
+
+def strips(*tops, height=1000, width=3000):
+    return [ImageTile([f"{top}.jpg"], (0, top, width, top + height)) for top in tops]
+
+
+def test_tiles_are_grid_of_strips(monkeypatch):
+    monkeypatch.setattr(settings, "IMAGE_TILE_SIZE", 1000)
+    monkeypatch.setattr(settings, "IMAGE_TILE_OVERLAP", 200)
+    assert _tile_boxes(2500, 1800) == [
+        [(0, 0, 1000, 1000), (800, 0, 1800, 1000), (1500, 0, 2500, 1000)],
+        [(0, 800, 1000, 1800), (800, 800, 1800, 1800), (1500, 800, 2500, 1800)],
+    ]
+    assert _tile_boxes(900, 900) == [[(0, 0, 900, 900)]]
+
+
+def test_overlap_rows_are_merged():
+    tiles = strips(0, 800)
+    first = [item("Воздуховод 200x100", "12", "м"), item("Отвод 90 ø125", "4")]
+    second = [item("отвод 90 Ø125.", "4"), item("Заглушка ø125", "2")]
+    merged = merge_tile_items(tiles, [first, second])
+    assert merged == first + second[1:]
+
+
+def test_near_duplicate_names_are_kept():
+    tiles = strips(0, 800)
+    first = [item("Воздуховод 100", "5", "м")]
+    second = [item("Воздуховод 1000x500", "5", "м")]
+    assert merge_tile_items(tiles, [first, second]) == first + second
+
+
+def test_repeated_row_in_non_adjacent_strips_is_kept():
+    tiles = strips(0, 800, 1600)
+    row = item("Хомут ø160", "10")
+    tile_items = [[row], [item("Решетка 400x200", "3")], [row]]
+    assert merge_tile_items(tiles, tile_items) == [row, tile_items[1][0], row]
+
+
+def test_repeated_row_outside_overlap_band_is_kept():
+    tiles = strips(0, 800)
+    row = item("Хомут ø160", "10")
+    first = [row] + [item(f"Позиция {number}") for number in range(9)]
+    second = [row, item("Решетка 400x200", "3")]
+    assert merge_tile_items(tiles, [first, second]) == first + second
+
+
+def test_decompression_bomb_is_rejected(tmp_path, monkeypatch):
+    path = tmp_path / "bomb.png"
+    Image.new("L", (100, 100), 255).save(path)
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    monkeypatch.setattr(settings, "IMAGE_PREPROCESSING_ENABLED", True)
+    with pytest.raises(ValueError, match="слишком большое"):
+        preprocess_image(str(path), str(tmp_path))
+
+
+def test_wide_page_keeps_resolution_and_dpi(tmp_path, monkeypatch):
+    path = tmp_path / "scan.png"
+    Image.new("L", (600, 250), 255).save(path, dpi=(300, 300))
+    monkeypatch.setattr(settings, "IMAGE_PREPROCESSING_ENABLED", True)
+    monkeypatch.setattr(settings, "IMAGE_TILING_THRESHOLD", 500)
+    monkeypatch.setattr(settings, "IMAGE_TILE_SIZE", 200)
+    monkeypatch.setattr(settings, "IMAGE_TILE_OVERLAP", 50)
+    monkeypatch.setattr(settings, "IMAGE_MAX_SIDE", 100)
+    [tiles] = preprocess_image(str(path), str(tmp_path))
+    assert [tile.box for tile in tiles] == [(0, 0, 600, 200), (0, 50, 600, 250)]
+    for tile in tiles:
+        assert len(tile.paths) == 4
+        for tile_path in tile.paths:
+            with Image.open(tile_path) as image:
+                # Части не уменьшаются до IMAGE_MAX_SIDE и сохраняют плотность исходника
+                assert image.size == (200, 200)
+                assert image.info["dpi"] == pytest.approx((300, 300), abs=1)
+
+
+def test_downscaled_page_dpi_is_scaled(tmp_path, monkeypatch):
+    path = tmp_path / "scan.png"
+    Image.new("L", (400, 200), 255).save(path, dpi=(300, 300))
+    monkeypatch.setattr(settings, "IMAGE_PREPROCESSING_ENABLED", True)
+    monkeypatch.setattr(settings, "IMAGE_TILING_THRESHOLD", 0)
+    monkeypatch.setattr(settings, "IMAGE_MAX_SIDE", 200)
+    [[tile]] = preprocess_image(str(path), str(tmp_path))
+    with Image.open(tile.paths[0]) as image:
+        assert image.size == (200, 100)
+        assert image.info["dpi"] == pytest.approx((150, 150), abs=1)
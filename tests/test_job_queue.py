@@ -0,0 +1,127 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.core.config import settings
+from app.services.job_queue import COMPLETED, FAILED, QUEUED, RUNNING, JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(settings, "JOB_RETRY_BASE_DELAY", 0)
+    monkeypatch.setattr(settings, "JOB_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(settings, "JOB_WORKERS", 1)
+    return JobQueue(str(tmp_path / "jobs.sqlite3"))
+
+
+def run_until(queue, handler, finalizer, job_id, statuses):
+    async def main():
+        queue.start(handler, finalizer)
+        try:
+            while queue.get(job_id)["status"] not in statuses:
+                await asyncio.sleep(0.01)
+        finally:
+            await queue.stop()
+
+    asyncio.run(asyncio.wait_for(main(), timeout=10))
+
+
+def test_failed_job_is_retried_until_success(queue):
+    calls = []
+    finalized = []
+
+    async def handler(payload):
+        calls.append(payload["n"])
+        if len(calls) == 1:
+            raise RuntimeError("сбой")
+        return {"ok": True}
+
+    job_id = queue.enqueue({"n": 1})
+    run_until(queue, handler, lambda payload, result: finalized.append(result), job_id, (COMPLETED,))
+
+    job = queue.get(job_id)
+    assert calls == [1, 1]
+    assert job["attempts"] == 2 and job["result"] == {"ok": True} and job["error"] is None
+    assert finalized == [{"ok": True}]
+
+
+def test_job_fails_after_last_attempt_and_is_finalized_once(queue):
+    finalized = []
+
+    async def handler(payload):
+        raise RuntimeError("сбой")
+
+    job_id = queue.enqueue({"n": 1})
+    run_until(queue, handler, lambda payload, result: finalized.append((payload, result)), job_id, (FAILED,))
+
+    job = queue.get(job_id)
+    assert job["attempts"] == 2 and job["error"] == "сбой"
+    assert finalized == [({"n": 1}, None)]
+
+
+def expire_lease(queue, job_id):
+    with queue._conn:
+        queue._conn.execute("UPDATE jobs SET lease_until = 0 WHERE id = ?", (job_id,))
+
+
+def test_interrupted_job_is_recovered_after_lease_expires(queue):
+    job_id = queue.enqueue({"n": 1})
+    assert queue._claim()["id"] == job_id
+    assert queue.get(job_id)["status"] == RUNNING
+
+    reopened = JobQueue(queue.path)
+    reopened._recover()
+    # Аренда действует: задачу выполняет другой процесс
+    assert reopened.get(job_id)["status"] == RUNNING
+
+    expire_lease(queue, job_id)
+    reopened._recover()
+    assert reopened.get(job_id)["status"] == QUEUED
+    assert reopened._claim()["attempts"] == 2
+
+
+def test_interrupted_job_without_attempts_left_fails(queue):
+    finalized = []
+    job_id = queue.enqueue({"n": 1})
+    for _ in range(settings.JOB_MAX_ATTEMPTS - 1):
+        queue._claim()
+        expire_lease(queue, job_id)
+        queue._recover()
+    # Последняя попытка прервана остановкой процесса
+    queue._claim()
+    expire_lease(queue, job_id)
+
+    reopened = JobQueue(queue.path)
+    reopened._finalizer = lambda payload, result: finalized.append((payload, result))
+    reopened._recover()
+    job = reopened.get(job_id)
+    assert job["status"] == FAILED and job["attempts"] == settings.JOB_MAX_ATTEMPTS
+    assert finalized == [({"n": 1}, None)]
+    assert reopened._claim() is None
+
+
+def test_job_is_claimed_once_by_competing_queues(queue):
+    job_ids = {queue.enqueue({"n": number}) for number in range(50)}
+    queues = [queue, JobQueue(queue.path), JobQueue(queue.path)]
+    claimed = []
+
+    def drain(worker_queue):
+        while (job := worker_queue._claim()) is not None:
+            claimed.append(job["id"])
+
+    threads = [threading.Thread(target=drain, args=(worker_queue,)) for worker_queue in queues for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == sorted(job_ids)
+
+
+def test_retry_is_delayed(queue, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_RETRY_BASE_DELAY", 60)
+    job_id = queue.enqueue({"n": 1})
+    job = queue._claim()
+    assert queue._fail(job_id, job["attempts"], "сбой") == QUEUED
+    assert queue._claim() is None
@@ -0,0 +1,58 @@
+import pytest
+
+from app.services.line_parser import parse_item_line
+
+
+def parse(name, quantity="", unit=""):
+    return parse_item_line({"Наименование": name, "Количество": quantity, "Ед.изм.": unit})
+
+
+@pytest.mark.parametrize("name", ["Отвод 45", "Отвод 30", "Отвод 90", "Отвод 180", "Отвод 120"])
+def test_bend_with_bare_angle_goes_to_llm(name):
+    assert parse(name, 2, "шт") is None
+
+
+@pytest.mark.parametrize("name", ["Заглушка 80", "Воздуховод 50"])
+def test_two_digit_bare_number_is_not_a_size(name):
+    assert parse(name, 1, "шт") is None
+
+
+def test_bend_with_bare_diameter_uses_default_angle():
+    record = parse("Отвод 125", 3, "шт")
+    assert record["Размер"] == "125"
+    assert record["Угол"] == "90"
+    assert record["Кол-во"] == "3"
+
+
+def test_bend_with_marked_angle_and_diameter():
+    record = parse("Отвод 45° ø100", 2, "шт")
+    assert record["Размер"] == "100"
+    assert record["Угол"] == "45"
+
+
+def test_bend_with_dash_angle():
+    record = parse("Отвод-45 ф160", 1, "шт")
+    assert record["Угол"] == "45"
+    assert record["Размер"] == "160"
+
+
+def test_round_marker_allows_two_digit_diameter():
+    record = parse("Заглушка ø80", 4, "шт")
+    assert record["Размер"] == "80"
+
+
+def test_bare_three_digit_plug_is_diameter():
+    assert parse("Заглушка 160", 1, "шт")["Размер"] == "160"
+
+
+def test_rectangular_duct_with_thickness_and_trailing_quantity():
+    record = parse("Воздуховод 500x300 б=0,7 мм 12 м")
+    assert record["Наименование"] == "Труба"
+    assert record["Размер"] == "500x300"
+    assert record["Толщина"] == "0,7"
+    assert record["Ед. изм."] == "ПМ"
+    assert record["Кол-во"] == "12"
+
+
+def test_unknown_words_go_to_llm():
+    assert parse("Воздуховод гибкий 160", 5, "м") is None
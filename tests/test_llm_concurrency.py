@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.core.metrics import LLM_QUEUE_WAIT, LLM_REQUEST_DURATION
+from app.services.llms.concurrency import limit_concurrency, llm_limiter
+from app.services.llms.instrumentation import track_llm_call
+from app.services.llms.retry import LLMRequestError, call_with_retry
+
+REQUEST_TIME = 0.05
+
+
+class FakeWork:
+    model = "fake-model"
+    client = object()
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+
+    @track_llm_call
+    @limit_concurrency
+    async def chat_completion(self, name):
+        self.calls += 1
+        await asyncio.sleep(REQUEST_TIME)
+        if self.calls <= self.failures:
+            return {"text": "", "error": "timeout"}
+        return {"text": name, "tokens": 1}
+
+
+def histogram_state(histogram, **labels):
+    """(sum, count) наблюдений гистограммы с метками"""
+    state = histogram._values.get(histogram._label_values(labels), [0.0, 0])
+    return state[-2], state[-1]
+
+
+@pytest.fixture(autouse=True)
+def single_slot(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_CONCURRENCY", 1)
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_DELAY", 0.2)
+    monkeypatch.setattr(settings, "LLM_RETRY_MAX_DELAY", 0.2)
+    monkeypatch.setattr(llm_limiter, "_semaphore", None)
+
+
+def test_queue_wait_is_not_counted_as_request_duration():
+    labels = {"provider": "fake", "model": "fake-model", "method": "chat_completion"}
+    duration_before = histogram_state(LLM_REQUEST_DURATION, **labels)
+    wait_before = histogram_state(LLM_QUEUE_WAIT)
+
+    async def main():
+        work = FakeWork()
+        return await asyncio.gather(*(work.chat_completion(str(number)) for number in range(3)))
+
+    assert [response["text"] for response in asyncio.run(main())] == ["0", "1", "2"]
+
+    duration_sum, duration_count = histogram_state(LLM_REQUEST_DURATION, **labels)
+    wait_sum, wait_count = histogram_state(LLM_QUEUE_WAIT)
+    assert duration_count - duration_before[1] == 3
+    # Каждый запрос ждал своей очереди, но в длительность попало только его время
+    assert duration_sum - duration_before[0] < 3 * REQUEST_TIME * 1.8
+    assert wait_count - wait_before[1] == 3
+    assert wait_sum - wait_before[0] >= 3 * REQUEST_TIME * 0.9
+
+
+def test_retry_pause_releases_slot(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 1)
+    events = []
+
+    async def main():
+        failing = FakeWork(failures=1)
+        other = FakeWork()
+
+        async def retried():
+            response = await call_with_retry(lambda: failing.chat_completion("retried"))
+            events.append("retried")
+            return response
+
+        async def second():
+            await asyncio.sleep(REQUEST_TIME * 1.5)
+            response = await other.chat_completion("other")
+            events.append("other")
+            return response
+
+        results = await asyncio.gather(retried(), second())
+        return failing, results
+
+    failing, results = asyncio.run(main())
+    assert failing.calls == 2
+    assert [response["text"] for response in results] == ["retried", "other"]
+    # Второй запрос выполнился, пока первый ждал повтора
+    assert events == ["other", "retried"]
+
+
+def test_limiter_returns_error_without_retrying():
+    work = FakeWork(failures=5)
+    assert asyncio.run(work.chat_completion("x"))["error"] == "timeout"
+    assert work.calls == 1
+
+
+def test_retry_budget_is_single_layer(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 2)
+    work = FakeWork(failures=5)
+    with pytest.raises(LLMRequestError):
+        asyncio.run(call_with_retry(lambda: work.chat_completion("x")))
+    assert work.calls == 3
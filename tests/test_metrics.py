@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from app.core.metrics import JOBS_IN_FLIGHT, MetricsRegistry
+
+
+def test_counter_exposition():
+    registry = MetricsRegistry()
+    counter = registry.counter("requests_total", "Запросы", ("status",))
+    counter.inc(status="ok")
+    counter.inc(2, status="ok")
+    counter.inc(0.5, status="error")
+    assert counter.render() == [
+        "# HELP requests_total Запросы",
+        "# TYPE requests_total counter",
+        'requests_total{status="error"} 0.5',
+        'requests_total{status="ok"} 3',
+    ]
+
+
+def test_metric_without_labels():
+    counter = MetricsRegistry().counter("pages_total", "Страницы")
+    counter.inc()
+    assert counter.render()[-1] == "pages_total 1"
+
+
+def test_histogram_exposition():
+    histogram = MetricsRegistry().histogram("duration_seconds", "Длительность", ("method",), buckets=(0.1, 1))
+    histogram.observe(0.05, method="chat")
+    histogram.observe(0.5, method="chat")
+    histogram.observe(3, method="chat")
+    assert histogram.render() == [
+        "# HELP duration_seconds Длительность",
+        "# TYPE duration_seconds histogram",
+        'duration_seconds_bucket{method="chat",le="0.1"} 1',
+        'duration_seconds_bucket{method="chat",le="1"} 2',
+        'duration_seconds_bucket{method="chat",le="+Inf"} 3',
+        'duration_seconds_sum{method="chat"} 3.55',
+        'duration_seconds_count{method="chat"} 3',
+    ]
+
+
+def test_histogram_time_fills_status():
+    histogram = MetricsRegistry().histogram("ocr_seconds", "OCR", ("status",), buckets=(1,))
+    with histogram.time():
+        pass
+    with pytest.raises(RuntimeError):
+        with histogram.time():
+            raise RuntimeError("boom")
+    rendered = histogram.render()
+    assert 'ocr_seconds_count{status="ok"} 1' in rendered
+    assert 'ocr_seconds_count{status="error"} 1' in rendered
+
+
+def test_label_values_are_escaped():
+    counter = MetricsRegistry().counter("files_total", "Файлы", ("name",))
+    counter.inc(name='C:\\tmp\\"a"\nb')
+    assert counter.render()[-1] == 'files_total{name="C:\\\\tmp\\\\\\"a\\"\\nb"} 1'
+
+
+def test_wrong_labels_are_rejected():
+    counter = MetricsRegistry().counter("requests_total", "Запросы", ("status",))
+    with pytest.raises(ValueError):
+        counter.inc(method="chat")
+
+
+def test_gauge_in_progress_decrements_on_error():
+    gauge = MetricsRegistry().gauge("jobs", "Задачи", ("service",))
+    with gauge.in_progress(service="ocr"):
+        assert gauge.render()[-1] == 'jobs{service="ocr"} 1'
+    with pytest.raises(RuntimeError):
+        with gauge.in_progress(service="ocr"):
+            raise RuntimeError("boom")
+    assert gauge.render() == [
+        "# HELP jobs Задачи",
+        "# TYPE jobs gauge",
+        'jobs{service="ocr"} 0',
+    ]
+
+
+def test_registry_renders_registered_metrics_once():
+    registry = MetricsRegistry()
+    first = registry.counter("requests_total", "Запросы")
+    assert registry.counter("requests_total", "Запросы") is first
+    first.inc()
+    assert registry.render() == "# HELP requests_total Запросы\n# TYPE requests_total counter\nrequests_total 1\n"
+
+
+def test_jobs_in_flight_balanced_when_job_fails(monkeypatch):
+    from app.api import routes
+
+    seen = []
+
+    async def failing(*args, **kwargs):
+        seen.append(JOBS_IN_FLIGHT._values[("xlsx",)])
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(routes.xlsx_service, "process_xlsx_file", failing)
+    before = JOBS_IN_FLIGHT._values.get(("xlsx",), 0)
+    with pytest.raises(RuntimeError):
+        asyncio.run(routes._process_uploaded_file("missing.xlsx", "a.xlsx", False, True))
+    assert seen == [before + 1]
+    assert JOBS_IN_FLIGHT._values[("xlsx",)] == before
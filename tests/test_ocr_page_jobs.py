@@ -0,0 +1,41 @@
+import asyncio
+import time
+
+from app.core.config import settings
+from app.services.ocr_service import OCRService
+
+
+def page_job(path, owns_file, age):
+    return {"file_path": str(path), "owns_file": owns_file, "touched_at": time.time() - age, "next_page": 40}
+
+
+def test_expired_page_jobs_are_dropped_with_owned_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "OCR_PAGE_JOB_TTL", 3600)
+    paths = {name: tmp_path / f"{name}.pdf" for name in ("stale", "shared", "fresh")}
+    for path in paths.values():
+        path.write_bytes(b"%PDF")
+
+    service = OCRService()
+    service._page_jobs = {
+        "stale": page_job(paths["stale"], True, 7200),
+        "shared": page_job(paths["shared"], False, 7200),
+        "fresh": page_job(paths["fresh"], True, 60),
+    }
+    service._expire_page_jobs()
+
+    assert list(service._page_jobs) == ["fresh"]
+    assert not paths["stale"].exists()
+    # Файл, сохраненный под именем клиента, может принадлежать другой загрузке
+    assert paths["shared"].exists()
+    assert paths["fresh"].exists()
+
+
+def test_continue_of_expired_document_returns_none(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "OCR_PAGE_JOB_TTL", 3600)
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(b"%PDF")
+    service = OCRService()
+    service._page_jobs = {"doc": page_job(path, True, 7200)}
+
+    assert asyncio.run(service.continue_document("doc")) is None
+    assert not path.exists()
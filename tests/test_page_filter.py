@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.services.page_filter import PageFilter
+
+SPEC = """| Наименование | Кол-во | Ед. изм. |
+|---|---|---|
+| Воздуховод 200x100 | 12 | м |
+| Отвод 90 ø125 | 4 | шт |
+"""
+
+TITLE = "Проект реконструкции здания школы. Раздел ОВ. Согласовано главным инженером проекта"
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(settings, "PAGE_FILTER_ENABLED", True)
+
+
+def test_blank_page():
+    assert PageFilter().check(0, "  \n| | |\n") == "blank"
+
+
+def test_page_without_products():
+    assert PageFilter().check(0, TITLE) == "no_products"
+
+
+def test_specification_page_is_kept():
+    assert PageFilter().check(0, SPEC) is None
+
+
+def test_exact_duplicate():
+    page_filter = PageFilter()
+    assert page_filter.check(0, SPEC) is None
+    assert page_filter.check(1, SPEC) == "duplicate"
+
+
+def test_near_duplicate_with_ocr_noise():
+    rows = "".join(f"| Воздуховод оцинкованный прямоугольный {size}x100 | {size // 10} | м |\n" for size in range(100, 1100, 50))
+    page = SPEC + rows
+    page_filter = PageFilter()
+    assert page_filter.check(0, page) is None
+    # Шум OCR в тексте при тех же числах — повтор
+    assert page_filter.check(1, page.replace("Отвод", "Отвoд")) == "duplicate"
+
+
+def test_same_text_with_other_quantities_is_kept():
+    page_filter = PageFilter()
+    assert page_filter.check(0, SPEC) is None
+    assert page_filter.check(1, SPEC.replace("| 12 |", "| 15 |")) is None
+
+
+def test_select_records_skipped_pages():
+    pages = [SimpleNamespace(index=number, markdown=markdown) for number, markdown in enumerate([TITLE, SPEC, SPEC, ""])]
+    page_filter = PageFilter()
+    assert [page.index for page in page_filter.select(pages)] == [1]
+    assert page_filter.skipped == [
+        {"page": 1, "reason": "no_products"},
+        {"page": 3, "reason": "duplicate"},
+        {"page": 4, "reason": "blank"},
+    ]
+
+
+def test_select_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "PAGE_FILTER_ENABLED", False)
+    pages = [SimpleNamespace(index=0, markdown="")]
+    assert PageFilter().select(pages) == pages
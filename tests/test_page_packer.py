@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+from app.services.page_packer import minify_markdown, pack_pages
+
+BUDGET = {"input": 6000, "output": 2000}
+
+TABLE = """| № | Наименование | Примечание | Кол-во |
+|---|---|---|---|
+| 1 | Воздуховод 200x100 |  | 12 |
+| 2 | Отвод 90 ø125 |  | 4 |
+"""
+
+
+def page(index, markdown):
+    return SimpleNamespace(index=index, markdown=markdown)
+
+
+def test_minify_drops_empty_and_row_number_columns():
+    assert minify_markdown(TABLE) == "Наименование|Кол-во\nВоздуховод 200x100|12\nОтвод 90 ø125|4"
+
+
+def test_minify_keeps_header_only_table():
+    assert minify_markdown("| Наименование | Кол-во |\n|---|---|\n") == "Наименование|Кол-во"
+
+
+def test_chunks_never_mix_pages():
+    pages = [page(0, "Спецификация"), page(1, TABLE), page(2, "Воздуховод 100 5 м")]
+    chunks = pack_pages(pages, BUDGET)
+    assert [chunk.pages for chunk in chunks] == [[0], [1], [2]]
+
+
+def test_page_chunk_text_does_not_depend_on_neighbours():
+    before = pack_pages([page(0, "Титул"), page(1, TABLE)], BUDGET)
+    after = pack_pages([page(0, "Титул, редакция 2"), page(1, TABLE)], BUDGET)
+    assert before[1].markdown == after[1].markdown
+
+
+def test_large_table_is_split_with_repeated_header():
+    rows = "\n".join(f"| Воздуховод {100 + i}x100 | {i + 1} |" for i in range(200))
+    markdown = "| Наименование | Кол-во |\n|---|---|\n" + rows
+    chunks = pack_pages([page(0, markdown)], {"input": 300, "output": 300})
+    assert len(chunks) > 1
+    assert all(chunk.markdown.startswith("Наименование|Кол-во\n") for chunk in chunks)
+    assert sum(chunk.blocks for chunk in chunks) == 200
@@ -0,0 +1,29 @@
+import pytest
+
+pymupdf = pytest.importorskip("pymupdf")
+
+from app.services.pdf_text_extractor import page_content_hashes  # noqa: E402
+
+
+def _form_xobject_pdf(path, text):
+    """PDF, в котором все содержимое страницы лежит во вложенных Form XObject"""
+    source = pymupdf.open()
+    source.new_page().insert_text((72, 72), text)
+    inner = pymupdf.open()
+    page = inner.new_page()
+    page.show_pdf_page(page.rect, source, 0)
+    outer = pymupdf.open()
+    page = outer.new_page()
+    page.show_pdf_page(page.rect, inner, 0)
+    outer.save(path)
+    return str(path)
+
+
+def test_form_xobject_change_changes_hash(tmp_path):
+    first = _form_xobject_pdf(tmp_path / "a.pdf", "Воздуховод 100 12 шт")
+    changed = _form_xobject_pdf(tmp_path / "b.pdf", "Воздуховод 200 12 шт")
+    same = _form_xobject_pdf(tmp_path / "c.pdf", "Воздуховод 100 12 шт")
+
+    hashes = [page_content_hashes(path, [0])[0] for path in (first, changed, same)]
+    assert hashes[0] != hashes[1]
+    assert hashes[0] == hashes[2]
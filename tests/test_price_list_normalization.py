@@ -0,0 +1,92 @@
+import ast
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services import price_list_service as module
+from app.services.price_list_service import PriceListService, normalization_cache, price_list_service
+
+FAILED_MARK = "❌ Не удалось обработать"
+
+
+def record(line):
+    return {
+        "Длина": "-", "Ед. изм.": "шт", "Кол-во": 1, "Наименование": line.split(" Количество:")[0],
+        "Размер": "", "Тип": "-", "Толщина": "", "Угол": "-",
+    }
+
+
+def items(count, bad=()):
+    return [
+        {"Наименование": f"Деталь номер {number}" + (" BAD" if number in bad else ""), "Количество": 1, "Ед.изм.": "шт"}
+        for number in range(count)
+    ]
+
+
+@pytest.fixture
+def llm_calls(monkeypatch):
+    """Подменяет запрос к LLM: строки с BAD пропадают из ответа; возвращает размеры запросов"""
+    calls = []
+
+    async def chat_completion(messages, **kwargs):
+        lines = ast.literal_eval(messages[1]["content"].split(": ", 1)[1])
+        calls.append(len(lines))
+        return {"text": "", "data": {"items": [record(line) for line in lines if "BAD" not in line]}}
+
+    monkeypatch.setattr(module.llm, "chat_completion", chat_completion)
+    monkeypatch.setattr(settings, "CPU_EXECUTOR_ENABLED", False)
+    normalization_cache.clear()
+    return calls
+
+
+def run(products):
+    progress_bars = {"test": {"text": "", "processed": 0, "total": 100}}
+    results = asyncio.run(price_list_service.find_matching_item_groups(products, progress_bars, "test"))
+    return results, progress_bars["test"]["stats"]
+
+
+def test_batch_is_bisected_down_to_bad_line(llm_calls):
+    results, stats = run(items(10, bad={6}))
+
+    assert llm_calls == [10, 5, 5, 2, 3, 1, 1]
+    assert [index for index, result in enumerate(results) if result[0]["Наименование"].startswith(FAILED_MARK)] == [6]
+    assert stats["normalization_retries"] == {"bisections": 3, "failed_items": 1}
+
+
+def test_batch_marked_failed_when_llm_unavailable(llm_calls, monkeypatch):
+    async def chat_completion(messages, **kwargs):
+        llm_calls.append(len(ast.literal_eval(messages[1]["content"].split(": ", 1)[1])))
+        return {"text": "", "error": "timeout"}
+
+    monkeypatch.setattr(module.llm, "chat_completion", chat_completion)
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 0)
+    results, stats = run(items(4))
+
+    # Недоступную LLM не дробят на пачки поменьше
+    assert llm_calls == [4]
+    assert all(result[0]["Наименование"].startswith("❌ Сервис нормализации недоступен") for result in results)
+    assert stats["normalization_retries"] == {"bisections": 0, "failed_items": 4}
+
+
+def test_multi_record_answer_for_single_line_is_not_cached(llm_calls, monkeypatch):
+    async def chat_completion(messages, **kwargs):
+        [line] = ast.literal_eval(messages[1]["content"].split(": ", 1)[1])
+        llm_calls.append(1)
+        return {"text": "", "data": {"items": [record(line), record(line + " часть 2")]}}
+
+    monkeypatch.setattr(module.llm, "chat_completion", chat_completion)
+    products = items(1)
+    results, _ = run(products)
+
+    assert len(results[0]) == 2
+    _, prompt_hash = module.rules_service.get_prompt(module.NAMING_RULES_PATH)
+    key = PriceListService._normalization_cache_key(PriceListService._item_to_line(products[0]), prompt_hash)
+    assert normalization_cache.get(key) is None
+
+
+def test_line_by_line_answer_is_cached(llm_calls):
+    products = items(3)
+    run(products)
+    run(products)
+    assert llm_calls == [3]
@@ -0,0 +1,36 @@
+from app.services.table_serializer import compact_text, serialize_rows
+
+
+def test_serialize_rows_drops_empty_columns_and_numbers_rows():
+    rows = [(5, ["Воздуховод 200x100", "", "12", "м"]), (6, ["Отвод 90 ø125", "", "4", "шт"])]
+    header = ["Наименование", "Примечание", "Кол-во", "Ед."]
+    assert serialize_rows(rows, header) == (
+        "стр|Наименование|Кол-во|Ед.\n"
+        "5|Воздуховод 200x100|12|м\n"
+        "6|Отвод 90 ø125|4|шт"
+    )
+
+
+def test_serialize_rows_cleans_cells():
+    rows = [(1, ["Клапан  КПУ|1Н\n200x200", "2"]), (2, ["Хомут", ""])]
+    assert serialize_rows(rows) == "1|Клапан КПУ/1Н 200x200|2\n2|Хомут"
+
+
+def test_compact_text_tab_table():
+    text = "Добрый день, посчитайте:\nВоздуховод 200x100\t12\tм\nОтвод 90 ø125\t4\tшт\nСпасибо"
+    compacted, tables = compact_text(text)
+    assert tables == 1
+    assert compacted == "Добрый день, посчитайте:\n2|Воздуховод 200x100|12|м\n3|Отвод 90 ø125|4|шт\nСпасибо"
+
+
+def test_compact_text_markdown_table():
+    text = "| Наименование | Кол-во |\n|---|---|\n| Хомут ø160 | 10 |"
+    compacted, tables = compact_text(text)
+    assert tables == 1
+    assert compacted == "1|Наименование|Кол-во\n3|Хомут ø160|10"
+
+
+def test_compact_text_single_line_is_not_a_table():
+    compacted, tables = compact_text("Воздуховод   200x100    12   м\nКонец  письма")
+    assert tables == 0
+    assert compacted == "Воздуховод|200x100|12|м\nКонец письма"
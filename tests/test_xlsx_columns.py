@@ -0,0 +1,94 @@
+from app.services import xlsx_columns
+from app.services.disk_cache import DiskLRUCache
+from app.services.xlsx_columns import (
+    NAME_FIELD,
+    QUANTITY_FIELD,
+    TYPE_COLUMN,
+    UNIT_FIELD,
+    detect_columns,
+    find_header,
+    map_row,
+    skip_row,
+)
+
+SPEC_HEADER = [
+    "Поз.",
+    "Наименование и техническая характеристика",
+    "Тип, марка, обозначение документа",
+    "Код",
+    "Завод-изготовитель",
+    "Единица измерения",
+    "Кол.",
+    "Масса ед., кг",
+    "Примечание",
+]
+
+
+def test_detects_specification_columns():
+    mapping = detect_columns(SPEC_HEADER)
+    assert mapping["columns"] == {NAME_FIELD: 1, TYPE_COLUMN: 2, UNIT_FIELD: 5, QUANTITY_FIELD: 6}
+
+
+def test_unit_from_quantity_header():
+    mapping = detect_columns(["№", "Наименование", "Кол-во, шт"])
+    assert mapping == {"columns": {NAME_FIELD: 1, QUANTITY_FIELD: 2}, "unit": "шт"}
+
+
+def test_header_without_quantity_is_not_recognized():
+    assert detect_columns(["Наименование", "Цена"])["columns"] is None
+
+
+def test_weak_synonym_only_without_strong_match():
+    mapping = detect_columns(["Товар", "Наименование", "Количество"])
+    assert mapping["columns"][NAME_FIELD] == 1
+
+
+def test_find_header_skips_title_rows_and_caches_only_header(tmp_path, monkeypatch):
+    cache = DiskLRUCache(str(tmp_path / "columns.sqlite3"), max_entries=100, name="test_columns")
+    monkeypatch.setattr(xlsx_columns, "column_mapping_cache", cache)
+    rows = [
+        (1, ["Заявка на материалы", "", ""]),
+        (2, ["Объект: школа", "", ""]),
+        (4, ["Наименование", "Ед. изм.", "Кол-во"]),
+        (5, ["Воздуховод 200x100", "м", "12"]),
+    ]
+    position, mapping = find_header(rows)
+    assert position == 2
+    assert mapping["columns"] == {NAME_FIELD: 0, UNIT_FIELD: 1, QUANTITY_FIELD: 2}
+    assert len(cache) == 1
+
+    assert find_header(rows) == (position, mapping)
+    assert len(cache) == 1
+
+
+def test_find_header_without_table():
+    assert find_header([(1, ["Текст письма"]), (2, ["Спасибо"])]) == (None, {"columns": None, "unit": None})
+
+
+def test_map_row_appends_type_to_name():
+    mapping = detect_columns(SPEC_HEADER)
+    cells = ["1", "Вентилятор радиальный", "ВР 80-75-4", "", "", "шт.", "2", "", ""]
+    assert map_row(cells, mapping) == {NAME_FIELD: "Вентилятор радиальный ВР 80-75-4", QUANTITY_FIELD: 2, UNIT_FIELD: "шт."}
+
+
+def test_map_row_does_not_repeat_type_or_placeholder():
+    mapping = detect_columns(SPEC_HEADER)
+    repeated = ["2", "Клапан КПУ-1Н 200x200", "КПУ-1Н", "", "", "шт", "4", "", ""]
+    placeholder = ["3", "Воздуховод ø160", "-", "", "", "м", "12,5", "", ""]
+    assert map_row(repeated, mapping)[NAME_FIELD] == "Клапан КПУ-1Н 200x200"
+    assert map_row(placeholder, mapping) == {NAME_FIELD: "Воздуховод ø160", QUANTITY_FIELD: 12.5, UNIT_FIELD: "м"}
+
+
+def test_map_row_unit_from_quantity_cell_and_rejects_text_quantity():
+    mapping = detect_columns(["Наименование", "Количество"])
+    assert map_row(["Хомут ø160", "10 шт"], mapping) == {NAME_FIELD: "Хомут ø160", QUANTITY_FIELD: 10, UNIT_FIELD: "шт"}
+    assert map_row(["Хомут ø160", "по месту"], mapping) is None
+    assert map_row(["Хомут ø160", "0"], mapping) is None
+
+
+def test_skip_row_totals_and_sections():
+    mapping = detect_columns(["Наименование", "Количество"])
+    assert skip_row(["Итого:", "125"], mapping) == "total"
+    assert skip_row(["", "3"], mapping) == "no_name"
+    assert skip_row(["Раздел 1. Вентиляция", ""], mapping) == "empty_quantity"
+    assert skip_row(["Хомут ø160", "10"], mapping) is None
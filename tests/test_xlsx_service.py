@@ -0,0 +1,75 @@
+import asyncio
+
+import openpyxl
+
+from app.services import xlsx_service
+from app.services.xlsx_service import XLSXService
+
+HEADER = ["Наименование", "Количество", "Ед.изм."]
+
+
+def write_sheet(path, rows):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Заявка"
+    sheet.append(HEADER)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+    return str(path)
+
+
+def extract(path):
+    return asyncio.run(XLSXService()._extract_sheet(path, "Заявка", lambda done, total: None))
+
+
+def test_rows_without_quantity_are_counted(tmp_path):
+    path = write_sheet(tmp_path / "order.xlsx", [
+        ["Раздел 1. Вентиляция", None, None],
+        ["Воздуховод 200x100", 12, "м"],
+        ["Отвод 90 ø125", None, "шт"],
+        ["Итого:", 12, None],
+    ])
+    products, stats = extract(path)
+    assert products == [{"Наименование": "Воздуховод 200x100", "Количество": 12, "Ед.изм.": "м"}]
+    assert stats["direct_rows"] == 1
+    assert stats["skipped_rows"] == 3
+    assert stats["empty_quantity_rows"] == 2
+
+
+class FakeLLM:
+    """Модель, которая возвращает товар на каждую строку батча с номером строки, в обратном порядке"""
+
+    model = "fake-model"
+
+    def __init__(self):
+        self.batches = []
+
+    async def chat_completion(self, messages, **kwargs):
+        lines = messages[0]["content"][-1]["text"].splitlines()[1:]
+        self.batches.append([int(line.split("|")[0]) for line in lines])
+        items = [
+            {"Наименование": line.split("|")[1], "Количество": 1, "Ед.изм.": "компл", "Строка": int(line.split("|")[0])}
+            for line in lines
+        ]
+        return {"text": "", "data": {"items": items[::-1]}}
+
+
+def test_direct_and_llm_rows_keep_sheet_order(tmp_path, monkeypatch):
+    fake = FakeLLM()
+    monkeypatch.setattr(xlsx_service, "llm", fake)
+    path = write_sheet(tmp_path / "order.xlsx", [
+        ["Клапан КПУ", "по месту", "шт"],
+        ["Воздуховод 200x100", 12, "м"],
+        ["Решетка 400x200", "по проекту", "шт"],
+        ["Отвод 90 ø125", 4, "шт"],
+        ["Хомут ø160", "по месту", "шт"],
+    ])
+    products, stats = extract(path)
+    # Строки для LLM ушли одним батчем, прямые строки стоят между ними
+    assert fake.batches == [[2, 4, 6]]
+    assert [product["Наименование"] for product in products] == [
+        "Клапан КПУ", "Воздуховод 200x100", "Решетка 400x200", "Отвод 90 ø125", "Хомут ø160",
+    ]
+    assert all("Строка" not in product for product in products)
+    assert stats["direct_rows"] == 2 and stats["llm_rows"] == 3